@@ -0,0 +1,184 @@
+# alloc_bench.py
+"""
+メインループの描画・検出経路のメモリ確保ベンチ（予算を超えたら終了コード 1）。
+
+  python alloc_bench.py                          # 既定の予算でチェック
+  python alloc_bench.py --budget-peak-kb 20000 --frames 300
+
+合成したマーカー入りフレームで main.py と同じ順に
+  detect → marker_info（描画込み）→ compose_side → fit
+を回し、ウォームアップ後の1フレームあたりの値を AllocTracker で測る。
+
+  peak : 区間ごとの一時確保の最高水位の合計（frame.copy / np.full / np.hstack などが効く）
+  net  : フレームをまたいで残った確保（増え続けるならリーク）
+
+--sim ならシミュレータ（drone_sim.py）のカメラでマーカーに寄っていく映像を使う
+（フレームごとに見え方が変わる。描画自体は計測の外）。
+
+テストランナーは無いので、描画・検出経路を触った変更はこれをゲートとして手で回す
+（src/ で。両方 0 で終われば通過、予算超過なら 1）:
+
+  python alloc_bench.py && python alloc_bench.py --sim
+"""
+import argparse
+import json
+import math
+import sys
+
+import cv2
+import numpy as np
+from cv2 import aruco
+
+from alloc_tracker import AllocTracker
+from aruco_detector import ArUcoDetector
+from drone_sim import MarkerScene
+from ui_components.display_manager import DisplayManager
+from ui_overlay import DroneUI
+
+
+# 予算（1フレームあたり）。描画経路の確保を増やす変更はここを見直すこと
+# 決めたときの実測（960x720、120 フレーム）: peak 約 8.4MB（ほぼ compose_side の 4.2MB のキャンバス 2 枚分）、
+# net 0.0KB（合成・--sim とも）。
+# peak は実測の約 2 倍: キャンバスのコピーがもう 1 枚増えるまでは通り、2 枚増えたら落ちる。
+# net は tracemalloc の細かい揺れ（dict・list の伸び縮み、数 KB）は通し、フレームごとに 16KB を超えて
+# 残るもの（960 幅の BGR で 6 行分以上など）は落とす。フル解像度のフレーム（約 2MB）が残れば桁違いで落ちる
+DEFAULT_BUDGET_PEAK_KB = 16 * 1024
+DEFAULT_BUDGET_NET_KB = 16
+
+
+def make_scene(w, h, marker_id=0, marker_px=200):
+    """灰色の背景の真ん中にマーカーを1枚置いた BGR フレーム"""
+    scene = np.full((h, w, 3), 160, dtype=np.uint8)
+    dictionary = aruco.getPredefinedDictionary(aruco.DICT_4X4_50)
+    marker = aruco.generateImageMarker(dictionary, marker_id, marker_px)
+    pad = marker_px // 5
+    tile = np.full((marker_px + 2 * pad, marker_px + 2 * pad), 255, dtype=np.uint8)
+    tile[pad:pad + marker_px, pad:pad + marker_px] = marker
+    y0 = (h - tile.shape[0]) // 2
+    x0 = (w - tile.shape[1]) // 2
+    scene[y0:y0 + tile.shape[0], x0:x0 + tile.shape[1]] = tile[:, :, None]
+    return scene
+
+
+def sim_path(scene, n):
+    """マーカーの正面 3m から 0.6m まで、左右に振れながら寄っていくカメラの位置と向き"""
+    m = scene.markers[0]
+    for i in range(n):
+        a = i / max(1, n - 1)
+        dist = 3.0 - 2.4 * a
+        pos = m.center + np.array([math.cos(m.facing), math.sin(m.facing), 0.0]) * dist
+        pos[2] -= 0.2
+        heading = m.facing + math.pi + 0.25 * math.sin(i * 0.2)
+        yield pos, heading
+
+
+def run(frames, warmup, frame_w, frame_h, display_w, display_h, ui_w, window_w, window_h, sim=False):
+    if sim:
+        sim_scene = MarkerScene(width=frame_w, height=frame_h)
+        path = sim_path(sim_scene, warmup + frames)
+        scene = np.empty((frame_h, frame_w, 3), dtype=np.uint8)
+    else:
+        scene = make_scene(frame_w, frame_h)
+    frame = np.empty_like(scene)   # VideoStream のプールのバッファの代わり
+    detector = ArUcoDetector()
+    ui = DroneUI(panel_width=ui_w, bottom_margin=60)
+    tracker = AllocTracker().start()
+
+    hits = 0
+    for i in range(warmup + frames):
+        if i == warmup:
+            tracker.reset()
+        if sim:
+            pos, heading = next(path)
+            sim_scene.render(pos, heading, out=scene)
+        tracker.begin_frame()
+
+        with tracker.stage("capture"):
+            np.copyto(frame, scene)
+
+        with tracker.stage("detect"):
+            corners, ids = detector.detect(frame)
+
+        with tracker.stage("marker_info"):
+            marker_info = detector.get_marker_info(ids, corners)
+            if ids is not None and len(ids) > 0:
+                aruco.drawDetectedMarkers(frame, corners, ids)
+            if marker_info is not None:
+                cx, cy = marker_info["center"]
+                cv2.circle(frame, (int(cx), int(cy)), 6, (0, 255, 255), -1, cv2.LINE_AA)
+
+        with tracker.stage("compose_side"):
+            out = ui.compose_side(
+                frame,
+                display_w=display_w,
+                display_h=display_h,
+                ui_w=ui_w,
+                ui_bg=(0, 0, 0),
+                battery=80, roll=0, pitch=0, yaw=10, height=100, speed=0,
+                agx=0, agy=0, agz=-1000, aruno=0, aruno_last=0, temp=60, flight_time=12,
+                pos_xy=(0.0, 1.0), pos_range=(25.0, 35.0),
+                approach_enabled=True, approach_state="ALIGN",
+            )
+
+        with tracker.stage("fit"):
+            if out.shape[1] != window_w or out.shape[0] != window_h:
+                out = DisplayManager.fit_exact_black(out, window_w, window_h)
+
+        if marker_info is not None:
+            hits += 1
+        del out
+        tracker.end_frame()
+
+    report = tracker.report()
+    summary = tracker.summary()
+    tracker.stop()
+    return report, summary, hits
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Allocation budget check for the render/detect path")
+    ap.add_argument("--frames", type=int, default=120)
+    ap.add_argument("--warmup", type=int, default=20)
+    ap.add_argument("--frame", default="960x720", help="入力フレーム WxH")
+    ap.add_argument("--display", default="1600x900", help="compose_side の出力 WxH")
+    ap.add_argument("--window", default=None, help="ウィンドウ WxH（既定は --display と同じ）")
+    ap.add_argument("--ui-w", type=int, default=352)
+    ap.add_argument("--sim", action="store_true", help="シミュレータのカメラ映像を使う")
+    ap.add_argument("--budget-peak-kb", type=float, default=DEFAULT_BUDGET_PEAK_KB)
+    ap.add_argument("--budget-net-kb", type=float, default=DEFAULT_BUDGET_NET_KB)
+    ap.add_argument("--json", metavar="FILE", default=None, help="結果を JSON でも書く")
+    args = ap.parse_args()
+
+    fw, fh = (int(v) for v in args.frame.split("x"))
+    dw, dh = (int(v) for v in args.display.split("x"))
+    ww, wh = (int(v) for v in (args.window or args.display).split("x"))
+
+    report, summary, hits = run(args.frames, args.warmup, fw, fh, dw, dh, args.ui_w, ww, wh, sim=args.sim)
+    print(summary)
+    if hits == 0:
+        print("[ALLOC] marker was never detected; the detect path was not exercised")
+        return 2
+
+    per_frame = report["frame"]
+    peak_kb = per_frame["peak"] / 1024
+    net_kb = per_frame["net_bytes"] / 1024
+    failed = []
+    if peak_kb > args.budget_peak_kb:
+        failed.append(f"peak {peak_kb:.0f} KB > budget {args.budget_peak_kb:.0f} KB")
+    if net_kb > args.budget_net_kb:
+        failed.append(f"net {net_kb:.1f} KB > budget {args.budget_net_kb:.1f} KB")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"report": report, "failed": failed}, f, indent=2)
+
+    if failed:
+        for msg in failed:
+            print("[ALLOC] OVER BUDGET:", msg)
+        return 1
+    print(f"[ALLOC] ok: peak {peak_kb:.0f}/{args.budget_peak_kb:.0f} KB, net {net_kb:.1f}/{args.budget_net_kb:.1f} KB per frame")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
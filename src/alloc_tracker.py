@@ -0,0 +1,186 @@
+# alloc_tracker.py
+"""
+ループの区間ごとのメモリ確保の計測（任意、デバッグ用）。tracemalloc を使う。
+
+  tracker = AllocTracker().start()
+  tracker.begin_frame()
+  with tracker.stage("compose_side"):
+      out = ui.compose_side(...)
+  tracker.end_frame()
+  print(tracker.summary())
+
+区間ごとに:
+  peak   : 区間中の確保量の最高水位（区間の開始時点からの増分）。区間内で確保して
+           すぐ捨てた一時配列もここに出る
+  net    : 区間の終わりまで残った確保（バイト / ブロック数）
+  numpy  : net のうち NumPy の配列データ（tracemalloc の NumPy ドメイン）のバイト数
+フレーム全体（begin_frame → end_frame）でも net を取る。これが増え続けるならリーク。
+
+OpenCV が C++ 側で確保する作業領域は見えない（Python に返ってくる配列だけ数える）。
+
+tracemalloc は生きている確保しか追わないので、「区間内で何回確保したか」は数えられない。
+一時配列の量は peak で見る。区間は入れ子にしないこと（peak のリセットが干渉する）。
+計測自体が重い（区間ごとにスナップショットを取る）ので、普段のループでは使わない。
+"""
+import tracemalloc
+
+import numpy as np
+
+
+NUMPY_DOMAIN = np.lib.tracemalloc_domain
+
+# 計測用のスナップショット自体の確保は数えない
+_IGNORE = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+)
+
+
+def _kb(v):
+    return f"{v / 1024:.1f}"
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class StageAllocs:
+    """1区間分の累積（フレーム数で割って1フレームあたりにする）"""
+
+    __slots__ = ("calls", "peak_sum", "peak_max", "net_bytes", "net_blocks", "numpy_bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.peak_sum = 0
+        self.peak_max = 0
+        self.net_bytes = 0
+        self.net_blocks = 0
+        self.numpy_bytes = 0
+
+
+class _Stage:
+    __slots__ = ("tracker", "name", "snap0", "cur0")
+
+    def __init__(self, tracker, name):
+        self.tracker = tracker
+        self.name = name
+
+    def __enter__(self):
+        self.snap0 = tracemalloc.take_snapshot().filter_traces(_IGNORE)
+        tracemalloc.reset_peak()
+        self.cur0 = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        cur1, peak = tracemalloc.get_traced_memory()
+        snap1 = tracemalloc.take_snapshot().filter_traces(_IGNORE)
+        self.tracker._record(self.name, peak - self.cur0, cur1 - self.cur0, self.snap0, snap1)
+        return False
+
+
+class AllocTracker:
+    def __init__(self, nframe=1):
+        self.nframe = nframe
+        self.enabled = False
+        self.stages = {}
+        self.frames = 0
+        self.frame_net = 0
+        self._frame_cur0 = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.nframe)
+        self.enabled = True
+        return self
+
+    def stop(self):
+        self.enabled = False
+        tracemalloc.stop()
+
+    def reset(self):
+        """ウォームアップ後に呼んで、steady state だけを数える"""
+        self.stages = {}
+        self.frames = 0
+        self.frame_net = 0
+        self._frame_cur0 = None
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def begin_frame(self):
+        if self.enabled:
+            self._frame_cur0 = tracemalloc.get_traced_memory()[0]
+
+    def end_frame(self):
+        if self.enabled:
+            self.frames += 1
+            if self._frame_cur0 is not None:
+                self.frame_net += tracemalloc.get_traced_memory()[0] - self._frame_cur0
+                self._frame_cur0 = None
+
+    def _record(self, name, peak, net, snap0, snap1):
+        st = self.stages.get(name)
+        if st is None:
+            st = self.stages[name] = StageAllocs()
+        st.calls += 1
+        st.peak_sum += max(0, peak)
+        st.peak_max = max(st.peak_max, peak)
+        st.net_bytes += net
+        st.net_blocks += sum(d.count_diff for d in snap1.compare_to(snap0, "traceback"))
+        dom = (tracemalloc.DomainFilter(True, NUMPY_DOMAIN),)
+        np0 = sum(t.size for t in snap0.filter_traces(dom).traces)
+        np1 = sum(t.size for t in snap1.filter_traces(dom).traces)
+        st.numpy_bytes += np1 - np0
+
+    # -----------------------
+    # report
+    # -----------------------
+    def report(self):
+        """
+        {stage: {...}} の1フレームあたりの値と "frame"（peak は区間の合計、
+        net_bytes は begin_frame → end_frame の残り）
+        """
+        n = max(1, self.frames)
+        out = {}
+        total = {"peak": 0.0, "net_blocks": 0.0, "numpy_bytes": 0.0}
+        for name, st in self.stages.items():
+            row = {
+                "calls": st.calls,
+                "peak": st.peak_sum / n,
+                "peak_max": st.peak_max,
+                "net_bytes": st.net_bytes / n,
+                "net_blocks": st.net_blocks / n,
+                "numpy_bytes": st.numpy_bytes / n,
+            }
+            out[name] = row
+            for k in total:
+                total[k] += row[k]
+        total["net_bytes"] = self.frame_net / n
+        total["frames"] = self.frames
+        out["frame"] = total
+        return out
+
+    def summary(self):
+        rows = self.report()
+        lines = [f"{'stage':16s} {'peak KB':>10s} {'max KB':>10s} {'net KB':>9s} {'blocks':>8s} {'numpy KB':>9s}"]
+        for name, r in rows.items():
+            if name == "frame":
+                continue
+            lines.append(f"{name:16s} {_kb(r['peak']):>10s} {_kb(r['peak_max']):>10s} "
+                         f"{_kb(r['net_bytes']):>9s} {r['net_blocks']:8.1f} {_kb(r['numpy_bytes']):>9s}")
+        f = rows["frame"]
+        lines.append(f"{'per frame':16s} {_kb(f['peak']):>10s} {'':>10s} "
+                     f"{_kb(f['net_bytes']):>9s} {f['net_blocks']:8.1f} {_kb(f['numpy_bytes']):>9s}"
+                     f"   ({f['frames']} frames)")
+        return "\n".join(lines)
@@ -0,0 +1,59 @@
+# approach_config.py
+"""
+セミオートの「よく調整する数値」（PID のゲインと距離スケジュール）をここに集約。
+TelloController は起動時に load() の結果を使う。飛ばしながら試すときは JSON で上書きできる:
+
+  python main.py --approach-config tune.json
+  tune.json: {"pid": {"yaw": {"kd": 0.05}}, "schedule": {"fb": [[0.5, 0.5], [2.0, 1.0]]}}
+
+err の単位:
+  yaw : 横のずれ [px]（+右）      fb : target_size_px - size_px [px]（+遠い）
+  ud  : 縦のずれ [px]（+下、符号は controller 側で反転）
+  lr  : マーカーを斜めから見ている角度 [deg]
+"""
+import copy
+import json
+
+# ===== 軸ごとの PID =====
+# out_max は RC の値の上限、i_max は積分項の上限（どちらも RC の単位）、d_tau は微分のローパス [s]
+PID = {
+    "yaw": {"kp": 0.35, "ki": 0.02, "kd": 0.08, "out_max": 60, "i_max": 10, "d_tau": 0.15},
+    "fb": {"kp": 0.25, "ki": 0.0, "kd": 0.02, "out_max": 35, "i_max": 10, "d_tau": 0.2},
+    "ud": {"kp": 0.2, "ki": 0.02, "kd": 0.0, "out_max": 30, "i_max": 10, "d_tau": 0.2},
+    "lr": {"kp": 0.8, "ki": 0.0, "kd": 0.05, "out_max": 30, "i_max": 10, "d_tau": 0.3},
+}
+
+# ===== 距離 [m] → ゲインの倍率（間は線形補間、範囲外は端の値）=====
+# 近いほどマーカーが大きく、同じ動きでも size や見る角度が大きく変わるので弱める
+SCHEDULE = {
+    "yaw": ((0.5, 0.8), (1.5, 1.0)),
+    "fb": ((0.5, 0.6), (1.5, 1.0), (3.0, 1.3)),
+    "ud": ((0.5, 0.7), (1.5, 1.0)),
+    "lr": ((0.5, 0.6), (1.5, 1.0), (3.0, 1.2)),
+}
+
+# 距離の推定用（ピンホール: 距離 = 一辺 * 焦点距離[px] / size_px）
+MARKER_SIZE_M = 0.2
+
+# yaw モードで中心がずれている間の前進の倍率
+OFFCENTER_FB_SCALE = 0.55
+
+
+def load(path=None):
+    """既定値のコピーを返す。path（JSON）があれば pid / schedule / その他のキーを上書きする"""
+    cfg = {
+        "pid": copy.deepcopy(PID),
+        "schedule": copy.deepcopy(SCHEDULE),
+        "marker_size_m": MARKER_SIZE_M,
+        "offcenter_fb_scale": OFFCENTER_FB_SCALE,
+    }
+    if path is None:
+        return cfg
+    with open(path, encoding="utf-8") as f:
+        override = json.load(f)
+    for axis, params in override.pop("pid", {}).items():
+        cfg["pid"].setdefault(axis, {}).update(params)
+    for axis, table in override.pop("schedule", {}).items():
+        cfg["schedule"][axis] = tuple(tuple(p) for p in table)
+    cfg.update(override)
+    return cfg
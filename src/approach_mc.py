@@ -0,0 +1,257 @@
+# approach_mc.py
+"""
+セミオートのモンテカルロ評価（初期条件・ノイズ・遅延をばらつかせて何千回も寄らせる）。
+
+  python approach_mc.py                          # yaw モード 1000 回
+  python approach_mc.py --mode servo -n 4000 --workers 8 --latency 0.05:0.5 --json mc.json
+
+1回分:
+  - 機体は原点・高さ 1m・x 軸向きでホバリングから開始。マーカーは距離 distance・方位 bearing
+    （正なら右）・高さのずれ height の位置に、機体の方を向く向きから facing だけ回して置く
+  - 動きは drone_sim.SimDynamics（速度・yaw の1次遅れ）、見え方は MarkerScene.marker_uv（ピンホール）
+  - 制御ループは loop_hz で回し、latency 秒前の位置から見たマーカーの4隅に noise [px] を足して
+    marker_info にする（drop の確率で検出失敗、小さすぎても検出失敗）
+  - 本物の TelloController.update_approach_from_aruco → update_motion に渡す
+    （clock / perf_clock を模擬時刻にするので遅延補償・見失い停止・収束判定もそのまま効く）
+
+結果（1回ごと）:
+  hold        : HOLD に収束した（time_to_hold は approach_converge_sec）
+  lost        : lost_abort 秒マーカーが見えないまま（画像の外に出た・裏に回った）
+  oscillation : 収束せず、後半で yaw が何度も左右に振れている
+  too_close   : 収束せず、マーカーに min_dist より近づいた
+  timeout     : 上のどれでもなく timeout 秒で収束しなかった
+集計は成功率・収束時間の p50/p90・失敗の内訳と、遅延 × 方位ずれごとの成功率の表。
+
+各回は独立なのでプロセスプールで並列に回す（--workers 1 ならこのプロセスで順に）。
+乱数は (seed, 番号) から作るので、同じ seed なら workers の数によらず同じ結果。
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+import approach_config
+from drone_sim import MarkerScene, SimDynamics, SimMarker
+from session_replay import FakeTello, ReplayClock, ReplayKeyboardState
+from tello_controller import TelloController
+
+
+OUTCOMES = ("hold", "lost", "oscillation", "too_close", "timeout")
+PHYSICS_DT = 0.01
+START_HEIGHT = 1.0
+MIN_DETECT_PX = 12.0    # これより小さいマーカーは検出できないとみなす
+
+# ワーカープロセスごとに1つ（initializer で作る）
+_scene = None
+_opts = None
+
+
+def _init_worker(opts):
+    global _scene, _opts
+    _scene = MarkerScene(width=960, height=720)
+    _opts = opts
+
+
+def parse_range(text):
+    """"a:b" → (a, b)、"a" → (a, a)"""
+    a, _, b = text.partition(":")
+    return float(a), float(b or a)
+
+
+def make_scenarios(n, seed, ranges):
+    """ranges（{名前: (lo, hi)}）の一様分布で作った初期条件のリスト"""
+    rng = np.random.default_rng(seed)
+    cols = {name: rng.uniform(lo, hi, n) for name, (lo, hi) in ranges.items()}
+    return [dict({k: float(v[i]) for k, v in cols.items()}, index=i, seed=seed) for i in range(n)]
+
+
+def _observe(scene, marker, pos, heading, sc, rng):
+    uv = scene.marker_uv(pos, heading, marker)
+    if uv is None or rng.random() < sc["drop"]:
+        return None
+    uv = uv + rng.normal(0.0, sc["noise"], uv.shape)
+    size_px = float(np.mean(np.linalg.norm(uv - np.roll(uv, -1, axis=0), axis=1)))
+    if size_px < MIN_DETECT_PX:
+        return None
+    cx, cy = uv.mean(axis=0)
+    return {"id": marker.id, "center": (float(cx), float(cy)), "size_px": size_px, "corners": uv}
+
+
+def run_scenario(sc, scene=None, opts=None):
+    """1回分を回して結果の dict を返す"""
+    scene = scene if scene is not None else _scene
+    opts = opts if opts is not None else _opts
+    rng = np.random.default_rng([sc["seed"], sc["index"]])
+
+    b = math.radians(sc["bearing"])
+    d = sc["distance"]
+    center = (d * math.cos(b), -d * math.sin(b), START_HEIGHT + sc["height"])
+    # 機体の方を向く向き + facing
+    facing = math.atan2(-center[1], -center[0]) + math.radians(sc["facing"])
+    marker = SimMarker(0, center, facing=facing)
+
+    clock = ReplayClock()
+    c = TelloController(ReplayKeyboardState(), tello=FakeTello(clock), clock=clock)
+    c.perf_clock = clock
+    c.configure_approach(opts["config"])
+    c.approach_mode = opts["mode"]
+    c.in_flight = True
+    dyn = SimDynamics(pos=(0.0, 0.0, START_HEIGHT))
+    dyn.flying = True
+
+    shape = (scene.height, scene.width, 3)
+    dt_loop = 1.0 / opts["loop_hz"]
+    substeps = max(1, int(round(dt_loop / PHYSICS_DT)))
+    lat_steps = int(round(sc["latency"] / PHYSICS_DT))
+    trail = [(dyn.pos.copy(), dyn.heading)]     # 物理の1ステップごとの (位置, 向き)
+    yaws = []
+    last_seen = 0.0
+    min_dist = d
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        c.set_approach(True)
+        t = 0.0
+        while t < opts["timeout"]:
+            pos, heading = trail[max(0, len(trail) - 1 - lat_steps)]
+            info = _observe(scene, marker, pos, heading, sc, rng)
+            if info is not None:
+                last_seen = t
+            c.update_approach_from_aruco(info, shape, capture_ts=t - sc["latency"] if info else None)
+            c.update_motion()
+            dyn.set_rc(*c.last_rc)
+            yaws.append(c.last_rc[3])
+            for _ in range(substeps):
+                dyn.step(PHYSICS_DT)
+                trail.append((dyn.pos.copy(), dyn.heading))
+            t += substeps * PHYSICS_DT
+            clock.t = t
+            min_dist = min(min_dist, float(np.linalg.norm(marker.center[:2] - dyn.pos[:2])))
+            if c.approach_converge_sec is not None or t - last_seen > opts["lost_abort"]:
+                break
+
+    if c.approach_converge_sec is not None:
+        outcome = "hold"
+    elif t - last_seen > opts["lost_abort"]:
+        outcome = "lost"
+    else:
+        tail = np.sign([y for y in yaws[len(yaws) // 2:] if abs(y) >= 5])
+        flips = int(np.count_nonzero(np.diff(tail))) if tail.size > 1 else 0
+        if flips >= opts["osc_flips"]:
+            outcome = "oscillation"
+        elif min_dist < opts["min_dist"]:
+            outcome = "too_close"
+        else:
+            outcome = "timeout"
+    return dict(sc, outcome=outcome, time_to_hold=c.approach_converge_sec, sim_sec=t,
+                min_dist=min_dist, final_dist=float(np.linalg.norm(marker.center[:2] - dyn.pos[:2])))
+
+
+def summarize(rows, lat_bins=(0.0, 0.1, 0.2, 0.3, 0.5, 1.0), bearing_bins=(0, 10, 20, 30, 40)):
+    n = len(rows)
+    outcome = np.array([r["outcome"] for r in rows])
+    hold = outcome == "hold"
+    tth = np.array([r["time_to_hold"] for r in rows if r["time_to_hold"] is not None])
+    lat = np.array([r["latency"] for r in rows])
+    bear = np.abs(np.array([r["bearing"] for r in rows]))
+
+    # 遅延 × 方位ずれのビンごとの成功率（回数が 0 のビンは None）
+    li = np.digitize(lat, lat_bins) - 1
+    bi = np.digitize(bear, bearing_bins) - 1
+    envelope = []
+    for i in range(len(lat_bins) - 1):
+        row = []
+        for j in range(len(bearing_bins) - 1):
+            m = (li == i) & (bi == j)
+            row.append(float(hold[m].mean()) if m.any() else None)
+        envelope.append(row)
+    return {
+        "scenarios": n,
+        "success_rate": float(hold.mean()) if n else 0.0,
+        "time_to_hold_p50": float(np.percentile(tth, 50)) if tth.size else None,
+        "time_to_hold_p90": float(np.percentile(tth, 90)) if tth.size else None,
+        "outcomes": {k: int(np.count_nonzero(outcome == k)) for k in OUTCOMES},
+        "latency_bins": list(lat_bins),
+        "bearing_bins": list(bearing_bins),
+        "envelope": envelope,
+    }
+
+
+def print_summary(s, mode, elapsed):
+    n = max(1, s["scenarios"])
+    sec = lambda v: "--" if v is None else f"{v:.1f}"
+    print(f"[MC] mode:{mode} scenarios:{s['scenarios']}  {elapsed:.1f}s")
+    print(f"[MC] success {s['success_rate']:.1%}  time to HOLD p50/p90: "
+          f"{sec(s['time_to_hold_p50'])}/{sec(s['time_to_hold_p90'])}s")
+    print("[MC] outcomes: " + "  ".join(f"{k} {v / n:.1%}" for k, v in s["outcomes"].items()))
+    lb, bb = s["latency_bins"], s["bearing_bins"]
+    print("[MC] success by latency [s] x |bearing| [deg]")
+    print("     latency      " + "".join(f"{f'{bb[j]}-{bb[j + 1]}':>8}" for j in range(len(bb) - 1)))
+    for i, row in enumerate(s["envelope"]):
+        cells = "".join(f"{'--' if v is None else f'{v:.0%}':>8}" for v in row)
+        print(f"     {lb[i]:.2f}-{lb[i + 1]:.2f}  {cells}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Monte Carlo evaluation of the approach controller")
+    ap.add_argument("-n", type=int, default=1000, help="回数")
+    ap.add_argument("--mode", choices=("yaw", "servo"), default="yaw")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--approach-config", metavar="FILE", default=None)
+    ap.add_argument("--loop-hz", type=float, default=15.0, help="制御ループの周期（検出込みの実効値）")
+    ap.add_argument("--timeout", type=float, default=30.0, help="1回の上限 [s]（模擬時刻）")
+    ap.add_argument("--lost-abort", type=float, default=3.0, help="この秒数見えなければ lost で打ち切る")
+    ap.add_argument("--min-dist", type=float, default=0.3, help="これより近づいたら too_close [m]")
+    ap.add_argument("--osc-flips", type=int, default=8, help="後半の yaw の符号反転がこれ以上なら oscillation")
+    # 初期条件とノイズ（"a:b" の一様分布）
+    ap.add_argument("--distance", default="1.0:4.0", help="[m]")
+    ap.add_argument("--bearing", default="-30:30", help="マーカーの方位 [deg]（正なら右）")
+    ap.add_argument("--height", default="-0.4:0.4", help="マーカーの高さのずれ [m]")
+    ap.add_argument("--facing", default="-30:30", help="マーカーの向きのずれ [deg]")
+    ap.add_argument("--noise", default="0:2", help="4隅の位置のノイズ（標準偏差）[px]")
+    ap.add_argument("--latency", default="0.05:0.4", help="撮影から制御までの遅延 [s]")
+    ap.add_argument("--drop", default="0:0.2", help="検出に失敗する確率")
+    ap.add_argument("--json", metavar="FILE", default=None, help="集計と1回ごとの結果を書く")
+    args = ap.parse_args()
+
+    ranges = {name: parse_range(getattr(args, name))
+              for name in ("distance", "bearing", "height", "facing", "noise", "latency", "drop")}
+    scenarios = make_scenarios(args.n, args.seed, ranges)
+    opts = {
+        "mode": args.mode,
+        "config": approach_config.load(args.approach_config),
+        "loop_hz": args.loop_hz,
+        "timeout": args.timeout,
+        "lost_abort": args.lost_abort,
+        "min_dist": args.min_dist,
+        "osc_flips": args.osc_flips,
+    }
+
+    t0 = time.perf_counter()
+    if args.workers <= 1:
+        _init_worker(opts)
+        rows = [run_scenario(sc) for sc in scenarios]
+    else:
+        with Pool(args.workers, initializer=_init_worker, initargs=(opts,)) as pool:
+            rows = pool.map(run_scenario, scenarios, chunksize=max(1, args.n // (args.workers * 8)))
+    elapsed = time.perf_counter() - t0
+
+    summary = summarize(rows)
+    print_summary(summary, args.mode, elapsed)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "ranges": ranges, "opts": {k: v for k, v in opts.items()
+                                                                      if k != "config"},
+                       "runs": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
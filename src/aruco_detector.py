@@ -126,7 +126,29 @@ class ArUcoDetector:
                             cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
 
         return frame, ids, corners
-    
+
+    def detect(self, frame):
+        """
+        メインループ用の検出（BGR → 見つからなければ GRAY で再試行）。
+        main.py とリプレイ（session_replay.py）で同じ経路を通すためにここへ集約。
+
+        Returns:
+            corners, ids（見つからなければ ids は None）
+        """
+        def _run_detect(src):
+            try:
+                return aruco.detectMarkers(src, self.dictionary, parameters=self.parameters)
+            except AttributeError:
+                if self.detector is not None:
+                    return self.detector.detectMarkers(src)
+                return (None, None, None)
+
+        c, i, _ = _run_detect(frame)
+        if i is None or len(i) == 0:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            c, i, _ = _run_detect(gray)
+        return c, i
+
     def get_marker_info(self, ids, corners, target_id=None):
         """
         ids/corners から「追従対象の1枚」を選んで
@@ -0,0 +1,252 @@
+# batch_analyzer.py
+"""
+たくさんのフライト動画をまとめて解析する（本番と同じ ArUcoDetector.detect を使う）。
+
+  python batch_analyzer.py VIDEO_DIR --out OUT_DIR [--workers 8] [--chunk 300]
+
+- 動画はフレーム数 chunk ごとのタスクに分けてプロセスプールで並列処理する
+- 終わったチャンクから OUT_DIR/<clip>.chunks/<start>.npz に書く（途中で止めても
+  次回はできているチャンクを飛ばして続きから）
+- 1本分そろったら OUT_DIR/<clip>.npz（列指向）と <clip>.summary.json にまとめる
+
+<clip>.npz の列:
+  frame_idx, frame_t, frame_n        : フレームごと（t は秒、n は検出数）
+  det_frame, det_t, det_id, det_cx, det_cy, det_size : 検出1件ごと
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import time
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+from aruco_detector import ArUcoDetector
+
+
+VIDEO_EXTS = (".mp4", ".avi", ".mov", ".mkv")
+CHUNK_RE = re.compile(r"^(\d+)\.npz$")   # チャンクファイル名（<start>.npz）。書きかけの .part は含まない
+
+# ワーカープロセスごとに1つ（initializer で作る）
+_detector = None
+
+
+def _init_worker():
+    global _detector
+    # OpenCV 内部のスレッドとプロセス並列が喧嘩しないように1スレッドに
+    cv2.setNumThreads(1)
+    _detector = ArUcoDetector()
+
+
+def find_videos(root):
+    paths = []
+    for ext in VIDEO_EXTS:
+        paths.extend(glob.glob(os.path.join(root, "**", "*" + ext), recursive=True))
+    return sorted(set(paths))
+
+
+def clip_name(root, path):
+    """OUT_DIR 内で一意になる名前（session_xxx/video.avi → session_xxx__video）"""
+    rel = os.path.relpath(path, root)
+    return os.path.splitext(rel)[0].replace(os.sep, "__")
+
+
+def video_info(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = float(cap.get(cv2.CAP_PROP_FPS)) or 30.0
+    finally:
+        cap.release()
+    return n, fps
+
+
+def _save_npz_atomic(path, **cols):
+    """<name>.part に書いてから置き換える（途中で止まってもチャンクとしては拾われない名前）"""
+    tmp = os.path.splitext(path)[0] + ".part"
+    with open(tmp, "wb") as f:
+        np.savez(f, **cols)     # ファイルオブジェクトに書けば .npz は付かない
+    os.replace(tmp, path)
+
+
+def analyze_chunk(task):
+    """
+    ワーカーで実行。[start, end) のフレームを検出してチャンクファイルに書く。
+    戻り値: (clip, start, 処理フレーム数)
+    """
+    clip, path, start, end, fps, chunk_path = task
+    cap = cv2.VideoCapture(path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    frame_idx, frame_n = [], []
+    det_frame, det_id, det_cx, det_cy, det_size = [], [], [], [], []
+
+    i = start
+    try:
+        while i < end:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            corners, ids = _detector.detect(frame)
+            n = 0 if ids is None else len(ids)
+            frame_idx.append(i)
+            frame_n.append(n)
+            for k in range(n):
+                # 同じ ID が2枚あっても1枚ずつ（target_id で選ぶと最初の1枚ばかりになる）
+                info = _detector.get_marker_info(ids[k:k + 1], corners[k:k + 1])
+                det_frame.append(i)
+                det_id.append(info["id"])
+                det_cx.append(info["center"][0])
+                det_cy.append(info["center"][1])
+                det_size.append(info["size_px"])
+            i += 1
+    finally:
+        cap.release()
+
+    frame_idx = np.asarray(frame_idx, dtype=np.int32)
+    det_frame = np.asarray(det_frame, dtype=np.int32)
+    _save_npz_atomic(
+        chunk_path,
+        frame_idx=frame_idx,
+        frame_t=frame_idx / fps,
+        frame_n=np.asarray(frame_n, dtype=np.int16),
+        det_frame=det_frame,
+        det_t=det_frame / fps,
+        det_id=np.asarray(det_id, dtype=np.int16),
+        det_cx=np.asarray(det_cx, dtype=np.float32),
+        det_cy=np.asarray(det_cy, dtype=np.float32),
+        det_size=np.asarray(det_size, dtype=np.float32),
+    )
+    return clip, start, len(frame_idx)
+
+
+def merge_chunks(chunk_dir, out_path):
+    """チャンクを開始フレーム順につなげて1本の列指向ファイルにする"""
+    starts = sorted(int(m.group(1)) for m in map(CHUNK_RE.match, os.listdir(chunk_dir)) if m)
+    parts = [np.load(os.path.join(chunk_dir, f"{s}.npz")) for s in starts]
+    cols = {}
+    for key in parts[0].files:
+        cols[key] = np.concatenate([p[key] for p in parts])
+    _save_npz_atomic(out_path, **cols)
+    return cols
+
+
+def summarize(cols, fps, gap_min_sec=0.2):
+    """
+    マーカーの見え方の統計。
+      visibility : マーカーごとの「見えていたフレームの割合」
+      gaps       : 何も見えていない区間（gap_min_sec 以上）の一覧と最大長
+      size       : マーカーごとの size_px の min/median/max
+    """
+    n_frames = int(cols["frame_idx"].shape[0])
+    seen_any = cols["frame_n"] > 0
+
+    # 見えていない区間（連続する False の長さ）
+    gaps = []
+    if n_frames:
+        padded = np.concatenate([[True], seen_any, [True]])
+        edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+        for a, b in zip(edges[0::2], edges[1::2]):
+            sec = (b - a) / fps
+            if sec >= gap_min_sec:
+                gaps.append({"start_t": float(cols["frame_t"][a]), "sec": round(float(sec), 3)})
+
+    markers = {}
+    for mid in np.unique(cols["det_id"]).tolist():
+        m = cols["det_id"] == mid
+        sizes = cols["det_size"][m]
+        markers[str(mid)] = {
+            "visibility": float(np.unique(cols["det_frame"][m]).size / max(1, n_frames)),
+            "size_min": float(sizes.min()),
+            "size_median": float(np.median(sizes)),
+            "size_max": float(sizes.max()),
+        }
+
+    return {
+        "frames": n_frames,
+        "duration_sec": n_frames / fps,
+        "any_visibility": float(seen_any.mean()) if n_frames else 0.0,
+        "gap_count": len(gaps),
+        "gap_max_sec": max((g["sec"] for g in gaps), default=0.0),
+        "gaps": gaps,
+        "markers": markers,
+    }
+
+
+def build_tasks(root, out_dir, chunk):
+    """未処理のチャンクだけタスクにする（再開用）。clips は {clip: (n_chunks, fps)}"""
+    tasks, clips = [], {}
+    for path in find_videos(root):
+        clip = clip_name(root, path)
+        if os.path.exists(os.path.join(out_dir, clip + ".summary.json")):
+            continue  # もう全部終わっている
+        n, fps = video_info(path)
+        if n <= 0:
+            print(f"[SKIP] {path}: frame count unknown")
+            continue
+        chunk_dir = os.path.join(out_dir, clip + ".chunks")
+        os.makedirs(chunk_dir, exist_ok=True)
+        # 前回止まったワーカーの書きかけ（古い版の <start>.npz.tmp.npz も）を消す
+        for stale in glob.glob(os.path.join(chunk_dir, "*.part")) + \
+                glob.glob(os.path.join(chunk_dir, "*.tmp.npz")):
+            os.remove(stale)
+        starts = list(range(0, n, chunk))
+        clips[clip] = (len(starts), fps)
+        for s in starts:
+            cp = os.path.join(chunk_dir, f"{s}.npz")
+            if not os.path.exists(cp):
+                tasks.append((clip, path, s, min(n, s + chunk), fps, cp))
+    return tasks, clips
+
+
+def finish_clip(out_dir, clip, fps):
+    cols = merge_chunks(os.path.join(out_dir, clip + ".chunks"), os.path.join(out_dir, clip + ".npz"))
+    summary = summarize(cols, fps)
+    tmp = os.path.join(out_dir, clip + ".summary.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp, os.path.join(out_dir, clip + ".summary.json"))
+    print(f"[DONE] {clip}: frames={summary['frames']} visible={summary['any_visibility']:.0%} "
+          f"gaps={summary['gap_count']} max_gap={summary['gap_max_sec']:.1f}s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Batch ArUco analysis over flight videos")
+    ap.add_argument("video_dir")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunk", type=int, default=300, help="1タスクあたりのフレーム数")
+    args = ap.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    tasks, clips = build_tasks(args.video_dir, args.out, args.chunk)
+
+    # 各クリップの残りチャンク数
+    remaining = {clip: 0 for clip in clips}
+    for t in tasks:
+        remaining[t[0]] += 1
+    # 前回チャンクは全部できていてまとめだけ残っているもの
+    for clip, (_, fps) in clips.items():
+        if remaining[clip] == 0:
+            finish_clip(args.out, clip, fps)
+
+    print(f"[BATCH] clips={len(clips)} tasks={len(tasks)} workers={args.workers}")
+    t0 = time.perf_counter()
+    total = 0
+    with Pool(args.workers, initializer=_init_worker) as pool:
+        for clip, start, n in pool.imap_unordered(analyze_chunk, tasks):
+            total += n
+            remaining[clip] -= 1
+            if remaining[clip] == 0:
+                finish_clip(args.out, clip, clips[clip][1])
+
+    dt = time.perf_counter() - t0
+    fps = total / dt if dt > 0 else 0.0
+    print(f"[BATCH] frames={total} elapsed={dt:.1f}s ({fps:.0f} frames/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# command_queue.py
+"""
+時間のかかる SDK コマンド（takeoff / land / streamon / battery? ...）を1本のワーカースレッドで順に実行する。
+メインループは submit() して戻るだけなので、応答待ちの間も描画と RC 送信が止まらない。
+
+  q = CommandQueue().start()
+  job = q.submit("takeoff", fn)
+  job.state   # "pending" → "running" → "done" / "failed"（実行前に取り消されたら "cancelled"）
+
+まとめ方（coalesce）:
+  - 同じ名前のジョブが待ち中なら新しく積まない（replace=True なら中身だけ差し替える）
+  - cancels=(...) に挙げた名前の待ち中ジョブを取り消す（実行中のものは止めない）
+  - urgent=True は列の先頭に入れる（land 用）
+
+stop() は待ち中のジョブを取り消すが、keep（既定は land）に挙げた名前のものは実行してから止まる。
+実行中のジョブも終わるまで待つので、stop() から戻ったあとは呼んだ側が Tello を触ってよい。
+stop() のあとの submit() は RuntimeError。
+
+Tello の応答は1つずつしか待てないので、応答のあるコマンドはすべてここを通す
+（StreamGovernor の画質変更も積む）。
+"""
+import threading
+import time
+from collections import deque
+
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class Job:
+    __slots__ = ("seq", "name", "fn", "state", "result", "error", "t_submit", "t_start", "t_end", "_done")
+
+    def __init__(self, seq, name, fn, t_submit):
+        self.seq = seq
+        self.name = name
+        self.fn = fn
+        self.state = PENDING
+        self.result = None
+        self.error = None
+        self.t_submit = t_submit
+        self.t_start = None
+        self.t_end = None
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    def wait(self, timeout=None):
+        """終わる（done / failed / cancelled）まで待つ"""
+        return self._done.wait(timeout)
+
+    def label(self, now):
+        """UI 用の短い表示"""
+        if self.state == RUNNING:
+            return f"{self.name}:{self.state} {now - self.t_start:.1f}s"
+        return f"{self.name}:{self.state}"
+
+
+class CommandQueue:
+    def __init__(self, clock=time.perf_counter, show_sec=3.0):
+        self.clock = clock
+        self.show_sec = show_sec    # 終わったジョブを status() に残す秒数
+
+        self._queue = deque()
+        self._cv = threading.Condition()
+        self._seq = 0
+        self.current = None
+        self.recent = deque(maxlen=8)   # 終わったジョブ（新しいものが右）
+        self.counts = {DONE: 0, FAILED: 0, CANCELLED: 0}
+
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="command-queue", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=None, keep=("land",)):
+        """
+        待ち中は keep 以外を取り消し、残った keep のジョブと実行中のジョブが終わるまで待つ。
+        戻り値はワーカーが止まったか（timeout で待ちきれなければ False）
+        """
+        with self._cv:
+            self.stopped = True
+            self._cancel_locked(set(job.name for job in self._queue) - set(keep), self.clock())
+            self._cv.notify()
+        if self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+        return not self.thread.is_alive()
+
+    # -----------------------
+    # submit / cancel
+    # -----------------------
+    def submit(self, name, fn, *, urgent=False, replace=False, cancels=()):
+        with self._cv:
+            if self.stopped:
+                raise RuntimeError(f"command queue stopped ({name})")
+            now = self.clock()
+            if cancels:
+                self._cancel_locked(cancels, now)
+            for job in self._queue:
+                if job.name == name:
+                    if replace:
+                        job.fn = fn
+                    return job
+            self._seq += 1
+            job = Job(self._seq, name, fn, now)
+            if urgent:
+                self._queue.appendleft(job)
+            else:
+                self._queue.append(job)
+            self._cv.notify()
+        return job
+
+    def cancel(self, *names):
+        """待ち中の names を取り消す（取り消した数）"""
+        with self._cv:
+            return self._cancel_locked(names, self.clock())
+
+    def _cancel_locked(self, names, now):
+        keep = deque()
+        n = 0
+        for job in self._queue:
+            if job.name in names:
+                job.state = CANCELLED
+                job.t_end = now
+                self._finish(job)
+                n += 1
+            else:
+                keep.append(job)
+        self._queue = keep
+        return n
+
+    def busy(self, name):
+        """name のジョブが待ち中か実行中か"""
+        cur = self.current
+        if cur is not None and cur.name == name:
+            return True
+        return any(job.name == name for job in list(self._queue))
+
+    def pending(self, name):
+        """name のジョブが待ち中か（実行中は含まない）"""
+        return any(job.name == name for job in list(self._queue))
+
+    # -----------------------
+    # worker
+    # -----------------------
+    def _run(self):
+        while True:
+            with self._cv:
+                while not self._queue and not self.stopped:
+                    self._cv.wait()
+                if not self._queue:
+                    # stopped（keep で残したジョブは流し切ってから抜ける）
+                    return
+                job = self._queue.popleft()
+                job.state = RUNNING
+                job.t_start = self.clock()
+                self.current = job
+
+            try:
+                job.result = job.fn()
+                job.state = DONE
+            except Exception as e:
+                job.error = str(e)
+                job.state = FAILED
+                print(f"[CMD] {job.name} failed: {e}")
+            job.t_end = self.clock()
+
+            with self._cv:
+                self.current = None
+                self._finish(job)
+
+    def _finish(self, job):
+        self.counts[job.state] += 1
+        self.recent.append(job)
+        job._done.set()
+
+    # -----------------------
+    # report
+    # -----------------------
+    def status(self, now=None):
+        """UI 用: 実行中・待ち中・最近終わったジョブの表示（古い順）"""
+        now = self.clock() if now is None else now
+        out = [job.label(now) for job in list(self.recent)
+               if job.t_end is not None and now - job.t_end <= self.show_sec]
+        cur = self.current
+        if cur is not None:
+            out.append(cur.label(now))
+        out += [job.label(now) for job in list(self._queue)]
+        return out
@@ -0,0 +1,455 @@
+# drone_sim.py
+"""
+ローカルの Tello シミュレータ（実機なしでパイプライン全体を動かす・測る用）。
+
+  コマンド(command_port) : FakeDrone と同じく応答する。rc は機体の運動に反映する
+  state(8890)            : シミュレーションの位置・姿勢・速度から作る
+  映像(11111)            : 機体のカメラから見た ArUco マーカーの3Dシーンを描いて H.264 で送る
+
+  python drone_sim.py --port 9889 [--speed 4]
+  python main.py --host 127.0.0.1 --command-port 9889     # または python main.py --sim
+
+speed は時間の倍率（1 = 実時間）。>1 なら運動・state・映像がその倍の速さで進む
+（state の周期と映像のフレームレートも実時間に対して speed 倍になる）。
+コントローラ側は実時間で回るので、speed>1 のとき制御ループは相対的に遅くなる。
+
+座標: マップは x 前（離陸時の向き）/ y 左 / z 上 [m]、heading は x 軸から反時計回り [rad]。
+Tello の yaw（state）は時計回りが正なので -degrees(heading)。
+"""
+import argparse
+import math
+import socket
+import threading
+import time
+from fractions import Fraction
+
+import av
+import cv2
+import numpy as np
+from cv2 import aruco
+
+from fake_drone import DEFAULT_COMMAND_PORT, STATE_PORT, FakeDrone
+
+
+VIDEO_PORT = 11111
+UDP_CHUNK = 1460    # 実機と同じく NAL をこの大きさに切って送る
+
+# Tello のカメラ（対角 82.6°）
+DIAG_FOV_DEG = 82.6
+RESOLUTIONS = {"high": (960, 720), "low": (640, 480)}
+FPS = {"high": 30, "middle": 15, "low": 5}
+
+TAKEOFF_HEIGHT = 0.8    # [m]
+G_MG = 1000.0
+
+
+class SimDynamics:
+    """
+    rc（-100..100）→ 速度の1次遅れ。rc は機体座標: lr 右 / fb 前 / ud 上 / yaw 時計回り。
+    vel_body は (前, 右, 上) [m/s]、yaw_rate は時計回り [deg/s]。
+    """
+
+    def __init__(self, pos=(0.0, 0.0, 0.0), heading=0.0,
+                 max_speed=1.0, max_climb=0.7, max_yaw_rate=90.0, tau=0.3, yaw_tau=0.15):
+        self.pos = np.array(pos, dtype=np.float64)
+        self.heading = float(heading)
+        self.max_speed = max_speed
+        self.max_climb = max_climb
+        self.max_yaw_rate = max_yaw_rate
+        self.tau = tau
+        self.yaw_tau = yaw_tau
+
+        self.vel_body = np.zeros(3)
+        self.acc_body = np.zeros(3)
+        self.yaw_rate = 0.0
+        self.rc = (0, 0, 0, 0)
+        self.flying = False
+        self.flight_time = 0.0
+
+    def set_rc(self, lr, fb, ud, yaw):
+        self.rc = (lr, fb, ud, yaw)
+
+    def takeoff(self):
+        self.flying = True
+        self.pos[2] = max(self.pos[2], TAKEOFF_HEIGHT)
+
+    def land(self):
+        self.flying = False
+        self.pos[2] = 0.0
+        self.vel_body[:] = 0.0
+        self.acc_body[:] = 0.0
+        self.yaw_rate = 0.0
+        self.rc = (0, 0, 0, 0)
+
+    def step(self, dt):
+        if not self.flying:
+            return
+        self.flight_time += dt
+        lr, fb, ud, yw = self.rc
+        target = np.array([fb * self.max_speed, lr * self.max_speed, ud * self.max_climb]) / 100.0
+        a = 1.0 - math.exp(-dt / self.tau)
+        new = self.vel_body + (target - self.vel_body) * a
+        self.acc_body = (new - self.vel_body) / dt
+        self.vel_body = new
+
+        target_rate = yw * self.max_yaw_rate / 100.0
+        self.yaw_rate += (target_rate - self.yaw_rate) * (1.0 - math.exp(-dt / self.yaw_tau))
+        self.heading -= math.radians(self.yaw_rate) * dt
+
+        c, s = math.cos(self.heading), math.sin(self.heading)
+        fwd, right, up = self.vel_body
+        self.pos[0] += (c * fwd + s * right) * dt
+        self.pos[1] += (s * fwd - c * right) * dt
+        self.pos[2] = max(0.1, self.pos[2] + up * dt)
+
+
+class SimMarker:
+    """center [m]、facing は表の向き（x 軸から反時計回り [rad]）、size は黒い部分の一辺 [m]"""
+
+    def __init__(self, marker_id, center, facing=math.pi, size=0.2):
+        self.id = int(marker_id)
+        self.center = np.array(center, dtype=np.float64)
+        self.facing = float(facing)
+        self.size = float(size)
+
+    def corners(self, scale=1.0):
+        """4隅のマップ座標 (4,3)（[tl, tr, br, bl]、表から見て）。scale で黒い部分の何倍かを指定"""
+        half = 0.5 * self.size * scale
+        right = np.array([-math.sin(self.facing), math.cos(self.facing), 0.0])
+        up = np.array([0.0, 0.0, half])
+        return np.stack([
+            self.center - half * right + up,
+            self.center + half * right + up,
+            self.center + half * right - up,
+            self.center - half * right - up,
+        ])
+
+
+class MarkerScene:
+    """
+    ピンホールカメラ（機体の前向き・水平）から見たマーカーを背景に透視変換で貼る。
+    背景は固定の画像（壁と床）。
+    """
+
+    def __init__(self, markers=None, width=960, height=720, dictionary=aruco.DICT_4X4_50,
+                 marker_px=200, seed=0):
+        if markers is None:
+            # 離陸地点の 3m 前、少し左。こちらを向いている
+            markers = [SimMarker(0, (3.0, 0.4, 1.0), facing=math.pi)]
+        self.markers = markers
+        self.dictionary = aruco.getPredefinedDictionary(dictionary)
+        self.marker_px = marker_px
+        self._tiles = {}
+        self._rng = np.random.default_rng(seed)
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        self.width = int(width)
+        self.height = int(height)
+        half_diag = 0.5 * math.hypot(self.width, self.height)
+        self.f = half_diag / math.tan(math.radians(DIAG_FOV_DEG / 2.0))
+        self.cx = self.width / 2.0
+        self.cy = self.height / 2.0
+        self.background = self._make_background()
+
+    def _make_background(self):
+        h, w = self.height, self.width
+        bg = np.empty((h, w, 3), dtype=np.uint8)
+        col = np.linspace(185, 150, h // 2, dtype=np.float32)
+        bg[: h // 2] = col[:, None, None].astype(np.uint8)
+        bg[h // 2:] = 105
+        noise = self._rng.normal(0.0, 4.0, size=(h, w, 1))
+        return np.clip(bg + noise, 0, 255).astype(np.uint8)
+
+    def _tile(self, marker_id):
+        """マーカー画像に白い余白（quiet zone）を付けたもの。(画像, 余白込みの一辺/黒い部分の一辺)"""
+        tile = self._tiles.get(marker_id)
+        if tile is None:
+            m = aruco.generateImageMarker(self.dictionary, marker_id, self.marker_px)
+            pad = self.marker_px // 5
+            t = np.full((self.marker_px + 2 * pad, self.marker_px + 2 * pad), 255, dtype=np.uint8)
+            t[pad:pad + self.marker_px, pad:pad + self.marker_px] = m
+            tile = self._tiles[marker_id] = (cv2.cvtColor(t, cv2.COLOR_GRAY2BGR), t.shape[0] / self.marker_px)
+        return tile
+
+    def project(self, pos, heading, points):
+        """マップ座標の点 (N,3) → 画像座標 (N,2) と奥行き (N,)"""
+        c, s = math.cos(heading), math.sin(heading)
+        v = np.asarray(points, dtype=np.float64) - np.asarray(pos, dtype=np.float64)
+        depth = v[:, 0] * c + v[:, 1] * s
+        right = v[:, 0] * s - v[:, 1] * c
+        up = v[:, 2]
+        safe = np.where(depth > 1e-6, depth, 1e-6)
+        uv = np.stack([self.cx + self.f * right / safe, self.cy - self.f * up / safe], axis=1)
+        return uv, depth
+
+    def marker_uv(self, pos, heading, m):
+        """黒い部分の4隅の画像座標 (4,2)。裏向き・近すぎる・画像からはみ出す（= 検出できない）なら None"""
+        n = np.array([math.cos(m.facing), math.sin(m.facing), 0.0])
+        if float(np.dot(n, np.asarray(pos) - m.center)) <= 0.0:
+            return None
+        uv, depth = self.project(pos, heading, m.corners())
+        if np.any(depth < 0.1):
+            return None
+        if uv[:, 0].min() < 0 or uv[:, 1].min() < 0 or uv[:, 0].max() >= self.width or uv[:, 1].max() >= self.height:
+            return None
+        return uv
+
+    def render(self, pos, heading, out=None):
+        """位置 pos・向き heading のカメラ画像（BGR）。out があればそこに描く"""
+        if out is None:
+            out = np.empty_like(self.background)
+        np.copyto(out, self.background)
+        # 遠いものから描く
+        order = sorted(self.markers, key=lambda m: -float(np.linalg.norm(m.center - pos)))
+        for m in order:
+            self._draw_marker(out, pos, heading, m)
+        return out
+
+    def _draw_marker(self, out, pos, heading, m):
+        # 裏向きなら描かない
+        n = np.array([math.cos(m.facing), math.sin(m.facing), 0.0])
+        if float(np.dot(n, np.asarray(pos) - m.center)) <= 0.0:
+            return
+        tile, scale = self._tile(m.id)
+        uv, depth = self.project(pos, heading, m.corners(scale))
+        if np.any(depth < 0.1):
+            return
+
+        x0 = max(0, int(math.floor(uv[:, 0].min())))
+        y0 = max(0, int(math.floor(uv[:, 1].min())))
+        x1 = min(self.width, int(math.ceil(uv[:, 0].max())) + 1)
+        y1 = min(self.height, int(math.ceil(uv[:, 1].max())) + 1)
+        if x1 <= x0 or y1 <= y0:
+            return
+
+        th, tw = tile.shape[:2]
+        src = np.float32([[0, 0], [tw, 0], [tw, th], [0, th]])
+        dst = (uv - (x0, y0)).astype(np.float32)
+        H = cv2.getPerspectiveTransform(src, dst)
+        bw, bh = x1 - x0, y1 - y0
+        warped = cv2.warpPerspective(tile, H, (bw, bh), flags=cv2.INTER_LINEAR)
+        mask = np.zeros((bh, bw), dtype=np.uint8)
+        cv2.fillConvexPoly(mask, np.round(dst).astype(np.int32), 255, cv2.LINE_AA)
+        roi = out[y0:y1, x0:x1]
+        np.copyto(roi, warped, where=(mask > 127)[:, :, None])
+
+
+class H264Sender:
+    """BGR フレーム → H.264（Annex B）→ UDP に UDP_CHUNK ずつ"""
+
+    def __init__(self, sock, dest, width, height, fps, bitrate_mbps=0):
+        self.sock = sock
+        self.dest = dest
+        self.codec = av.CodecContext.create("libx264", "w")
+        self.codec.width = width
+        self.codec.height = height
+        self.codec.pix_fmt = "yuv420p"
+        self.codec.time_base = Fraction(1, fps)
+        self.codec.framerate = Fraction(fps, 1)
+        self.codec.gop_size = fps
+        if bitrate_mbps:
+            self.codec.bit_rate = int(bitrate_mbps * 1_000_000)
+        # 途中から受けても復号できるように、キーフレームごとに SPS/PPS を付ける
+        self.codec.options = {"preset": "ultrafast", "tune": "zerolatency", "x264-params": "repeat-headers=1"}
+        self.pts = 0
+        self.bytes_sent = 0
+
+    def send(self, img):
+        frame = av.VideoFrame.from_ndarray(img, format="bgr24")
+        frame.pts = self.pts
+        self.pts += 1
+        for packet in self.codec.encode(frame):
+            data = bytes(packet)
+            for i in range(0, len(data), UDP_CHUNK):
+                try:
+                    self.sock.sendto(data[i:i + UDP_CHUNK], self.dest)
+                except OSError:
+                    return
+            self.bytes_sent += len(data)
+
+
+class SimDrone(FakeDrone):
+    """
+    FakeDrone に運動・カメラ映像を足したもの。
+
+      sim = SimDrone(speed=1.0).start()
+      sim.truth()    # (pos, heading_rad)。評価用の真値
+    """
+
+    def __init__(self, host="127.0.0.1", command_port=DEFAULT_COMMAND_PORT, state_port=STATE_PORT,
+                 video_port=VIDEO_PORT, state_hz=10.0, speed=1.0, scene=None, dynamics=None,
+                 physics_hz=100.0, battery_drain=0.13):
+        super().__init__(host, command_port, state_port, state_hz=state_hz * speed)
+        self.speed = float(speed)
+        self.video_port = video_port
+        self.scene = scene if scene is not None else MarkerScene()
+        self.dyn = dynamics if dynamics is not None else SimDynamics()
+        self.physics_hz = physics_hz
+        self.battery_drain = battery_drain      # 飛行中の減り [%/s]
+        self.lock = threading.Lock()
+
+        self.stream_on = False
+        self.resolution = "high"
+        self.fps = "high"
+        self.bitrate = 0
+        self._video_config = None
+
+        self.frames_sent = 0
+        self.video_late = 0     # 描画・エンコードが間に合わず飛ばしたフレーム
+
+    def start(self):
+        super().start()
+        for fn in (self._physics_loop, self._video_loop):
+            th = threading.Thread(target=fn, daemon=True)
+            th.start()
+            self._threads.append(th)
+        return self
+
+    def truth(self):
+        with self.lock:
+            return self.dyn.pos.copy(), self.dyn.heading
+
+    # -----------------------
+    # command
+    # -----------------------
+    def handle_command(self, cmd):
+        parts = cmd.split()
+        if not parts:
+            return "error"
+        name = parts[0]
+        if name == "rc":
+            if len(parts) == 5:
+                try:
+                    rc = tuple(max(-100, min(100, int(v))) for v in parts[1:])
+                except ValueError:
+                    return None
+                with self.lock:
+                    self.dyn.set_rc(*rc)
+            return None
+        if name == "takeoff":
+            with self.lock:
+                self.dyn.takeoff()
+        elif name == "land":
+            with self.lock:
+                self.dyn.land()
+        elif name == "streamon":
+            self.stream_on = True
+        elif name == "streamoff":
+            self.stream_on = False
+        elif name == "setresolution" and len(parts) == 2 and parts[1] in RESOLUTIONS:
+            self.resolution = parts[1]
+        elif name == "setfps" and len(parts) == 2 and parts[1] in FPS:
+            self.fps = parts[1]
+        elif name == "setbitrate" and len(parts) == 2 and parts[1].isdigit():
+            self.bitrate = int(parts[1])
+        return super().handle_command(cmd)
+
+    # -----------------------
+    # state
+    # -----------------------
+    def state_fields(self):
+        with self.lock:
+            d = self.dyn
+            fwd, right, up = d.vel_body
+            afwd, aright, aup = d.acc_body
+            h_cm = int(round(d.pos[2] * 100)) if d.flying else 0
+            yaw = int(round(-math.degrees(d.heading) + 180.0) % 360 - 180)
+            flight_time = d.flight_time
+            flying = d.flying
+            baro = round(float(d.pos[2]), 2)
+        bat = max(0, int(self.battery - flight_time * self.battery_drain))
+        return {
+            "mid": -1, "x": 0, "y": 0, "z": 0,
+            # 前に加速するときは機首下げ、右に加速するときは右に傾ける
+            "pitch": int(round(-math.degrees(math.atan2(afwd, 9.81)))),
+            "roll": int(round(math.degrees(math.atan2(aright, 9.81)))),
+            "yaw": yaw,
+            "vgx": int(round(fwd * 10)), "vgy": int(round(right * 10)), "vgz": int(round(up * 10)),
+            "templ": 60, "temph": 62,
+            "tof": 10 + h_cm, "h": h_cm,
+            "bat": bat, "baro": baro,
+            "time": int(flight_time) if flying else 0,
+            "agx": round(afwd / 9.81 * G_MG, 2), "agy": round(aright / 9.81 * G_MG, 2),
+            "agz": round(-(1.0 + aup / 9.81) * G_MG, 2),
+        }
+
+    # -----------------------
+    # loops
+    # -----------------------
+    def _physics_loop(self):
+        dt = 1.0 / self.physics_hz
+        period = dt / self.speed
+        next_t = time.perf_counter()
+        while not self.stopped:
+            with self.lock:
+                self.dyn.step(dt)
+            next_t += period
+            wait = next_t - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            elif -wait > 0.5:
+                next_t = time.perf_counter()
+
+    def _video_loop(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender = None
+        frame = None
+        next_t = time.perf_counter()
+        while not self.stopped:
+            fps_hz = FPS[self.fps]
+            period = 1.0 / (fps_hz * self.speed)
+            if not self.stream_on or self.client is None:
+                sender = None
+                time.sleep(0.05)
+                next_t = time.perf_counter()
+                continue
+
+            config = (self.resolution, self.fps, self.bitrate)
+            if sender is None or config != self._video_config:
+                w, h = RESOLUTIONS[self.resolution]
+                if (w, h) != (self.scene.width, self.scene.height):
+                    self.scene.resize(w, h)
+                frame = np.empty((h, w, 3), dtype=np.uint8)
+                sender = H264Sender(sock, (self.client[0], self.video_port), w, h, fps_hz, self.bitrate)
+                self._video_config = config
+
+            pos, heading = self.truth()
+            self.scene.render(pos, heading, out=frame)
+            sender.send(frame)
+            self.frames_sent += 1
+
+            next_t += period
+            wait = next_t - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            elif -wait >= period:
+                # 間に合わなかった分は飛ばす（まとめて送らない）
+                self.video_late += int(-wait // period)
+                next_t = time.perf_counter()
+        sock.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local Tello simulator (SDK commands, state and H.264 video)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=DEFAULT_COMMAND_PORT)
+    ap.add_argument("--speed", type=float, default=1.0, help="時間の倍率（1 = 実時間）")
+    ap.add_argument("--state-hz", type=float, default=10.0)
+    args = ap.parse_args()
+
+    sim = SimDrone(args.host, args.port, state_hz=args.state_hz, speed=args.speed).start()
+    print(f"[SIM] listening on {args.host}:{args.port}  speed x{args.speed:g}  (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(2.0)
+            pos, heading = sim.truth()
+            print(f"[SIM] pos=({pos[0]:+.2f},{pos[1]:+.2f},{pos[2]:.2f}) yaw={-math.degrees(heading):+.0f}  "
+                  f"rc={sim.dyn.rc}  frames={sim.frames_sent} late={sim.video_late}")
+    except KeyboardInterrupt:
+        pass
+    sim.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# fake_drone.py
+"""
+ローカル UDP で Tello のふりをするスタンドイン（実機なしで動作確認する用）。
+
+  - コマンド: (host, command_port) で受けて "ok" / 数値を返す
+  - state   : (client_host, 8890) へ state パケットを一定周期で送る
+
+djitellopy はローカルの 8889 を bind するので、同じマシンで動かすときは
+command_port を 8889 以外にして TelloController(command_port=...) で合わせる。
+
+  python fake_drone.py --port 9889
+  python main.py --host 127.0.0.1 --command-port 9889
+"""
+import argparse
+import socket
+import threading
+import time
+
+
+DEFAULT_COMMAND_PORT = 9889
+STATE_PORT = 8890
+
+
+class FakeDrone:
+    """Tello SDK の最小限のスタンドイン。受けたコマンドは commands に残す。"""
+
+    def __init__(self, host="127.0.0.1", command_port=DEFAULT_COMMAND_PORT,
+                 state_port=STATE_PORT, state_hz=10.0):
+        self.host = host
+        self.command_port = command_port
+        self.state_port = state_port
+        self.state_hz = state_hz
+
+        self.commands = []      # [(t, "command"), ...]
+        self.client = None      # 最後にコマンドを送ってきたアドレス
+        self.battery = 87
+        self.height = 0
+        self.flying = False
+        self.t0 = time.time()
+
+        # 応答を遅らせたい/落としたいとき用
+        self.response_delay = 0.0
+        self.drop_every = 0     # n>0 なら n 個に1個は応答しない
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, command_port))
+        self.sock.settimeout(0.2)
+
+        self.stopped = False
+        self._threads = []
+
+    # -----------------------
+    # lifecycle
+    # -----------------------
+    def start(self):
+        for fn in (self._command_loop, self._state_loop):
+            th = threading.Thread(target=fn, daemon=True)
+            th.start()
+            self._threads.append(th)
+        return self
+
+    def stop(self):
+        self.stopped = True
+        for th in self._threads:
+            th.join(timeout=1.0)
+        self.sock.close()
+
+    # -----------------------
+    # command
+    # -----------------------
+    def handle_command(self, cmd):
+        """コマンド文字列 → 応答文字列（None なら応答しない）"""
+        if cmd.startswith("rc "):
+            return None
+        if cmd == "battery?":
+            return str(self.battery)
+        if cmd == "takeoff":
+            self.flying = True
+            self.height = 80
+        elif cmd == "land":
+            self.flying = False
+            self.height = 0
+        return "ok"
+
+    def _command_loop(self):
+        n = 0
+        while not self.stopped:
+            try:
+                data, addr = self.sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            cmd = data.decode("utf-8", errors="replace").strip()
+            self.client = addr
+            self.commands.append((time.time(), cmd))
+
+            resp = self.handle_command(cmd)
+            if resp is None:
+                continue
+            n += 1
+            if self.drop_every > 0 and n % self.drop_every == 0:
+                continue
+            if self.response_delay > 0:
+                time.sleep(self.response_delay)
+            try:
+                self.sock.sendto(resp.encode("utf-8"), addr)
+            except OSError:
+                break
+
+    # -----------------------
+    # state
+    # -----------------------
+    def state_fields(self):
+        return {
+            "mid": -1, "x": 0, "y": 0, "z": 0,
+            "pitch": 0, "roll": 0, "yaw": 0,
+            "vgx": 0, "vgy": 0, "vgz": 0,
+            "templ": 60, "temph": 62,
+            "tof": 10 + self.height, "h": self.height,
+            "bat": self.battery, "baro": 0.0,
+            "time": int(time.time() - self.t0) if self.flying else 0,
+            "agx": 0.0, "agy": 0.0, "agz": -1000.0,
+        }
+
+    def state_packet(self):
+        return ";".join(f"{k}:{v}" for k, v in self.state_fields().items()) + ";\r\n"
+
+    def _state_loop(self):
+        out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        period = 1.0 / self.state_hz
+        next_t = time.perf_counter()
+        while not self.stopped:
+            # 接続前はまだ送り先が分からない
+            if self.client is not None:
+                try:
+                    out.sendto(self.state_packet().encode("ascii"), (self.client[0], self.state_port))
+                except OSError:
+                    pass
+            next_t += period
+            time.sleep(max(0.0, next_t - time.perf_counter()))
+        out.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local UDP stand-in for a Tello drone")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=DEFAULT_COMMAND_PORT)
+    args = ap.parse_args()
+
+    drone = FakeDrone(args.host, args.port).start()
+    print(f"[FAKE] listening on {args.host}:{args.port}  (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    drone.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+# flight_log.py
+"""
+列指向のフライトログ（.flog）。np.memmap で開くので、必要な列・時間範囲のバイトしか読まない。
+
+  python flight_log.py convert SESSION_DIR [--out FILE]   # SessionRecorder の events.jsonl から変換
+  python flight_log.py info FILE
+
+  log = FlightLog("flight.flog")
+  cols = log.query(["h", "rc_fb"], t0=10.0, t1=20.0)      # memmap の view（コピーしない）
+  grid = log.resample(0.1, ["h", "yaw"], how="linear")
+
+ファイル構成（リトルエンディアン、各ブロックは 64 バイト境界）:
+  b"FLOG1\\0\\0\\0" | uint64 ヘッダ長 | ヘッダ JSON | 列ブロック ... | チャンク索引
+  ヘッダ: rows, chunk_rows, columns=[{name, dtype, offset}], index={offset, count}, meta
+  チャンク索引: chunk_rows 行ごとの先頭時刻（float64）。時間範囲 → 行範囲はこれで絞ってから
+  該当チャンクの t だけ読んで決める。
+"""
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+from telemetry import FLOAT_FIELDS, INT_FIELDS
+
+
+MAGIC = b"FLOG1\0\0\0"
+ALIGN = 64
+VERSION = 1
+
+# SessionRecorder の1イベント → 列。欠損は float は NaN
+RECORDER_COLUMNS = (
+    ("i", "<i4"),
+    ("has_frame", "u1"),
+    ("dup", "u1"),
+    ("connected", "u1"),
+    ("in_flight", "u1"),
+    ("key", "<i2"),
+    ("pressed", "<u4"),        # ビットマスク（meta["pressed_keys"] の順）
+    ("rc_lr", "<f4"),
+    ("rc_fb", "<f4"),
+    ("rc_ud", "<f4"),
+    ("rc_yaw", "<f4"),
+) + tuple((k, "<f4") for k in INT_FIELDS + FLOAT_FIELDS)
+
+
+def _pad(n):
+    return (-n) % ALIGN
+
+
+# -----------------------
+# write
+# -----------------------
+def write_flight_log(path, t, columns, chunk_rows=4096, meta=None):
+    """
+    t（単調増加, 秒）と {name: 1次元配列} を .flog に書く。
+    列の dtype はそのまま使う（行数は t と同じであること）。
+    """
+    t = np.ascontiguousarray(t, dtype="<f8")
+    n = t.shape[0]
+    if n > 1 and np.any(np.diff(t) < 0):
+        raise ValueError("t must be non-decreasing")
+    blocks = [("t", t)]
+    for name, col in columns.items():
+        col = np.ascontiguousarray(col)
+        if col.shape != (n,):
+            raise ValueError(f"column {name!r}: shape {col.shape} != ({n},)")
+        blocks.append((name, col.astype(col.dtype.newbyteorder("<"), copy=False)))
+
+    chunk_rows = max(1, int(chunk_rows))
+    index = np.ascontiguousarray(t[::chunk_rows], dtype="<f8")
+
+    # ヘッダ長が決まらないとオフセットが決まらないので、長さが落ち着くまで組み立て直す
+    def build_header(data_start):
+        off = data_start
+        cols = []
+        for name, arr in blocks:
+            cols.append({"name": name, "dtype": arr.dtype.str, "offset": off})
+            off += arr.nbytes + _pad(arr.nbytes)
+        return {
+            "version": VERSION,
+            "rows": int(n),
+            "chunk_rows": chunk_rows,
+            "columns": cols,
+            "index": {"offset": off, "count": int(index.shape[0])},
+            "meta": meta or {},
+        }
+
+    head = len(MAGIC) + 8
+    header = json.dumps(build_header(0)).encode("utf-8")
+    for _ in range(3):
+        data_start = head + len(header) + _pad(head + len(header))
+        header = json.dumps(build_header(data_start)).encode("utf-8")
+    data_start = head + len(header) + _pad(head + len(header))
+    assert build_header(data_start)["columns"][0]["offset"] == data_start
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(b"\0" * _pad(head + len(header)))
+        for _, arr in blocks:
+            f.write(arr.tobytes())
+            f.write(b"\0" * _pad(arr.nbytes))
+        f.write(index.tobytes())
+    os.replace(tmp, path)
+    return path
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def convert_session(session_dir, out_path=None, chunk_rows=4096):
+    """SessionRecorder のディレクトリ（events.jsonl, meta.json）→ .flog"""
+    out_path = out_path or os.path.join(session_dir, "flight.flog")
+    events = list(_read_jsonl(os.path.join(session_dir, "events.jsonl")))
+    n = len(events)
+
+    keys = sorted({k for ev in events for k in (ev.get("pressed") or [])})
+    if len(keys) > 32:
+        raise ValueError(f"too many distinct keys for the pressed bitmask: {len(keys)}")
+    key_bit = {k: 1 << i for i, k in enumerate(keys)}
+
+    t = np.empty(n, dtype="<f8")
+    cols = {name: np.zeros(n, dtype=dt) for name, dt in RECORDER_COLUMNS}
+    for name, dt in RECORDER_COLUMNS:
+        if np.dtype(dt).kind == "f":
+            cols[name][:] = np.nan
+
+    state_keys = INT_FIELDS + FLOAT_FIELDS
+    for r, ev in enumerate(events):
+        t[r] = ev.get("t", 0.0)
+        cols["i"][r] = ev.get("i", r)
+        cols["has_frame"][r] = bool(ev.get("has_frame"))
+        cols["dup"][r] = bool(ev.get("dup"))
+        cols["connected"][r] = bool(ev.get("connected"))
+        cols["in_flight"][r] = bool(ev.get("in_flight"))
+        cols["key"][r] = ev.get("key", 255)
+        mask = 0
+        for k in ev.get("pressed") or ():
+            mask |= key_bit[k]
+        cols["pressed"][r] = mask
+        rc = ev.get("rc")
+        if rc is not None:
+            cols["rc_lr"][r], cols["rc_fb"][r], cols["rc_ud"][r], cols["rc_yaw"][r] = rc
+        state = ev.get("state") or {}
+        for k in state_keys:
+            v = state.get(k)
+            if v is not None:
+                try:
+                    cols[k][r] = float(v)
+                except (TypeError, ValueError):
+                    pass
+
+    meta = {"source": "session_recorder", "pressed_keys": keys}
+    meta_path = os.path.join(session_dir, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            meta["session"] = json.load(f)
+    return write_flight_log(out_path, t, cols, chunk_rows=chunk_rows, meta=meta)
+
+
+# -----------------------
+# read
+# -----------------------
+class FlightLog:
+    """
+    .flog の読み出し。列は開いたときには読まず、アクセスした範囲だけページインされる。
+    query() が返す配列は読み取り専用の memmap view。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path}: not a flight log")
+            (hlen,) = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(hlen).decode("utf-8"))
+        if self.header.get("version") != VERSION:
+            raise ValueError(f"{path}: unsupported version {self.header.get('version')}")
+
+        self.rows = int(self.header["rows"])
+        self.chunk_rows = int(self.header["chunk_rows"])
+        self.meta = self.header.get("meta", {})
+        self.dtypes = {c["name"]: np.dtype(c["dtype"]) for c in self.header["columns"]}
+        self._offsets = {c["name"]: c["offset"] for c in self.header["columns"]}
+        self._cols = {}
+        idx = self.header["index"]
+        self.index = self._map("<f8", idx["offset"], idx["count"])
+
+    def _map(self, dtype, offset, count):
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def channels(self):
+        return [name for name in self.dtypes if name != "t"]
+
+    def column(self, name):
+        """列全体の memmap（初回アクセス時に作るだけで、読み込みはしない）"""
+        col = self._cols.get(name)
+        if col is None:
+            if name not in self.dtypes:
+                raise KeyError(f"unknown channel {name!r}")
+            col = self._map(self.dtypes[name], self._offsets[name], self.rows)
+            self._cols[name] = col
+        return col
+
+    @property
+    def t(self):
+        return self.column("t")
+
+    def row_range(self, t0=None, t1=None):
+        """t0 <= t < t1 の行範囲 (start, stop)。チャンク索引で絞ってから該当部分の t だけ読む"""
+        start, stop = 0, self.rows
+        t = self.t
+        k = self.chunk_rows
+        if t0 is not None:
+            c = max(0, int(np.searchsorted(self.index, t0, side="left")) - 1)
+            lo = c * k
+            hi = min(self.rows, lo + k)
+            start = lo + int(np.searchsorted(t[lo:hi], t0, side="left"))
+        if t1 is not None:
+            c = max(0, int(np.searchsorted(self.index, t1, side="left")) - 1)
+            lo = c * k
+            hi = min(self.rows, lo + k)
+            stop = lo + int(np.searchsorted(t[lo:hi], t1, side="left"))
+        return start, max(start, stop)
+
+    def query(self, channels=None, t0=None, t1=None):
+        """{"t": ..., name: ...}（指定範囲の view）。channels=None なら全列"""
+        start, stop = self.row_range(t0, t1)
+        names = self.channels if channels is None else list(channels)
+        out = {"t": self.t[start:stop]}
+        for name in names:
+            out[name] = self.column(name)[start:stop]
+        return out
+
+    def resample(self, dt, channels=None, t0=None, t1=None, how="hold"):
+        """
+        等間隔 dt の格子にそろえる（結果は float64 のコピー）。
+          hold   : 格子時刻以前の最新値（ゼロ次ホールド）
+          linear : 線形補間（NaN はそのまま伝わる）
+          mean   : [t, t+dt) の平均（サンプルが無ければ NaN、NaN は無視）
+        """
+        q = self.query(channels, t0, t1)
+        t = np.asarray(q.pop("t"))
+        if t.shape[0] == 0:
+            return {"t": np.empty(0), **{k: np.empty(0) for k in q}}
+        start = t[0] if t0 is None else t0
+        end = t[-1] if t1 is None else t1
+        grid = start + dt * np.arange(int(np.floor((end - start) / dt)) + 1)
+        out = {"t": grid}
+
+        if how == "hold":
+            idx = np.searchsorted(t, grid, side="right") - 1
+            valid = idx >= 0
+            idx = np.clip(idx, 0, None)
+            for k, v in q.items():
+                r = np.asarray(v, dtype=np.float64)[idx]
+                r[~valid] = np.nan
+                out[k] = r
+        elif how == "linear":
+            for k, v in q.items():
+                out[k] = np.interp(grid, t, np.asarray(v, dtype=np.float64), left=np.nan, right=np.nan)
+        elif how == "mean":
+            bins = np.floor((t - start) / dt).astype(np.int64)
+            keep = (bins >= 0) & (bins < grid.shape[0])
+            bins = bins[keep]
+            for k, v in q.items():
+                v = np.asarray(v, dtype=np.float64)[keep]
+                ok = ~np.isnan(v)
+                s = np.bincount(bins[ok], weights=v[ok], minlength=grid.shape[0])
+                c = np.bincount(bins[ok], minlength=grid.shape[0])
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    out[k] = s / c
+        else:
+            raise ValueError(f"unknown resample mode {how!r}")
+        return out
+
+    def decode_pressed(self, mask):
+        """pressed 列の値 → キー名のリスト"""
+        keys = self.meta.get("pressed_keys", [])
+        mask = int(mask)
+        return [k for i, k in enumerate(keys) if mask & (1 << i)]
+
+
+# -----------------------
+# CLI
+# -----------------------
+def main():
+    ap = argparse.ArgumentParser(description="Columnar flight log tools")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("convert", help="events.jsonl → .flog")
+    c.add_argument("session_dir")
+    c.add_argument("--out", default=None)
+    c.add_argument("--chunk-rows", type=int, default=4096)
+    i = sub.add_parser("info", help="ヘッダと列の一覧")
+    i.add_argument("path")
+    args = ap.parse_args()
+
+    if args.cmd == "convert":
+        path = convert_session(args.session_dir, args.out, args.chunk_rows)
+        print(f"[FLOG] wrote {path}")
+    else:
+        log = FlightLog(args.path)
+        t = log.t
+        span = (float(t[0]), float(t[-1])) if len(log) else (None, None)
+        print(f"[FLOG] rows={len(log)} chunk_rows={log.chunk_rows} t={span}")
+        for name in log.channels:
+            print(f"  {name:12s} {log.dtypes[name].str}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# frame_pool.py
+import threading
+
+import numpy as np
+
+
+class PooledFrame:
+    """
+    FramePool から借りたフレームバッファ。
+    参照カウント式：使う側は retain() / release() を対にする。
+    refs が 0 になったらプールに戻って次のフレームで上書きされる。
+    """
+
+    __slots__ = ("pool", "array", "refs", "retired", "seq", "ts", "capture_ts", "decode_ts")
+
+    def __init__(self, pool, array):
+        self.pool = pool
+        self.array = array
+        self.refs = 0
+        self.retired = False
+        self.seq = 0
+        self.ts = 0.0           # 変換が終わって公開した時刻
+        self.capture_ts = 0.0   # パケットを受け取った時刻
+        self.decode_ts = 0.0    # デコードが終わった時刻
+
+    def retain(self):
+        with self.pool.lock:
+            self.refs += 1
+        return self
+
+    def release(self):
+        self.pool._release(self)
+
+
+class FramePool:
+    """
+    同じ shape の連続バッファを使い回すプール。
+
+    steady state では acquire() は新しい配列を作らない。
+    allocations はバッファを新しく作った回数（起動直後と解像度変更時だけ増えるはず）。
+    全部使用中なら max_size まで増やし、それ以上は None を返す（呼び出し側でフレームを捨てる）。
+    """
+
+    def __init__(self, shape, size=4, max_size=8, dtype=np.uint8):
+        self.lock = threading.Lock()
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.max_size = max_size
+
+        self.allocations = 0
+        self.exhausted = 0   # 空きが無くて None を返した回数
+
+        self._all = []
+        self._free = []
+        for _ in range(size):
+            self._free.append(self._new())
+
+    def _new(self):
+        pf = PooledFrame(self, np.empty(self.shape, dtype=self.dtype))
+        self._all.append(pf)
+        self.allocations += 1
+        return pf
+
+    def acquire(self):
+        """空きバッファを refs=1 で返す"""
+        with self.lock:
+            if self._free:
+                pf = self._free.pop()
+            elif len(self._all) < self.max_size:
+                pf = self._new()
+            else:
+                self.exhausted += 1
+                return None
+            pf.refs = 1
+            return pf
+
+    def _release(self, pf):
+        with self.lock:
+            pf.refs -= 1
+            if pf.refs == 0 and not pf.retired:
+                self._free.append(pf)
+
+    def reshape(self, shape):
+        """解像度が変わったときに呼ぶ。使用中のバッファは返却時に捨てる"""
+        shape = tuple(shape)
+        with self.lock:
+            if shape == self.shape:
+                return
+            n = len(self._all)
+            for pf in self._all:
+                pf.retired = True   # 古いバッファは返ってきてもプールに戻さない
+            self.shape = shape
+            self._all = []
+            self._free = [self._new() for _ in range(min(n, self.max_size))]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self._all),
+                "free": len(self._free),
+                "allocations": self.allocations,
+                "exhausted": self.exhausted,
+            }
@@ -0,0 +1,303 @@
+# gain_sweep.py
+"""
+記録済みのマーカー列に対して、セミオート（yaw モード）の制御則を何千通りのパラメータで一度に評価する。
+
+  python gain_sweep.py OUT/clip.npz --grid yaw.kp=0.2:0.6:9 --grid smooth=0,0.2,0.35,0.5,0.7 \\
+         --grid center_dead_px=8,14,20 --grid fb.kp=0.15:0.35:5 --top 15 --traces sweep.npz
+
+入力は batch_analyzer.py の <clip>.npz（frame_t と det_* の列。フレームごとに最初の1件 =
+get_marker_info(target_id=None) と同じものを使う）。複数渡すと各クリップのスコアを時間で重み付け平均する。
+
+配列は (パラメータの組 P, 時刻 T)。Python のループは組のチャンクとクリップの単位だけで、
+時刻方向の漸化式（微分のローパス・EMA・見失いでのリセット）は
+  y[t] = c[t] * y[t-1] + b[t]
+の形にして、倍々のシフトで log2(T) 回の配列演算で解く（linear_scan）。
+
+再現しているもの（TelloController._yaw_then_fb_commands と同じ順）:
+  PID の P と D（距離スケジュール込み）・不感帯・上限、fb_min、中心ずれ時の前進の倍率、EMA、
+  見失い（lost_stop_sec を超えたら 0 にしてフィルタをリセット、それまでは前の値を保持）
+再現していないもの:
+  積分（頭打ちと anti-windup が非線形なので ki は 0 として扱う）、遅延補償（記録に撮影時刻が無い）
+開ループの評価なので、コマンドを変えてもマーカーの動きは変わらない（滑らかさ・飽和の比較用）。
+
+スコア（低いほど良い）:
+  yaw_dcmd / fb_dcmd : 1ステップあたりのコマンドの変化の RMS（ガタつき）
+  yaw_sat / fb_sat   : |コマンド| が上限に張り付いていた時間の割合
+  rough              : (yaw_dcmd + fb_dcmd) / (平均 |yaw| + 平均 |fb| + 1)（効きの割にガタつくか）
+--check で先頭の組を本物の TelloController に1ステップずつ流して、トレースが一致するか確かめる。
+"""
+import argparse
+import itertools
+import math
+import sys
+import time
+
+import numpy as np
+
+import approach_config
+from session_replay import FakeTello, ReplayClock, ReplayKeyboardState
+from tello_controller import TelloController
+
+
+# スイープできる名前 → 既定値の取り方（controller / PID の属性）
+CONTROLLER_PARAMS = ("smooth", "center_dead_px", "size_dead_px", "fb_min", "lost_stop_sec",
+                     "offcenter_fb_scale", "target_size_px")
+PID_PARAMS = ("kp", "kd", "d_tau", "out_max")
+SCORES = ("rough", "yaw_dcmd", "fb_dcmd", "yaw_sat", "fb_sat", "yaw_mean", "fb_mean")
+
+
+def load_markers(path, frame_w=960):
+    """batch_analyzer の npz → {"t", "present", "cx", "size"}（フレームごと、T 個）"""
+    cols = np.load(path)
+    t = cols["frame_t"].astype(np.float64)
+    frame_idx = cols["frame_idx"]
+    present = np.zeros(t.shape[0], dtype=bool)
+    cx = np.zeros(t.shape[0])
+    size = np.zeros(t.shape[0])
+    if cols["det_frame"].size:
+        # 同じフレームの検出は並んでいるので、各フレームの最初の行
+        first = np.concatenate([[True], np.diff(cols["det_frame"]) != 0])
+        pos = np.searchsorted(frame_idx, cols["det_frame"][first])
+        present[pos] = True
+        cx[pos] = cols["det_cx"][first]
+        size[pos] = cols["det_size"][first]
+    return {"t": t, "present": present, "cx": cx, "size": size, "frame_w": float(frame_w)}
+
+
+def parse_grid(specs):
+    """["yaw.kp=0.2:0.6:9", "smooth=0,0.35"] → {name: 値の配列}（a:b:n は linspace）"""
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if ":" in values:
+            a, b, n = values.split(":")
+            grid[name] = np.linspace(float(a), float(b), int(n))
+        else:
+            grid[name] = np.array([float(v) for v in values.split(",")])
+    return grid
+
+
+def default_params(controller):
+    params = {name: float(getattr(controller, name)) for name in CONTROLLER_PARAMS}
+    for axis in ("yaw", "fb"):
+        pid = controller.approach_pid[axis]
+        for name in PID_PARAMS:
+            params[f"{axis}.{name}"] = float(getattr(pid, name))
+    return params
+
+
+def expand_grid(grid, defaults):
+    """全組み合わせ。{name: (P,) 配列} と組の数"""
+    for name in grid:
+        if name not in defaults:
+            raise SystemExit(f"unknown parameter {name!r} (choose from {', '.join(sorted(defaults))})")
+    names = list(grid)
+    combos = list(itertools.product(*(grid[n] for n in names))) or [()]
+    table = {name: np.full(len(combos), v) for name, v in defaults.items()}
+    for j, name in enumerate(names):
+        table[name] = np.array([c[j] for c in combos], dtype=np.float64)
+    return table, len(combos)
+
+
+def linear_scan(c, b):
+    """y[..., t] = c[..., t] * y[..., t-1] + b[..., t]（y[-1] = 0）を時刻方向に解く（c, b は書き換える）"""
+    n = b.shape[-1]
+    s = 1
+    while s < n:
+        b[..., s:] += c[..., s:] * b[..., :-s]
+        c[..., s:] *= c[..., :-s]
+        s *= 2
+    return b
+
+
+def _ema(x, a, reset):
+    """controller の smoothing（f = a f + (1-a) x）。reset のステップは f を 0 から始める"""
+    c = np.where(reset, 0.0, np.broadcast_to(a, x.shape))
+    return linear_scan(c, (1.0 - a) * x)
+
+
+def _pd(err, dt, reset, p, axis, scale, dead):
+    """PID.update（ki=0）: 不感帯なら 0、それ以外は clamp(kp*s*e + kd*s*d)。d はリセット後の1歩目は 0"""
+    kp, kd, tau, out_max = (p[f"{axis}.{n}"][:, None] for n in PID_PARAMS)
+    raw = np.zeros_like(err)
+    raw[:, 1:] = (err[:, 1:] - err[:, :-1]) / np.maximum(dt[1:], 1e-9)
+    alpha = dt / (tau + dt)
+    d = linear_scan(np.where(reset, 0.0, 1.0 - alpha), np.where(reset, 0.0, alpha * raw))
+    u = np.clip(scale * (kp * err + kd * d), -out_max, out_max)
+    return np.where(np.abs(err) <= dead, 0.0, u)
+
+
+def evaluate(seq, p, cfg, inv_yaw=False, size_ref_w=960, camera_hfov_deg=70.2):
+    """
+    p の各組（(P,) 配列の dict）で制御則を流す。
+    戻り値: yaw, fb（(P, T) の int コマンド。marker が無いフレームも含む）
+    """
+    t, present = seq["t"], seq["present"]
+    T = t.shape[0]
+    P = p["smooth"].shape[0]
+    yaw = np.zeros((P, T))
+    fb = np.zeros((P, T))
+    idx = np.flatnonzero(present)
+    if idx.size == 0:
+        return yaw, fb
+
+    # ---- マーカーが写っているステップだけで制御則を回す（(P, M)）----
+    ts = t[idx]
+    w = seq["frame_w"]
+    err_x = np.broadcast_to(seq["cx"][idx] - w / 2.0, (P, idx.size))
+    size_px = seq["size"][idx] * (size_ref_w / w)
+    size_err = p["target_size_px"][:, None] - size_px[None, :]
+    dt = np.diff(ts, prepend=ts[0])
+
+    # 見失いで stop_all されたか: 直前のフレームが欠けていて、そこで lost_stop_sec を過ぎていた
+    gap_t = np.where(idx > 0, t[np.maximum(idx - 1, 0)], ts) - np.concatenate([[ts[0]], ts[:-1]])
+    missed = np.concatenate([[True], ~present[np.maximum(idx[1:] - 1, 0)]])
+    reset = missed[None, :] & (gap_t[None, :] > p["lost_stop_sec"][:, None])
+    reset[:, 0] = True
+
+    focal_px = (size_ref_w / 2.0) / math.tan(math.radians(camera_hfov_deg) / 2.0)
+    dist_m = cfg["marker_size_m"] * focal_px / np.maximum(size_px, 1.0)
+    sched = cfg["schedule"]
+    scale_yaw = np.interp(dist_m, *zip(*sched["yaw"])) if sched.get("yaw") else 1.0
+    scale_fb = np.interp(dist_m, *zip(*sched["fb"])) if sched.get("fb") else 1.0
+
+    center_dead = p["center_dead_px"][:, None]
+    yaw_cmd = _pd(err_x, dt, reset, p, "yaw", scale_yaw, center_dead)
+    if inv_yaw:
+        yaw_cmd = -yaw_cmd
+    fb_cmd = _pd(size_err, dt, reset, p, "fb", scale_fb, p["size_dead_px"][:, None])
+    fb_cmd = np.where(fb_cmd > 0, np.maximum(p["fb_min"][:, None], fb_cmd), fb_cmd)
+    off = (np.abs(err_x) > center_dead) & (fb_cmd > 0)
+    fb_cmd = np.where(off, np.trunc(fb_cmd * p["offcenter_fb_scale"][:, None]), fb_cmd)
+
+    a = p["smooth"][:, None]
+    yaw_m = np.round(_ema(yaw_cmd, a, reset))
+    fb_m = np.round(_ema(fb_cmd, a, reset))
+
+    # ---- 全フレームに広げる: 見えていない間は前の値、lost_stop_sec を過ぎたら 0 ----
+    last = np.maximum.accumulate(np.where(present, np.arange(T), -1))
+    seen = last >= 0
+    k = np.searchsorted(idx, np.maximum(last, 0))
+    hold = seen[None, :] & ((t - t[np.maximum(last, 0)])[None, :] <= p["lost_stop_sec"][:, None])
+    yaw[:] = np.where(hold, yaw_m[:, k], 0.0)
+    fb[:] = np.where(hold, fb_m[:, k], 0.0)
+    return yaw.astype(np.int16), fb.astype(np.int16)
+
+
+def score(seq, p, yaw, fb):
+    """(P,) のスコアの dict（時間は dt で重み付け）"""
+    dt = np.diff(seq["t"], append=seq["t"][-1])
+    total = max(float(dt.sum()), 1e-9)
+    yaw = yaw.astype(np.float64)
+    fb = fb.astype(np.float64)
+    out = {}
+    for axis, cmd in (("yaw", yaw), ("fb", fb)):
+        d = np.diff(cmd, axis=1)
+        out[f"{axis}_dcmd"] = np.sqrt(np.mean(d * d, axis=1)) if d.shape[1] else np.zeros(cmd.shape[0])
+        limit = p[f"{axis}.out_max"][:, None]
+        out[f"{axis}_sat"] = ((np.abs(cmd) >= np.round(limit)) * dt).sum(axis=1) / total
+        out[f"{axis}_mean"] = (np.abs(cmd) * dt).sum(axis=1) / total
+    out["rough"] = (out["yaw_dcmd"] + out["fb_dcmd"]) / (out["yaw_mean"] + out["fb_mean"] + 1.0)
+    return out
+
+
+def reference_trace(seq, params, cfg):
+    """本物の TelloController で1ステップずつ回した (yaw, fb)（--check 用）"""
+    clock = ReplayClock()
+    c = TelloController(ReplayKeyboardState(), tello=FakeTello(clock), clock=clock)
+    c.configure_approach(cfg)
+    for name in CONTROLLER_PARAMS:
+        setattr(c, name, params[name])
+    for axis in ("yaw", "fb"):
+        pid = c.approach_pid[axis]
+        pid.ki = 0.0
+        for name in PID_PARAMS:
+            setattr(pid, name, params[f"{axis}.{name}"])
+    c.in_flight = True
+    c.set_approach(True)
+    shape = (int(seq["frame_w"] * 3 / 4), int(seq["frame_w"]), 3)
+    out = np.zeros((2, seq["t"].shape[0]), dtype=np.int16)
+    for i, t in enumerate(seq["t"]):
+        clock.t = float(t)
+        info = None
+        if seq["present"][i]:
+            info = {"id": 0, "center": (float(seq["cx"][i]), shape[0] / 2.0), "size_px": float(seq["size"][i])}
+        c.update_approach_from_aruco(info, shape)
+        out[0, i] = c.yaw
+        out[1, i] = c.fb
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Vectorized approach gain sweep over recorded marker tracks")
+    ap.add_argument("npz", nargs="+", help="batch_analyzer.py の <clip>.npz")
+    ap.add_argument("--grid", action="append", default=[], metavar="NAME=a:b:n|v1,v2,...",
+                    help="スイープするパラメータ（yaw.kp, fb.kd, smooth, center_dead_px, ...）")
+    ap.add_argument("--approach-config", metavar="FILE", default=None, help="固定するパラメータの JSON")
+    ap.add_argument("--frame-w", type=int, default=960, help="記録した映像の横幅")
+    ap.add_argument("--sort", choices=SCORES, default="rough")
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--chunk", type=int, default=2048, help="一度に評価する組の数（メモリと相談）")
+    ap.add_argument("--traces", metavar="FILE", default=None,
+                    help="パラメータ表・スコア・コマンドのトレース（先頭のクリップ）を npz で書く")
+    ap.add_argument("--check", action="store_true", help="先頭の組を TelloController と突き合わせる")
+    args = ap.parse_args()
+
+    cfg = approach_config.load(args.approach_config)
+    clock = ReplayClock()
+    base = TelloController(ReplayKeyboardState(), tello=FakeTello(clock), clock=clock)
+    base.configure_approach(cfg)
+    table, n = expand_grid(parse_grid(args.grid), default_params(base))
+    seqs = [load_markers(path, args.frame_w) for path in args.npz]
+    kw = {"inv_yaw": base.inv_yaw, "size_ref_w": base.size_ref_w, "camera_hfov_deg": base.camera_hfov_deg}
+
+    t0 = time.perf_counter()
+    scores = {k: np.zeros(n) for k in SCORES}
+    weight = 0.0
+    traces = None
+    for si, seq in enumerate(seqs):
+        dur = float(seq["t"][-1] - seq["t"][0]) if seq["t"].size else 0.0
+        if si == 0 and args.traces:
+            traces = {"yaw": np.zeros((n, seq["t"].size), np.int16), "fb": np.zeros((n, seq["t"].size), np.int16)}
+        for a in range(0, n, args.chunk):
+            b = min(n, a + args.chunk)
+            part = {k: v[a:b] for k, v in table.items()}
+            yaw, fb = evaluate(seq, part, cfg, **kw)
+            for k, v in score(seq, part, yaw, fb).items():
+                scores[k][a:b] += v * dur
+            if traces is not None:
+                traces["yaw"][a:b] = yaw
+                traces["fb"][a:b] = fb
+        weight += dur
+    for k in scores:
+        scores[k] /= max(weight, 1e-9)
+    elapsed = time.perf_counter() - t0
+    steps = sum(s["t"].size for s in seqs)
+    print(f"[SWEEP] combos:{n} clips:{len(seqs)} steps:{steps}  {elapsed:.2f}s "
+          f"({n * steps / max(elapsed, 1e-9) / 1e6:.1f}M combo-steps/s)")
+
+    swept = [name for name in table if np.unique(table[name]).size > 1]
+    order = np.argsort(scores[args.sort], kind="stable")
+    for r, i in enumerate(order[:args.top]):
+        ps = " ".join(f"{name}={table[name][i]:g}" for name in swept)
+        sc = " ".join(f"{k}:{scores[k][i]:.3f}" for k in SCORES)
+        print(f"[SWEEP] #{r + 1} {ps}  {sc}")
+
+    if args.traces:
+        np.savez_compressed(args.traces, t=seqs[0]["t"], **{f"param_{k}": v for k, v in table.items()},
+                            **{f"score_{k}": v for k, v in scores.items()},
+                            **({} if traces is None else {f"cmd_{k}": v for k, v in traces.items()}))
+        print(f"[SWEEP] traces -> {args.traces}")
+
+    if args.check:
+        ref = reference_trace(seqs[0], {k: v[0] for k, v in table.items()}, cfg)
+        yaw, fb = evaluate(seqs[0], {k: v[:1] for k, v in table.items()}, cfg, **kw)
+        diff = max(int(np.abs(ref[0] - yaw[0]).max(initial=0)), int(np.abs(ref[1] - fb[0]).max(initial=0)))
+        print(f"[SWEEP] check vs TelloController: max |diff| {diff}")
+        if diff > 1:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
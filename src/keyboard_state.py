@@ -46,3 +46,13 @@ class KeyboardState:
     def is_pressed(self, name: str) -> bool:
         """name は 'w', 'a', 'shift', 'space' など"""
         return name in self.pressed
+
+    def snapshot(self):
+        """今押されているキーのソート済みリスト（記録用）"""
+        # リスナースレッドが書き換え中だと set の反復が失敗することがあるのでリトライ
+        for _ in range(3):
+            try:
+                return sorted(self.pressed)
+            except RuntimeError:
+                continue
+        return []
@@ -0,0 +1,198 @@
+# latency_trace.py
+"""
+フレームの受信から、それに反応した RC 送信までの遅延（glass-to-command）の計測。
+
+フレームごとに FrameTrace を作って、各段の時刻（time.perf_counter）を打つ:
+
+  capture     : デコーダスレッドがパケットを受け取った
+  decoded     : packet.decode() が終わった
+  published   : BGR 変換が終わって最新フレームになった
+  acquired    : メインループが借りた
+  detected    : detector.detect() が終わった
+  marker_info : get_marker_info() が終わった
+  approach    : update_approach_from_aruco() が終わった（セミオート中だけ）
+  sent        : そのフレームの後で置いた RC が実際に送られた（RcSender の送信が終わった）
+
+区間（hop）は「ひとつ前に打たれた時刻」からの差。total は sent - capture。
+
+RC は RcSender が別スレッドで送るので、メインループは「何番の RC を置いたか」（queued）だけを
+記録し、送信スレッドがその番号以降を送ったのを poll で拾って sent を打つ。
+"""
+from collections import deque
+
+from perf_stats import Histogram
+
+
+STAMPS = ("capture", "decoded", "published", "acquired", "detected", "marker_info", "approach", "sent")
+HOPS = STAMPS[1:]
+
+# 区間用のバケット（0.1ms 〜 1s）
+LATENCY_TRACE_BOUNDS = (
+    0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.033, 0.05,
+    0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0,
+)
+
+# HUD 用の短い名前
+_SHORT = {
+    "decoded": "dec", "published": "cvt", "acquired": "wait", "detected": "det",
+    "marker_info": "mk", "approach": "app", "sent": "snd",
+}
+
+
+def _ms(v):
+    return "--" if v is None else f"{float(v) * 1000:.0f}"
+
+
+class FrameTrace:
+    """1フレーム分の時刻。打たれていない段は None"""
+
+    __slots__ = ("seq", "rc_seq") + STAMPS
+
+    def __init__(self, seq=None):
+        self.seq = seq
+        self.rc_seq = None   # このフレームの後で置いた RC の番号
+        for name in STAMPS:
+            setattr(self, name, None)
+
+    def mark(self, name, t):
+        # 同じフレームで2回目以降（重複フレームのループ）は最初の時刻を残す
+        if getattr(self, name) is None:
+            setattr(self, name, t)
+
+    def hops(self):
+        """{hop: 秒}（前の段が無ければ、その前に打たれた時刻から）"""
+        out = {}
+        prev = self.capture
+        for name in HOPS:
+            t = getattr(self, name)
+            if t is None:
+                continue
+            if prev is not None:
+                out[name] = t - prev
+            prev = t
+        return out
+
+    def total(self):
+        if self.capture is None or self.sent is None:
+            return None
+        return self.sent - self.capture
+
+    def as_dict(self):
+        """セッション記録用（ms に丸める）"""
+        d = {k: round(v * 1000, 3) for k, v in self.hops().items()}
+        total = self.total()
+        if total is not None:
+            d["total"] = round(total * 1000, 3)
+        return d
+
+
+class LatencyTracer:
+    """
+    メインループ側（1スレッド）で使う。
+
+      tr.start(frame_ref, t_acquired)   # 新しいフレームを借りたとき
+      tr.mark("detected", t)            # 各段の後
+      trace = tr.sent(t)                # その場で RC を送ったとき（終わったトレースを返す）
+
+      tr.queued(seq)                    # RcSender に RC を置いたとき
+      done = tr.poll(controller.rc_sent_ts)   # 送られたものを完了させる（終わったトレースのリスト）
+    """
+
+    def __init__(self, window=512, max_pending=8):
+        self.hops = {name: Histogram(LATENCY_TRACE_BOUNDS, window) for name in HOPS}
+        self.total = Histogram(LATENCY_TRACE_BOUNDS, window)
+        self.frames = 0
+        self.unsent = 0     # RC を送る前に次のフレームが来た（反応しなかった）数
+        self.current = None
+        self.pending = deque()   # RC を置いて送信待ちのトレース
+        self.max_pending = max_pending
+
+    def start(self, frame_ref, t_acquired):
+        if self.current is not None:
+            if self.current.rc_seq is not None:
+                self._queue(self.current)
+            else:
+                # 送信まで行かなかったフレームも、途中までの区間は記録する
+                self._finish(self.current)
+                self.unsent += 1
+        tr = FrameTrace(getattr(frame_ref, "seq", None))
+        tr.capture = getattr(frame_ref, "capture_ts", None) or None
+        tr.decoded = getattr(frame_ref, "decode_ts", None) or None
+        tr.published = getattr(frame_ref, "ts", None) or None
+        tr.acquired = t_acquired
+        self.current = tr
+        self.frames += 1
+        return tr
+
+    def mark(self, name, t):
+        if self.current is not None:
+            self.current.mark(name, t)
+
+    def sent(self, t):
+        """RC 送信。トレース中のフレームがあれば完了させて返す"""
+        tr = self.current
+        if tr is None:
+            return None
+        tr.mark("sent", t)
+        self._finish(tr)
+        self.current = None
+        return tr
+
+    def queued(self, rc_seq):
+        """RC を送信スレッドに置いた（最初の1回の番号を残す）"""
+        if self.current is not None and self.current.rc_seq is None:
+            self.current.rc_seq = rc_seq
+
+    def poll(self, sent_ts_for):
+        """
+        sent_ts_for(rc_seq) が送信時刻を返したトレースを完了させる（古い順）。
+        送信スレッドが止まっている（着陸中など）間は溜まり、max_pending を超えたら unsent に数える
+        """
+        done = []
+        if self.current is not None and self.current.rc_seq is not None:
+            self._queue(self.current)
+            self.current = None
+        while self.pending:
+            tr = self.pending[0]
+            t = sent_ts_for(tr.rc_seq)
+            if t is None:
+                break
+            self.pending.popleft()
+            tr.mark("sent", t)
+            self._finish(tr)
+            done.append(tr)
+        return done
+
+    def _queue(self, tr):
+        self.pending.append(tr)
+        while len(self.pending) > self.max_pending:
+            self._finish(self.pending.popleft())
+            self.unsent += 1
+
+    def _finish(self, tr):
+        for name, dt in tr.hops().items():
+            self.hops[name].observe(dt)
+        total = tr.total()
+        if total is not None:
+            self.total.observe(total)
+
+    # -----------------------
+    # report
+    # -----------------------
+    def snapshot(self):
+        return {
+            "frames": self.frames,
+            "unsent": self.unsent,
+            "total": self.total.snapshot(),
+            "hops": {name: h.snapshot() for name, h in self.hops.items()},
+        }
+
+    def summary(self):
+        """HUD 用の1行（total の p50/p99 と各区間の p50）"""
+        tot = self.total.percentiles((50, 99))
+        parts = [f"glass->cmd p50/p99:{_ms(tot[50])}/{_ms(tot[99])}ms"]
+        for name in HOPS:
+            p = self.hops[name].percentiles((50,))[50]
+            if p is not None:
+                parts.append(f"{_SHORT[name]}:{_ms(p)}")
+        return "  ".join(parts)
@@ -0,0 +1,159 @@
+# link_monitor.py
+"""
+Tello との通信リンクの計測。
+
+  - SDK コマンドの往復時間（takeoff / land / battery? など応答のあるもの）
+  - RC コマンドの実際の送信間隔
+  - state パケットの到着間隔のゆらぎと途切れ（TelemetryBus 側で計測）
+
+djitellopy の send_command_with_return は 0.1 秒刻みで応答を待つので、そのままでは
+往復時間が測れない。InstrumentedTello で細かく待つように置き換えて、送信直後から
+応答を受け取るまでを測る。
+"""
+import time
+
+from djitellopy import Tello
+import djitellopy.tello as _djitellopy_tello
+
+from perf_stats import Histogram, RateMeter
+
+
+RESPONSE_POLL_SEC = 0.002
+
+
+def _ms(v):
+    return "--" if v is None else f"{float(v) * 1000:.0f}"
+
+
+class LinkStats:
+    """
+    コマンド往復時間と RC 送信間隔の集計。
+      command_rtt : 応答のあったコマンドすべて
+      rtt_by_command["takeoff"] など : コマンドの先頭語ごと
+      timeouts    : 応答が来なかったコマンド数
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.command_rtt = Histogram()
+        self.rtt_by_command = {}
+        self.commands = 0
+        self.timeouts = 0
+        self.last_command = None
+
+        self.rc_interval = Histogram()
+        self.rc_rate = RateMeter(window_sec=2.0, clock=clock)
+        self.rc_sent = 0
+        self._last_rc_ts = None
+
+    def observe_command(self, command, rtt, ok=True):
+        name = command.split(" ", 1)[0]
+        self.commands += 1
+        self.last_command = (name, rtt, ok)
+        if not ok:
+            self.timeouts += 1
+            return
+        self.command_rtt.observe(rtt)
+        hist = self.rtt_by_command.get(name)
+        if hist is None:
+            hist = self.rtt_by_command[name] = Histogram(window=64)
+        hist.observe(rtt)
+
+    def observe_rc(self, ts=None):
+        ts = self.clock() if ts is None else ts
+        if self._last_rc_ts is not None:
+            self.rc_interval.observe(ts - self._last_rc_ts)
+        self._last_rc_ts = ts
+        self.rc_sent += 1
+        self.rc_rate.mark(ts)
+
+    def snapshot(self, bus=None):
+        """ログ/表示用の dict（bus を渡すと state の到着統計も入れる）"""
+        snap = {
+            "commands": self.commands,
+            "timeouts": self.timeouts,
+            "command_rtt": self.command_rtt.snapshot(),
+            "rtt_by_command": {k: h.snapshot() for k, h in self.rtt_by_command.items()},
+            "rc_sent": self.rc_sent,
+            "rc_rate": self.rc_rate.rate(),
+            "rc_interval": self.rc_interval.snapshot(),
+        }
+        if bus is not None:
+            snap["state"] = {
+                "packets": bus.packets,
+                "rate": bus.rate.rate(),
+                "interarrival": bus.interarrival.snapshot(),
+                "jitter": bus.jitter.snapshot(),
+                "gaps": bus.gaps,
+                "max_gap": bus.max_gap,
+                "silence": bus.silence(),
+            }
+        return snap
+
+    def summary(self, bus=None):
+        """1行の要約（HUD / ログ用）"""
+        rtt = self.command_rtt.snapshot()
+        rci = self.rc_interval.snapshot()
+        line = (f"cmd rtt p50/p99:{_ms(rtt['p50'])}/{_ms(rtt['p99'])}ms  to:{self.timeouts}"
+                f"  rc:{self.rc_rate.rate():.0f}Hz p99:{_ms(rci['p99'])}ms")
+        if bus is not None:
+            jit = bus.jitter.snapshot()
+            line += (f"  state:{bus.rate.rate():.1f}Hz jit p99:{_ms(jit['p99'])}ms"
+                     f"  gaps:{bus.gaps} max:{_ms(bus.max_gap if bus.gaps else None)}ms")
+            silence = bus.silence()
+            if silence is not None and silence >= bus.gap_sec:
+                line += f"  NO STATE {silence:.1f}s"
+        return line
+
+
+class InstrumentedTello(Tello):
+    """
+    コマンド往復時間と RC 送信を LinkStats に記録する Tello。
+    応答待ちの中身は djitellopy と同じ（コマンド間隔の確保、タイムアウト時のメッセージ）。
+    """
+
+    def __init__(self, *args, link_stats=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.link_stats = link_stats if link_stats is not None else LinkStats()
+
+    def send_command_with_return(self, command, timeout=Tello.RESPONSE_TIMEOUT):
+        diff = time.time() - self.last_received_command_timestamp
+        if diff < self.TIME_BTW_COMMANDS:
+            time.sleep(diff)
+
+        self.LOGGER.info("Send command: '{}'".format(command))
+        responses = self.get_own_udp_object()["responses"]
+        # 前のコマンドのタイムアウト後に遅れて来た応答は捨てる
+        responses.clear()
+
+        clock = self.link_stats.clock
+        t_send = clock()
+        _djitellopy_tello.client_socket.sendto(command.encode("utf-8"), self.address)
+
+        while not responses:
+            if clock() - t_send > timeout:
+                self.link_stats.observe_command(command, clock() - t_send, ok=False)
+                message = "Aborting command '{}'. Did not receive a response after {} seconds".format(command, timeout)
+                self.LOGGER.warning(message)
+                return message
+            time.sleep(RESPONSE_POLL_SEC)
+        rtt = clock() - t_send
+        self.link_stats.observe_command(command, rtt, ok=True)
+
+        self.last_received_command_timestamp = time.time()
+
+        first_response = responses.pop(0)
+        try:
+            response = first_response.decode("utf-8")
+        except UnicodeDecodeError as e:
+            self.LOGGER.error(e)
+            return "response decode error"
+        response = response.rstrip("\r\n")
+
+        self.LOGGER.info("Response {}: '{}' ({:.1f} ms)".format(command, response, rtt * 1000))
+        return response
+
+    def send_command_without_return(self, command):
+        super().send_command_without_return(command)
+        if command.startswith("rc "):
+            self.link_stats.observe_rc()
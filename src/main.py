@@ -1,15 +1,21 @@
 # main.py
+import argparse
 import time
 import cv2
 import numpy as np
 import threading
 from cv2 import aruco
 
+import approach_config
 from tello_controller import TelloController
 from aruco_detector import ArUcoDetector
 from ui_overlay import DroneUI
 from keyboard_state import KeyboardState
 from ui_components.display_manager import DisplayManager
+from session_recorder import SessionRecorder
+from metrics_server import LoopMetrics, MetricsServer
+from latency_trace import LatencyTracer
+from profiler import PROFILER, span
 
 import inspect
 
@@ -21,47 +27,58 @@ def safe_call(fn, default=None):
         return default
 
 
-def main():
+def main(record_dir=None, host=None, command_port=None, stream_governor=True, metrics_port=None,
+         trace_path=None, rc_hz=None, async_client=False, approach_config_path=None, watchdog=True):
     print("[USING CONTROLLER FILE]", inspect.getfile(TelloController))
     print("[USING CONTROLLER SRC HEAD]", inspect.getsource(TelloController)[:200])
 
     kb = KeyboardState()
-    controller = TelloController(kb)
+    controller = TelloController(kb, host=host, command_port=command_port, async_client=async_client)
+    controller.stream_governor_enabled = stream_governor
+    controller.watchdog_enabled = watchdog
+    if rc_hz:
+        controller.rc_rate_hz = float(rc_hz)
+    if approach_config_path:
+        controller.configure_approach(approach_config.load(approach_config_path))
     detector = ArUcoDetector()
     ui = DroneUI(panel_width=260, bottom_margin=60)
 
-    # ArUco params
-    try:
-        aruco_params = aruco.DetectorParameters()
-    except AttributeError:
-        aruco_params = aruco.DetectorParameters_create()
-
-    aruco_params.adaptiveThreshWinSizeMin = 3
-    aruco_params.adaptiveThreshWinSizeMax = 53
-    aruco_params.adaptiveThreshWinSizeStep = 4
-    aruco_params.minMarkerPerimeterRate = 0.02
-    aruco_params.maxMarkerPerimeterRate = 5.0
-    try:
-        aruco_params.cornerRefinementMethod = aruco.CORNER_REFINE_SUBPIX
-    except Exception:
-        pass
-    aruco_dict = aruco.getPredefinedDictionary(aruco.DICT_4X4_50)
-
     threading.Thread(target=controller.connect_and_start_stream, daemon=True).start()
 
-    print("Controls: t=takeoff, g=land, p=approach ON/OFF, z=quit")
+    print("Controls: t=takeoff, g=land, p=approach ON/OFF, m=approach mode, b=battery, o=video on/off, "
+          "v=stream stats, n=link stats, l=latency, z=quit")
+
+    # セッション記録（session_replay.py で再生できる）
+    recorder = SessionRecorder(record_dir) if record_dir else None
+    if recorder is not None:
+        print(f"[RECORD] {record_dir}")
+
+    # 区間プロファイル（--trace のときだけ。終了時に Chrome Trace JSON を書く）
+    if trace_path:
+        PROFILER.enable()
+
+    # フレーム受信 → RC 送信の遅延（HUD の [L] と、記録時は latency.json）
+    tracer = LatencyTracer()
+
+    # ループ計測（--metrics-port のときだけ HTTP で公開）
+    loop_metrics = LoopMetrics()
+    metrics_server = None
+    if metrics_port is not None:
+        try:
+            metrics_server = MetricsServer(loop_metrics, controller, port=metrics_port).start()
+        except OSError as e:
+            print("[METRICS] server start failed:", e)
 
     prev_height = None
     total_alt = 0.0
     aruno_id = None
     aruno_last = None
 
+    # 位置は controller.estimator（state_estimator.py）の推定を表示する
     pos_xy = np.array([-1.8, 0.5], dtype=float)
-    vel_xy = np.array([0.0, 0.0], dtype=float)
+    pos_std = None
     POS_RANGE_X = 25.0
     POS_RANGE_Y = 35.0
-    prev_time = time.perf_counter()
-    ACCEL_DEADZONE = 0.09
 
     dm = DisplayManager(
         window_name="Tello UI",
@@ -76,13 +93,16 @@ def main():
     blank_frame = np.zeros((480, 640, 3), dtype=np.uint8)
     frame_count = 0
 
+    last_frame_seq = None
+    marker_info = None
+    marker_capture_ts = None   # marker_info を出したフレームの撮影時刻（遅延補償用）
+
     while True:
-        marker_info = None
 
         frame_count += 1
         now = time.perf_counter()
-        dt = max(1e-3, now - prev_time)
-        prev_time = now
+        loop_metrics.begin(now)
+        loop_t0 = PROFILER.now()
 
         DISPLAY_W, DISPLAY_H, UI_W = dm.update()
 
@@ -92,57 +112,67 @@ def main():
 
         connected = getattr(controller, "frame_read", None) is not None
 
-        frame = None
+        # プールのバッファを借りる（ループの最後で release）。コピーはしない
+        frame_ref = None
         if connected:
-            frame = safe_call(controller.get_frame, None)
-        if frame is None or frame.size == 0:
-            frame = blank_frame.copy()
+            with span("capture"):
+                frame_ref = safe_call(controller.acquire_frame, None)
+        if frame_ref is not None:
+            frame = frame_ref.array
+            duplicate = frame_ref.seq == last_frame_seq
+            last_frame_seq = frame_ref.seq
+            if not duplicate:
+                tracer.start(frame_ref, time.perf_counter())
+                marker_capture_ts = (getattr(frame_ref, "capture_ts", 0.0) or getattr(frame_ref, "decode_ts", 0.0)
+                                     or getattr(frame_ref, "ts", 0.0) or None)
+        else:
+            # 映像なし：黒フレームをそのまま使う（検出しても何も描かれない）
+            frame = blank_frame
+            duplicate = False
+            last_frame_seq = None
+            marker_capture_ts = None
+
+        if recorder is not None and frame_ref is not None:
+            recorder.write_frame(frame, duplicate=duplicate)
+        loop_metrics.mark("capture")
 
         # ---- ArUco detect ----
-        ids = None
-        corners = None
-        marker_info = None
-
-        try:
-            frame = np.ascontiguousarray(frame)
-
-            def _run_detect(src):
-                try:
-                    return aruco.detectMarkers(src, aruco_dict, parameters=aruco_params)
-                except AttributeError:
-                    if hasattr(aruco, "ArucoDetector"):
-                        ad = aruco.ArucoDetector(aruco_dict, aruco_params)
-                        return ad.detectMarkers(src)
-                    return (None, None, None)
-
-            c, i, _ = _run_detect(frame)
-            if i is None or len(i) == 0:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                c, i, _ = _run_detect(gray)
-
-            corners, ids = c, i
-
-            if ids is not None and len(ids) > 0:
-                aruco.drawDetectedMarkers(frame, corners, ids)
-                aruno_id = int(ids.flatten()[0])
-                aruno_last = aruno_id
-            else:
-                aruno_id = None
-
-            marker_info = detector.get_marker_info(
-                ids, corners, target_id=getattr(controller, "target_aruco_id", None)
-            )
+        # 同じフレームが2回来たら前回の結果を使う（バッファには描画済みなので再検出しない）
+        if not duplicate:
+            ids = None
+            corners = None
+            marker_info = None
 
-            # ★目視デバッグ：マーカー中心に点＋誤差線
-            if marker_info is not None:
-                cx, cy = marker_info["center"]
-                cv2.circle(frame, (int(cx), int(cy)), 6, (0, 255, 255), -1, cv2.LINE_AA)  # 黄色点
-                midx = frame.shape[1] // 2
-                cv2.line(frame, (midx, int(cy)), (int(cx), int(cy)), (0, 255, 255), 2, cv2.LINE_AA)
-
-        except Exception as e:
-            if frame_count % 60 == 0:
-                print(f"[WARN] ArUco detect failed: {e}")
+            try:
+                frame = np.ascontiguousarray(frame)
+                with span("detect"):
+                    corners, ids = detector.detect(frame)
+                tracer.mark("detected", time.perf_counter())
+
+                if ids is not None and len(ids) > 0:
+                    aruco.drawDetectedMarkers(frame, corners, ids)
+                    aruno_id = int(ids.flatten()[0])
+                    aruno_last = aruno_id
+                else:
+                    aruno_id = None
+
+                loop_metrics.detection(ids is not None and len(ids) > 0)
+                marker_info = detector.get_marker_info(
+                    ids, corners, target_id=getattr(controller, "target_aruco_id", None)
+                )
+                tracer.mark("marker_info", time.perf_counter())
+
+                # ★目視デバッグ：マーカー中心に点＋誤差線
+                if marker_info is not None:
+                    cx, cy = marker_info["center"]
+                    cv2.circle(frame, (int(cx), int(cy)), 6, (0, 255, 255), -1, cv2.LINE_AA)  # 黄色点
+                    midx = frame.shape[1] // 2
+                    cv2.line(frame, (midx, int(cy)), (int(cx), int(cy)), (0, 255, 255), 2, cv2.LINE_AA)
+
+            except Exception as e:
+                if frame_count % 60 == 0:
+                    print(f"[WARN] ArUco detect failed: {e}")
+        loop_metrics.mark("detect")
 
         # ---- telemetry ----
         yaw = pitch = roll = None
@@ -153,82 +183,48 @@ def main():
         temp = None
         flight_time = None
 
+        t_tel = PROFILER.now()
+        tm = controller.telemetry if connected else None
         if connected:
-            t = controller.tello
+            controller.update_history()
+        if tm is not None:
+            yaw = None if tm.yaw is None else -float(tm.yaw)
+            pitch = tm.pitch
+            roll = tm.roll
 
-            yaw = safe_call(t.get_yaw, None)
-            if yaw is not None:
-                try:
-                    yaw = -float(yaw)
-                except Exception:
-                    pass
-            pitch = safe_call(t.get_pitch, None)
-            roll = safe_call(t.get_roll, None)
-
-            height = safe_call(t.get_height, None)
-            battery = safe_call(t.get_battery, None)
+            height = tm.h
+            battery = tm.bat
 
             if height is not None:
                 if prev_height is not None:
-                    try:
-                        total_alt += abs(float(height) - float(prev_height))
-                    except Exception:
-                        pass
+                    total_alt += abs(height - prev_height)
                 prev_height = height
 
-            st = safe_call(t.get_current_state, {})
+            if tm.agx is not None and tm.agy is not None and tm.agz is not None:
+                agx, agy, agz = int(tm.agx), int(tm.agy), int(tm.agz)
 
-            try:
-                agx = int(float(st.get("agx", 0)))
-                agy = int(float(st.get("agy", 0)))
-                agz = int(float(st.get("agz", 0)))
-            except Exception:
-                agx = agy = agz = None
+            temp = tm.temp
+            flight_time = tm.time
+            speed = tm.speed
 
-            try:
-                templ = float(st.get("templ", 0))
-                temph = float(st.get("temph", 0))
-                temp = (templ + temph) / 2.0
-            except Exception:
-                temp = None
+        est = controller.update_estimate() if connected else None
+        if est is not None:
+            pos_xy = est.pos[:2]
+            pos_std = est.pos_std[:2]
+        PROFILER.complete("telemetry", t_tel)
 
-            try:
-                flight_time = int(float(st.get("time", 0)))
-            except Exception:
-                flight_time = None
+        loop_metrics.mark("telemetry")
 
-            try:
-                vgx = float(st.get("vgx", 0))
-                vgy = float(st.get("vgy", 0))
-                vgz = float(st.get("vgz", 0))
-                speed = (vgx * vgx + vgy * vgy + vgz * vgz) ** 0.5
-            except Exception:
-                speed = None
-
-            # 加速度積分（UI用）
-            if agx is not None and agy is not None:
-                try:
-                    ax_body = float(agx) * 0.01
-                    ay_body = float(agy) * 0.01
-                    yaw_rad = np.deg2rad(float(yaw)) if yaw is not None else 0.0
-                    c = np.cos(yaw_rad)
-                    s = np.sin(yaw_rad)
-                    ax = (c * ay_body) - (s * ax_body)
-                    ay = -((s * ay_body) + (c * ax_body))
-
-                    if abs(ax) < ACCEL_DEADZONE and abs(ay) < ACCEL_DEADZONE:
-                        vel_xy[:] = 0.0
-                    else:
-                        vel_xy[0] += ax * dt
-                        vel_xy[1] += ay * dt
-                        vel_xy *= 0.985
-                    pos_xy += vel_xy * dt
-                    pos_xy[0] = np.clip(pos_xy[0], -POS_RANGE_X, POS_RANGE_X)
-                    pos_xy[1] = np.clip(pos_xy[1], -POS_RANGE_Y, POS_RANGE_Y)
-                except Exception:
-                    pass
+        stream_health = None
+        if connected and ui.stream_health_enabled:
+            stream_health = safe_call(controller.get_stream_health, None)
+        latency = tracer.summary() if ui.latency_enabled else None
+        link_stats = None
+        if connected and ui.link_stats_enabled:
+            link_stats = safe_call(controller.get_link_summary, None)
 
         # ---- UI ----
+        t_ui = PROFILER.now()
         out = ui.compose_side(
             frame,
             display_w=DISPLAY_W,
@@ -249,6 +245,11 @@ def main():
             flight_time=flight_time,
             pos_xy=pos_xy,
             pos_range=(POS_RANGE_X, POS_RANGE_Y),
+            pos_std=pos_std,
+            stream_health=stream_health,
+            link_stats=link_stats,
+            latency=latency,
+            jobs=controller.get_command_status() if connected else None,
 
             # ★セミオート状態（UIに出す）
             approach_enabled=controller.approach_enabled,
@@ -257,14 +258,34 @@ def main():
             approach_yaw=getattr(controller, "approach_yaw", None),
             approach_err_x=getattr(controller, "approach_err_x", None),
             approach_size_px=getattr(controller, "approach_size_px", None),
+            approach_age=getattr(controller, "approach_age", None),
+            approach_comp_px=getattr(controller, "approach_comp_px", None),
+            approach_mode=getattr(controller, "approach_mode", None),
+            approach_lr=getattr(controller, "approach_lr", None),
+            approach_ud=getattr(controller, "approach_ud", None),
+            approach_converge_sec=getattr(controller, "approach_converge_sec", None),
         )
-
-        out = dm.fit(out)
-        cv2.imshow(dm.window_name, out)
-
-        key = cv2.waitKey(1) & 0xFF
+        PROFILER.complete("compose_side", t_ui)
+        # compose_side でコピー済みなのでバッファはここで返す
+        if frame_ref is not None:
+            frame_ref.release()
+
+        with span("dm.fit"):
+            out = dm.fit(out)
+        with span("imshow"):
+            cv2.imshow(dm.window_name, out)
+
+        with span("waitKey"):
+            key = cv2.waitKey(1) & 0xFF
+        loop_metrics.mark("ui")
         if key == ord("z"):
             break
+        if key == ord("v"):
+            ui.stream_health_enabled = not ui.stream_health_enabled
+        if key == ord("n"):
+            ui.link_stats_enabled = not ui.link_stats_enabled
+        if key == ord("l"):
+            ui.latency_enabled = not ui.latency_enabled
 
         if connected:
             should_quit = controller.handle_key(key)
@@ -272,22 +293,111 @@ def main():
                 break
 
         # ---- RC control ----
+        rc_sent = None
+        trace_done = None
+        approach_comp = None
         if controller.in_flight:
             # 1) 手動入力反映
             controller.update_motion_from_keyboard()
 
             # 2) セミオートがONなら上書き（manual_active() 内で手動なら無効化）
             if getattr(controller, "approach_enabled", False):
-                controller.update_approach_from_aruco(marker_info, frame.shape)
+                controller.update_approach_from_aruco(marker_info, frame.shape, capture_ts=marker_capture_ts)
+                if controller.approach_age is not None:
+                    # リプレイで同じ補償をかけるため
+                    approach_comp = {"age": controller.approach_age, "px": controller.approach_comp_px}
+                tracer.mark("approach", time.perf_counter())
 
-            # 3) 送信（毎フレーム）
+            # 3) 最新値を置く（送信は RcSender が一定周期で行う）
             controller.update_motion()
+            rc_sent = controller.last_rc
+            loop_metrics.rc_update()
+            tracer.queued(controller.last_rc_seq)
+
+        # 置いた RC が実際に送られたフレームのトレースを完了させる
+        done = tracer.poll(controller.rc_sent_ts)
+        if done:
+            trace_done = done[-1]
+
+        controller.history.add_loop(
+            now,
+            rc=rc_sent,
+            marker_info=marker_info,
+            det_n=0 if ids is None else len(ids),
+            err_x=controller.approach_err_x,
+        )
 
-        time.sleep(0.02)
+        if recorder is not None:
+            recorder.write_event(
+                connected=connected,
+                state=tm.as_dict() if tm is not None else None,
+                pressed=kb.snapshot(),
+                key=key,
+                in_flight=controller.in_flight,
+                rc=rc_sent,
+                latency=trace_done.as_dict() if trace_done is not None else None,
+                comp=approach_comp,
+            )
 
+        if connected:
+            controller.update_stream_governor(time.perf_counter() - now)
+        loop_metrics.mark("control")
+
+        with span("sleep"):
+            time.sleep(0.02)
+        PROFILER.complete("loop", loop_t0)
+
+    if recorder is not None:
+        recorder.write_json("latency.json", tracer.snapshot())
+        recorder.close()
+    if metrics_server is not None:
+        metrics_server.stop()
+    if trace_path:
+        PROFILER.dump(trace_path)
     controller.cleanup()
     cv2.destroyAllWindows()
 
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Tello UI")
+    ap.add_argument("--record", metavar="DIR", default=None,
+                    help="セッション（映像・テレメトリ・キー・RC）を DIR に記録する")
+    ap.add_argument("--host", default=None, help="Tello のアドレス（fake_drone.py なら 127.0.0.1）")
+    ap.add_argument("--command-port", type=int, default=None, help="コマンドポート（既定 8889）")
+    ap.add_argument("--no-stream-governor", action="store_true",
+                    help="映像の解像度/FPS/ビットレート自動調整を無効にする")
+    ap.add_argument("--metrics-port", type=int, default=None, metavar="PORT",
+                    help="127.0.0.1:PORT/metrics で計測値を OpenMetrics 形式で公開する")
+    ap.add_argument("--trace", metavar="FILE", default=None,
+                    help="区間プロファイルを取り、終了時に Chrome Trace JSON として FILE に書く")
+    ap.add_argument("--rc-hz", type=float, default=None,
+                    help="RC の送信周期（既定 20Hz。UI ループの速さとは無関係）")
+    ap.add_argument("--async-client", action="store_true",
+                    help="djitellopy の代わりに asyncio の UDP クライアント（tello_async.py）を使う")
+    ap.add_argument("--no-watchdog", action="store_true",
+                    help="見張りスレッド（RC が止まったらホバリング、state 途絶・電池切れで着陸）を使わない")
+    ap.add_argument("--approach-config", metavar="FILE", default=None,
+                    help="セミオートの PID / ゲインスケジュールを JSON で上書きする（approach_config.py）")
+    ap.add_argument("--sim", nargs="?", type=float, const=1.0, default=None, metavar="SPEED",
+                    help="ローカルのシミュレータ（drone_sim.py）を起動して繋ぐ（SPEED は時間の倍率）")
+    args = ap.parse_args()
+    sim = None
+    if args.sim is not None:
+        from drone_sim import SimDrone
+        sim = SimDrone(speed=args.sim).start()
+        args.host, args.command_port = "127.0.0.1", sim.command_port
+        print(f"[SIM] simulator on 127.0.0.1:{sim.command_port} speed x{args.sim:g}")
+    main(
+        record_dir=args.record,
+        host=args.host,
+        command_port=args.command_port,
+        stream_governor=not args.no_stream_governor,
+        metrics_port=args.metrics_port,
+        trace_path=args.trace,
+        rc_hz=args.rc_hz,
+        async_client=args.async_client,
+        approach_config_path=args.approach_config,
+        watchdog=not args.no_watchdog,
+    )
+    if sim is not None:
+        sim.stop()
@@ -0,0 +1,276 @@
+# metrics_server.py
+"""
+ループとフライトの計測値を OpenMetrics 形式で出す HTTP エンドポイント（任意）。
+
+  python main.py --metrics-port 9464
+  curl http://127.0.0.1:9464/metrics
+
+メインループは LoopMetrics に観測を入れるだけ（ヒストグラム/カウンタに集計済みの値）。
+テキストの組み立てはスクレイプ側のスレッドで行うので、スクレイプがループを止めることはない。
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from perf_stats import Histogram, RateMeter
+
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# ループの区間（main.py の順番）
+LOOP_STAGES = ("capture", "detect", "telemetry", "ui", "control")
+
+# ループ区間用のバケット（0.1ms 〜 0.2s）
+STAGE_BOUNDS = (
+    0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.033, 0.05, 0.1, 0.2,
+)
+
+
+class LoopMetrics:
+    """
+    メインループ側の集計。
+
+      lm.begin(now)          # ループ先頭
+      lm.mark("capture")     # 区間の終わりごと（前の mark からの経過を記録）
+      lm.detection(hit)      # 新しいフレームを検出したとき
+      lm.rc_update()         # RC の最新値を RcSender に置いたとき（送信は RcSender のスレッド）
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.stages = {name: Histogram(STAGE_BOUNDS) for name in LOOP_STAGES}
+        self.loop_time = Histogram(STAGE_BOUNDS)
+        self.loop_rate = RateMeter(window_sec=2.0, clock=clock)
+        self.rc_update_rate = RateMeter(window_sec=2.0, clock=clock)
+
+        self.loops = 0
+        self.detect_frames = 0
+        self.detect_hits = 0
+        self.rc_updates = 0
+
+        self._t_begin = None
+        self._t_mark = None
+
+    def begin(self, now=None):
+        now = self.clock() if now is None else now
+        if self._t_begin is not None:
+            self.loop_time.observe(now - self._t_begin)
+        self._t_begin = self._t_mark = now
+        self.loops += 1
+        self.loop_rate.mark(now)
+
+    def mark(self, stage):
+        now = self.clock()
+        if self._t_mark is not None:
+            self.stages[stage].observe(now - self._t_mark)
+        self._t_mark = now
+
+    def detection(self, hit):
+        self.detect_frames += 1
+        if hit:
+            self.detect_hits += 1
+
+    def rc_update(self):
+        self.rc_updates += 1
+        self.rc_update_rate.mark()
+
+
+# -----------------------
+# OpenMetrics text
+# -----------------------
+def _fmt(v):
+    if v is None:
+        return "NaN"
+    if isinstance(v, int):
+        return str(v)
+    return repr(float(v))
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+class _Writer:
+    def __init__(self, prefix="tello_"):
+        self.prefix = prefix
+        self.lines = []
+        self._declared = set()
+
+    def _meta(self, name, kind, help_text, unit=None):
+        if name in self._declared:
+            return
+        self._declared.add(name)
+        self.lines.append(f"# TYPE {name} {kind}")
+        if unit:
+            self.lines.append(f"# UNIT {name} {unit}")
+        self.lines.append(f"# HELP {name} {help_text}")
+
+    def gauge(self, name, value, help_text, labels=None, unit=None):
+        name = self.prefix + name
+        self._meta(name, "gauge", help_text, unit)
+        self.lines.append(f"{name}{_labels(labels)} {_fmt(value)}")
+
+    def counter(self, name, value, help_text, labels=None):
+        name = self.prefix + name
+        self._meta(name, "counter", help_text)
+        self.lines.append(f"{name}_total{_labels(labels)} {_fmt(value)}")
+
+    def histogram(self, name, hist, help_text, labels=None, unit=None):
+        """perf_stats.Histogram のバケット（区間ごと）を累積にして出す"""
+        name = self.prefix + name
+        self._meta(name, "histogram", help_text, unit)
+        with hist.lock:
+            counts = list(hist.counts)
+            count, total = hist.count, hist.sum
+        labels = dict(labels or {})
+        acc = 0
+        for bound, c in zip(hist.bounds, counts):
+            acc += c
+            self.lines.append(f"{name}_bucket{_labels({**labels, 'le': repr(bound)})} {acc}")
+        self.lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {count}")
+        self.lines.append(f"{name}_count{_labels(labels)} {count}")
+        self.lines.append(f"{name}_sum{_labels(labels)} {_fmt(total)}")
+
+    def text(self):
+        return "\n".join(self.lines + ["# EOF", ""])
+
+
+def render_openmetrics(loop_metrics, controller=None):
+    """集計済みの値から OpenMetrics テキストを作る（スクレイプ側のスレッドで呼ぶ）"""
+    lm = loop_metrics
+    w = _Writer()
+
+    w.gauge("loop_fps", lm.loop_rate.rate(), "Main loop iterations per second")
+    w.counter("loop_iterations", lm.loops, "Main loop iterations")
+    w.histogram("loop_seconds", lm.loop_time, "Main loop period", unit="seconds")
+    for stage, hist in lm.stages.items():
+        w.histogram("loop_stage_seconds", hist, "Time spent per loop stage", {"stage": stage}, unit="seconds")
+
+    w.counter("detect_frames", lm.detect_frames, "Frames run through ArUco detection")
+    w.counter("detect_hits", lm.detect_hits, "Frames with at least one marker")
+    ratio = (lm.detect_hits / lm.detect_frames) if lm.detect_frames else None
+    w.gauge("detect_hit_ratio", ratio, "Detection hit rate since start")
+
+    w.counter("rc_updates", lm.rc_updates, "RC values placed for the sender by the main loop")
+    w.gauge("rc_update_rate", lm.rc_update_rate.rate(), "RC values placed per second by the main loop")
+
+    if controller is not None:
+        fr = getattr(controller, "frame_read", None)
+        if fr is not None and hasattr(fr, "age"):
+            w.histogram("frame_age_seconds", fr.age, "Frame age when consumed", unit="seconds")
+            w.gauge("video_decode_fps", fr.decode_rate.rate(), "Decoded frames per second")
+            decoded, consumed, dropped = fr.counters()
+            w.counter("video_frames_decoded", decoded, "Decoded video frames")
+            w.counter("video_frames_dropped", dropped, "Decoded frames never consumed")
+
+        bus = getattr(controller, "telemetry_bus", None)
+        if bus is not None:
+            w.counter("telemetry_packets", bus.packets, "State packets received")
+            w.gauge("telemetry_rate", bus.rate.rate(), "State packets per second")
+            w.histogram("telemetry_interarrival_seconds", bus.interarrival,
+                        "State packet inter-arrival time", unit="seconds")
+            w.histogram("telemetry_jitter_seconds", bus.jitter,
+                        "Change between consecutive state inter-arrival times", unit="seconds")
+            w.counter("telemetry_gaps", bus.gaps, "State packet gaps longer than gap_sec")
+
+        link = getattr(controller, "link_stats", None)
+        if link is not None:
+            w.histogram("command_rtt_seconds", link.command_rtt,
+                        "SDK command round-trip time", unit="seconds")
+            w.counter("command_timeouts", link.timeouts, "SDK commands without a response")
+            w.histogram("rc_interval_seconds", link.rc_interval,
+                        "Interval between rc packets actually sent", unit="seconds")
+
+        sender = getattr(controller, "rc_sender", None)
+        if sender is not None:
+            w.gauge("rc_sender_rate_hz", sender.rate_hz, "Target rc send rate")
+            w.counter("rc_sent", sender.sent, "send_rc_control calls made by the rc sender thread")
+            w.counter("rc_sender_late", sender.late, "rc ticks skipped because the sender ran late")
+            w.counter("rc_sender_errors", sender.errors, "rc sends that raised")
+            w.histogram("rc_sender_jitter_seconds", sender.jitter,
+                        "Deviation of the rc send interval from the target period", unit="seconds")
+
+        wd = getattr(controller, "watchdog", None)
+        if wd is not None:
+            for kind, n in wd.counts.items():
+                w.counter(f"watchdog_{kind}_interventions", n, f"Safety watchdog interventions ({kind})")
+            w.gauge("watchdog_hovering", int(wd.hovering), "1 while the watchdog holds rc at zero")
+            w.histogram("watchdog_reaction_seconds", wd.reaction,
+                        "Time from a watchdog condition becoming true to the intervention completing "
+                        "(rc zeroed for stale; land job finished for link/battery)", unit="seconds")
+
+        comp = getattr(controller, "approach_comp", None)
+        if comp is not None:
+            w.histogram("approach_frame_age_seconds", comp["age"],
+                        "Age of the frame used by the approach controller", unit="seconds")
+            w.histogram("approach_comp_shift_pixels", comp["shift_px"],
+                        "Magnitude of the latency compensation applied to err_x", unit="pixels")
+
+        conv = getattr(controller, "approach_converge", None)
+        if conv is not None:
+            w.histogram("approach_converge_seconds", conv,
+                        "Time from approach ON to a settled HOLD", unit="seconds")
+
+        for axis, hist in (getattr(controller, "approach_step", None) or {}).items():
+            w.histogram(f"approach_{axis}_rise_seconds", hist["rise"],
+                        f"Step response rise time of the {axis} axis per approach", unit="seconds")
+            w.histogram(f"approach_{axis}_overshoot_ratio", hist["overshoot"],
+                        f"Step response overshoot of the {axis} axis relative to the initial error")
+            w.histogram(f"approach_{axis}_settle_seconds", hist["settle"],
+                        f"Step response settling time of the {axis} axis per approach", unit="seconds")
+
+        tm = getattr(controller, "telemetry", None)
+        if tm is not None:
+            w.gauge("battery_percent", tm.bat, "Battery level")
+            w.gauge("temperature_celsius", tm.temp, "Average of templ/temph", unit="celsius")
+            w.gauge("height_cm", tm.h, "Height from the state packet")
+
+    return w.text()
+
+
+# -----------------------
+# HTTP
+# -----------------------
+class MetricsServer:
+    """127.0.0.1 にだけ bind する /metrics サーバ（デーモンスレッド）"""
+
+    def __init__(self, loop_metrics, controller=None, host="127.0.0.1", port=9464):
+        self.loop_metrics = loop_metrics
+        self.controller = controller
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                try:
+                    body = render_openmetrics(server.loop_metrics, server.controller).encode("utf-8")
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass  # スクレイプごとのログは出さない
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.address = self.httpd.server_address
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        print(f"[METRICS] http://{self.address[0]}:{self.address[1]}/metrics")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,114 @@
+# perf_stats.py
+"""
+計測用の小さな部品（カウンタ/ヒストグラム/レート）。
+どれもスレッドから observe して、UI やログ側から snapshot() で読む想定。
+"""
+import bisect
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+# 秒単位のレイテンシ用バケット境界（0.5ms 〜 5s, 対数っぽく）
+LATENCY_BOUNDS = (
+    0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.033, 0.05, 0.075,
+    0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0,
+)
+
+
+class Histogram:
+    """
+    固定バケットの累積ヒストグラム + 直近 window 個のサンプル（パーセンタイル用）。
+
+    counts[i] は bounds[i-1] < v <= bounds[i] の個数（最後は +Inf）。
+    """
+
+    def __init__(self, bounds=LATENCY_BOUNDS, window=512):
+        self.bounds = tuple(float(b) for b in bounds)
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+        self._ring = np.zeros(int(window), dtype=np.float64)
+        self._n = 0
+
+    def observe(self, v):
+        v = float(v)
+        i = bisect.bisect_left(self.bounds, v)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += v
+            if v > self.max:
+                self.max = v
+            self._ring[self._n % self._ring.shape[0]] = v
+            self._n += 1
+
+    def recent(self):
+        """直近のサンプル（コピー）"""
+        with self.lock:
+            n = min(self._n, self._ring.shape[0])
+            return self._ring[:n].copy()
+
+    def percentiles(self, qs=(50, 90, 99)):
+        r = self.recent()
+        if r.size == 0:
+            return {q: None for q in qs}
+        vals = np.percentile(r, qs)
+        return {q: float(v) for q, v in zip(qs, vals)}
+
+    def snapshot(self):
+        with self.lock:
+            counts = list(self.counts)
+            count, total, vmax = self.count, self.sum, self.max
+        p = self.percentiles()
+        return {
+            "count": count,
+            "sum": total,
+            "mean": (total / count) if count else None,
+            "max": vmax if count else None,
+            "p50": p[50],
+            "p90": p[90],
+            "p99": p[99],
+            "bounds": self.bounds,
+            "counts": counts,
+        }
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.count = 0
+            self.sum = 0.0
+            self.max = 0.0
+            self._n = 0
+
+
+class RateMeter:
+    """直近 window_sec 秒のイベント数から毎秒レートを出す"""
+
+    def __init__(self, window_sec=1.0, clock=time.perf_counter):
+        self.window_sec = window_sec
+        self.clock = clock
+        self.lock = threading.Lock()
+        self._ts = deque()
+
+    def mark(self, now=None):
+        now = self.clock() if now is None else now
+        with self.lock:
+            self._ts.append(now)
+            self._trim(now)
+
+    def _trim(self, now):
+        lim = now - self.window_sec
+        while self._ts and self._ts[0] < lim:
+            self._ts.popleft()
+
+    def rate(self, now=None):
+        now = self.clock() if now is None else now
+        with self.lock:
+            self._trim(now)
+            return len(self._ts) / self.window_sec
@@ -0,0 +1,115 @@
+# pid.py
+"""
+セミオートの各軸で使う PID と、ステップ応答の計測。
+
+  pid = PID(kp=0.35, kd=0.03, out_max=60, i_max=15)
+  u = pid.update(err, now, scale=gains_at(schedule, dist_m))   # スケジュールの倍率は kp/ki/kd 全部に掛かる
+  pid.update(err, now, hold=True)   # 不感帯の中: 0 を返す。積分は止めて微分の状態だけ進める
+
+  - 積分は「出力の単位」で持つ（ki * err * dt を足す）。|I| <= i_max で頭打ち、
+    さらに出力が飽和していて err が同じ向きなら足さない（anti-windup）
+  - 微分は err の差分を1次のローパス（時定数 d_tau）に通す。検出のノイズでガタつかないように
+  - 見失いから戻ったときなどは reset()（前の err との差分で微分が跳ねないように）
+
+StepResponse は「セミオート開始時の err（e0）から 0 への応答」を1本分見る:
+  rise      : |err| が max(10% * |e0|, band) 以下に初めて入るまで [s]
+  overshoot : 0 を越えて反対側に出た最大量 / |e0|
+  settle    : 最後に band（不感帯と 5% * |e0| の大きい方）に入ってから出ていないなら、その時刻まで [s]
+"""
+import numpy as np
+
+
+def gains_at(schedule, x):
+    """((x, 倍率), ...) を x で線形補間（範囲外は端の値）。schedule が空なら 1.0"""
+    if not schedule:
+        return 1.0
+    xs, ys = zip(*schedule)
+    return float(np.interp(x, xs, ys))
+
+
+class PID:
+    __slots__ = ("kp", "ki", "kd", "out_max", "i_max", "d_tau",
+                 "_i", "_d", "_e", "_t", "p_term", "i_term", "d_term")
+
+    def __init__(self, kp, ki=0.0, kd=0.0, out_max=100.0, i_max=None, d_tau=0.1):
+        self.kp = float(kp)
+        self.ki = float(ki)
+        self.kd = float(kd)
+        self.out_max = float(out_max)
+        self.i_max = self.out_max if i_max is None else float(i_max)
+        self.d_tau = float(d_tau)
+        self.reset()
+
+    def reset(self):
+        self._i = 0.0
+        self._d = 0.0
+        self._e = None
+        self._t = None
+        self.p_term = self.i_term = self.d_term = 0.0
+
+    def update(self, err, t, scale=1.0, hold=False):
+        err = float(err)
+        dt = 0.0 if self._t is None else t - self._t
+        if self._e is not None and dt > 0.0:
+            raw = (err - self._e) / dt
+            self._d += (dt / (self.d_tau + dt)) * (raw - self._d)
+        self._e = err
+        self._t = t
+        if hold:
+            self.p_term = self.d_term = 0.0
+            return 0.0
+
+        p = self.kp * scale * err
+        d = self.kd * scale * self._d
+        u = p + self._i + d
+        if self.ki and dt > 0.0:
+            saturated = abs(u) >= self.out_max and (u > 0) == (err > 0)
+            if not saturated:
+                self._i = max(-self.i_max, min(self.i_max, self._i + self.ki * scale * err * dt))
+                u = p + self._i + d
+        self.p_term, self.i_term, self.d_term = p, self._i, d
+        return max(-self.out_max, min(self.out_max, u))
+
+
+class StepResponse:
+    __slots__ = ("band", "t0", "e0", "t_rise", "peak", "t_in", "t_last")
+
+    def __init__(self, band):
+        self.band = float(band)
+        self.t0 = None
+        self.e0 = None
+        self.t_rise = None
+        self.peak = 0.0     # 反対側に出た最大量
+        self.t_in = None    # band に入った時刻（出たら None に戻す）
+        self.t_last = None
+
+    def observe(self, t, err):
+        err = float(err)
+        if self.e0 is None:
+            if abs(err) <= self.band:
+                # 最初から合っている軸はステップとして数えない
+                return
+            self.t0 = t
+            self.e0 = err
+        self.t_last = t
+        a0 = abs(self.e0)
+        if self.t_rise is None and abs(err) <= max(0.1 * a0, self.band):
+            self.t_rise = t - self.t0
+        if (err > 0) != (self.e0 > 0):
+            self.peak = max(self.peak, abs(err))
+        if abs(err) <= max(0.05 * a0, self.band):
+            if self.t_in is None:
+                self.t_in = t
+        else:
+            self.t_in = None
+
+    def result(self):
+        """{"e0", "rise", "overshoot", "settle"}（ステップが無ければ None）。未到達の項目は None"""
+        if self.e0 is None:
+            return None
+        return {
+            "e0": self.e0,
+            "rise": self.t_rise,
+            "overshoot": self.peak / abs(self.e0),
+            "settle": None if self.t_in is None else self.t_in - self.t0,
+        }
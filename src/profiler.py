@@ -0,0 +1,124 @@
+# profiler.py
+"""
+区間（span）プロファイラ。Chrome Trace Event 形式（chrome://tracing / Perfetto）で書き出す。
+
+  from profiler import PROFILER, span
+
+  with span("detect"):
+      corners, ids = detector.detect(frame)
+
+  PROFILER.enable()                 # main.py --trace FILE のとき
+  PROFILER.dump("trace.json")
+
+無効のときの span() は enabled を見て共有のダミーを返すだけ（数百 ns）。
+有効のときは (name, cat, tid, 開始, 終了) をリング（deque(maxlen)）に積む。
+スレッドごとに別のトラックになる（tid = threading.get_ident()、名前はスレッド名）。
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("prof", "name", "cat", "t0")
+
+    def __init__(self, prof, name, cat):
+        self.prof = prof
+        self.name = name
+        self.cat = cat
+
+    def __enter__(self):
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.prof._events.append((self.name, self.cat, threading.get_ident(), self.t0, time.perf_counter_ns()))
+        return False
+
+
+class Profiler:
+    def __init__(self, capacity=200_000):
+        self.enabled = False
+        self._events = deque(maxlen=int(capacity))
+        self._thread_names = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self._events.clear()
+
+    def span(self, name, cat="main"):
+        """with で使う区間。無効なら何もしない"""
+        if not self.enabled:
+            return _NULL_SPAN
+        self._note_thread()
+        return _Span(self, name, cat)
+
+    def complete(self, name, t0_ns, cat="main"):
+        """t0_ns（now() の値）から今までを1区間として記録（with で囲みにくい長い区間用）"""
+        if not self.enabled:
+            return
+        self._note_thread()
+        self._events.append((name, cat, threading.get_ident(), t0_ns, time.perf_counter_ns()))
+
+    @staticmethod
+    def now():
+        return time.perf_counter_ns()
+
+    def _note_thread(self):
+        tid = threading.get_ident()
+        if tid not in self._thread_names:
+            self._thread_names[tid] = threading.current_thread().name
+
+    # -----------------------
+    # export
+    # -----------------------
+    def trace_events(self):
+        """Chrome Trace Event の "X"（完了イベント）と、スレッド名の "M" イベント"""
+        events = list(self._events)
+        pid = os.getpid()
+        base = min((e[3] for e in events), default=0)
+        out = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in self._thread_names.items()
+        ]
+        for name, cat, tid, t0, t1 in events:
+            out.append({
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "pid": pid,
+                "tid": tid,
+                "ts": (t0 - base) / 1000.0,   # µs
+                "dur": (t1 - t0) / 1000.0,
+            })
+        return out
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+        print(f"[TRACE] {len(self._events)} spans -> {path}")
+
+
+# プロセスで1つ
+PROFILER = Profiler()
+span = PROFILER.span
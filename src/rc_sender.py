@@ -0,0 +1,124 @@
+# rc_sender.py
+"""
+RC コマンドを一定周期で送る専用スレッド。
+
+メインループ（キーボード / セミオート）は最新の (lr, fb, ud, yaw) を set() で置くだけで、
+送信はこのスレッドが rate_hz で行う。検出や描画が遅れても RC の周期は変わらない。
+
+  sender = RcSender(send, rate_hz=20, active=lambda: controller.in_flight).start()
+  seq = sender.set((lr, fb, ud, yaw))
+
+周期は「開始時刻 + k * period」の絶対時刻で刻む（sleep の誤差が積み重ならない）。
+1周期以上遅れたら追いつこうとまとめ送りはせず、次の刻みまで飛ばす（late で数える）。
+"""
+import threading
+import time
+
+from perf_stats import Histogram
+from telemetry_bus import LatestSlot
+
+
+# 送信間隔とゆらぎ用のバケット（0.1ms 〜 0.5s）
+RC_BOUNDS = (
+    0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.033, 0.05,
+    0.075, 0.1, 0.2, 0.5,
+)
+
+
+def _ms(v):
+    return "--" if v is None else f"{float(v) * 1000:.1f}"
+
+
+class RcSender:
+    """
+    send(cmd, seq) : 実際の送信（cmd は (lr, fb, ud, yaw)、seq はその値を set した番号）
+    active()       : False の間は送らない（着陸中など）
+    """
+
+    def __init__(self, send, rate_hz=20.0, active=None, clock=time.perf_counter):
+        self.send = send
+        self.period = 1.0 / float(rate_hz)
+        self.active = active or (lambda: True)
+        self.clock = clock
+
+        self.slot = LatestSlot()
+        self.slot.put((0, 0, 0, 0))
+
+        self.sent = 0
+        self.late = 0          # 刻みを丸ごと飛ばした回数
+        self.errors = 0
+        self.interval = Histogram(RC_BOUNDS)
+        self.jitter = Histogram(RC_BOUNDS)   # |実際の間隔 - period|
+
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="rc-sender", daemon=True)
+
+    @property
+    def rate_hz(self):
+        return 1.0 / self.period
+
+    def set(self, cmd):
+        """最新のコマンドを置く（どのスレッドからでもよい）。戻り値はこの値の番号"""
+        return self.slot.put(tuple(cmd))
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self.stopped = True
+        if self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+
+    def _run(self):
+        clock = self.clock
+        period = self.period
+        next_t = clock()
+        prev_sent = None
+        while not self.stopped:
+            now = clock()
+            wait = next_t - now
+            if wait > 0:
+                time.sleep(wait)
+                now = clock()
+            elif -wait >= period:
+                # 1周期以上遅れた（GIL の取り合い・スリープの遅れ）→ 今を起点にやり直す
+                self.late += int(-wait // period)
+                next_t = now
+            next_t += period
+
+            if not self.active():
+                prev_sent = None
+                continue
+
+            seq, cmd = self.slot.get_with_seq()
+            try:
+                self.send(cmd, seq)
+            except Exception as e:
+                self.errors += 1
+                if self.errors % 50 == 1:
+                    print("[RC] send failed:", e)
+                continue
+
+            t = clock()
+            if prev_sent is not None:
+                dt = t - prev_sent
+                self.interval.observe(dt)
+                self.jitter.observe(abs(dt - period))
+            prev_sent = t
+            self.sent += 1
+
+    def stats(self):
+        return {
+            "rate_hz": self.rate_hz,
+            "sent": self.sent,
+            "late": self.late,
+            "errors": self.errors,
+            "interval": self.interval.snapshot(),
+            "jitter": self.jitter.snapshot(),
+        }
+
+    def summary(self):
+        j = self.jitter.percentiles((50, 99))
+        return (f"rc {self.rate_hz:.0f}Hz sent:{self.sent} late:{self.late} "
+                f"jitter p50/p99:{_ms(j[50])}/{_ms(j[99])}ms")
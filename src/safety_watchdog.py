@@ -0,0 +1,177 @@
+# safety_watchdog.py
+"""
+メインループとは別のスレッドで飛行中の安全を見張る（メインループが cv2.imshow・応答待ち・
+遅い検出で止まっていても動く）。
+
+  wd = SafetyWatchdog(controller, period=0.05).start()
+
+period ごとの刻み（RcSender と同じく絶対時刻）で次を見る:
+  stale   : RC を最後に置いてから stale_sec 過ぎた（= コマンドを作る側が止まっている）
+            → RcSender の slot を 0 にする（送信スレッドは動いているのでホバリングになる）。
+              メインループが RC を置き直したら解除
+  link    : state パケットが telemetry_loss_sec 来ない → 着陸
+  battery : bat <= critical_battery → 着陸
+着陸は TelloController.request_land()（g キーと同じ。RC を止めてから land を列の先頭に積む）。
+
+介入ごとに反応遅延（条件が成り立った時刻 → 対処が終わった時刻）を測って記録する。
+条件が成り立つ時刻は stale なら「最後の RC + stale_sec」、link なら「最後の state + telemetry_loss_sec」、
+battery なら閾値以下の state を受信した時刻。
+対処が終わった時刻は、stale なら slot を 0 にした時刻（送信スレッドが次の刻みで送る）、
+着陸なら land のジョブが終わった時刻（Job.t_end。land の応答が返るまで）。
+積んだだけでは数えず、後の刻みでジョブが終わったのを見てから記録する（見張りのスレッドは待たない）。
+ジョブが失敗・取り消しなら detail に残す。時刻はキューと同じ clock（既定 perf_counter）で比べる。
+"""
+import threading
+import time
+from collections import deque
+
+from perf_stats import Histogram
+
+
+# 反応遅延用のバケット（1ms 〜 10s。着陸は land の応答＝接地まで入るので秒単位になる）
+REACTION_BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+
+class Intervention:
+    __slots__ = ("kind", "t", "reaction", "detail")
+
+    def __init__(self, kind, t, reaction, detail):
+        self.kind = kind
+        self.t = t
+        self.reaction = reaction
+        self.detail = detail
+
+    def as_dict(self):
+        return {"kind": self.kind, "t": self.t, "reaction": self.reaction, "detail": self.detail}
+
+
+class SafetyWatchdog:
+    def __init__(self, controller, period=0.05, stale_sec=0.5, telemetry_loss_sec=3.0,
+                 critical_battery=10, clock=time.perf_counter):
+        self.controller = controller
+        self.period = float(period)
+        self.stale_sec = float(stale_sec)
+        self.telemetry_loss_sec = float(telemetry_loss_sec)
+        self.critical_battery = critical_battery
+        self.clock = clock
+
+        self.hovering = False       # stale で 0 にしている最中
+        self.landing = False        # この飛行で着陸させた（降りるまで繰り返さない）
+        self._flight_start = None   # in_flight になったのを見た時刻
+        self._land_job = None       # 着陸の (job, kind, 時刻, 条件の時刻, detail)。終わるまで持つ
+
+        self.counts = {"stale": 0, "link": 0, "battery": 0}
+        self.reaction = Histogram(REACTION_BOUNDS)
+        self.interventions = deque(maxlen=32)
+        self.late = 0               # 刻みを丸ごと飛ばした回数
+
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="safety-watchdog", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        """刻みの途中（request_land の最中など）なら終わるまで待つ"""
+        self.stopped = True
+        if self.thread.is_alive() and threading.current_thread() is not self.thread:
+            self.thread.join(timeout=timeout)
+
+    def _run(self):
+        clock = self.clock
+        period = self.period
+        next_t = clock()
+        while not self.stopped:
+            wait = next_t - clock()
+            if wait > 0:
+                time.sleep(wait)
+            elif -wait >= period:
+                self.late += int(-wait // period)
+                next_t = clock()
+            next_t += period
+            try:
+                self.check(clock())
+            except Exception as e:
+                print("[WATCHDOG] check failed:", e)
+
+    # -----------------------
+    # checks
+    # -----------------------
+    def check(self, now):
+        c = self.controller
+        # request_land() で in_flight は先に False になるので、着陸待ちはその前に見る
+        if self._land_job is not None:
+            self._poll_land(now)
+        if not c.in_flight:
+            self.hovering = False
+            self.landing = False
+            self._flight_start = None
+            return
+        if self._flight_start is None:
+            self._flight_start = now
+        if self.landing:
+            return
+
+        # state パケット（バスがあるときだけ。djitellopy の state はメインループが読むまで更新されない）
+        bus = c.telemetry_bus
+        if bus is not None:
+            since = bus.last_ts if bus.last_ts is not None else self._flight_start
+            if now - since > self.telemetry_loss_sec:
+                self._land(now, "link", since + self.telemetry_loss_sec,
+                           f"no state packet for {now - since:.1f}s")
+                return
+            tm = bus.latest.get()
+            if tm is not None and tm.bat is not None and tm.bat <= self.critical_battery:
+                self._land(now, "battery", max(tm.ts, self._flight_start), f"battery {tm.bat}%")
+                return
+
+        # RC を置く側（メインループ）
+        last = max(c.last_command_ts or 0.0, self._flight_start)
+        if now - last > self.stale_sec:
+            if not self.hovering and c.rc_sender is not None:
+                c.rc_sender.set((0, 0, 0, 0))
+                self.hovering = True
+                self._record("stale", now, last + self.stale_sec, f"no rc command for {now - last:.2f}s -> hover")
+        elif self.hovering:
+            self.hovering = False
+            print("[WATCHDOG] rc commands resumed")
+
+    def _land(self, now, kind, t_cond, detail):
+        self.landing = True
+        self.counts[kind] += 1
+        job = self.controller.request_land()
+        if job is None:
+            # キューが無い（その場で land まで済んでいる）
+            self._record(kind, now, t_cond, detail + " -> land", count=False)
+            return
+        self._land_job = (job, kind, now, t_cond, detail)
+        print(f"[WATCHDOG] {kind}: {detail} -> land queued")
+
+    def _poll_land(self, now):
+        job, kind, t, t_cond, detail = self._land_job
+        if not job.finished:
+            return
+        self._land_job = None
+        self._record(kind, t, t_cond, f"{detail} -> land {job.state}",
+                     t_end=job.t_end, count=False)
+
+    def _record(self, kind, now, t_cond, detail, t_end=None, count=True):
+        t_end = self.clock() if t_end is None else t_end
+        reaction = max(0.0, t_end - t_cond)
+        if count:
+            self.counts[kind] += 1
+        self.reaction.observe(reaction)
+        self.interventions.append(Intervention(kind, now, reaction, detail))
+        print(f"[WATCHDOG] {kind}: {detail} (reaction {reaction * 1000:.0f}ms)")
+
+    # -----------------------
+    # report
+    # -----------------------
+    def summary(self):
+        p50 = self.reaction.percentiles((50,))[50]
+        counts = " ".join(f"{k}:{v}" for k, v in self.counts.items())
+        if p50 is None:
+            return f"watchdog {counts} (no interventions)"
+        return (f"watchdog {counts} reaction p50/max:{p50 * 1000:.0f}/{self.reaction.max * 1000:.0f}ms "
+                f"late:{self.late}")
@@ -0,0 +1,116 @@
+# session_recorder.py
+import json
+import os
+import time
+
+import cv2
+
+
+class SessionRecorder:
+    """
+    フライトセッションを記録するクラス（session_replay.py で再生する）。
+
+    出力ディレクトリの中身:
+      video.avi     : 検出前の生フレーム（MJPG）
+      events.jsonl  : 1ループ = 1行
+                      {"i", "t", "has_frame", "dup", "connected", "state", "pressed",
+                       "key", "in_flight", "rc", "lat", "comp"}
+                      dup=True は「前のループと同じフレーム」（映像には書かない）
+                      lat はこのループで RC まで届いたフレームの区間遅延 [ms]（無ければ無し）
+                      comp はセミオートが使ったフレームの古さ [s] と遅延補償の量 [px]
+                      {"age", "px"}（補償しなかったら px は null。マーカーを使わなかったループは無し）
+      meta.json     : 記録開始時刻やフレームサイズなど
+      latency.json  : glass-to-command 遅延の集計（write_json で main.py が書く）
+    """
+
+    def __init__(self, out_dir, fps=30.0, fourcc="MJPG"):
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+
+        self.fps = float(fps)
+        self.fourcc = fourcc
+        self.writer = None
+        self.frame_size = None
+
+        self.t0 = time.perf_counter()
+        self.frame_index = 0
+        self._has_frame = False
+        self._dup = False
+
+        self.events = open(os.path.join(out_dir, "events.jsonl"), "w", encoding="utf-8")
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            "version": 1,
+            "started_at": time.time(),
+            "fps": self.fps,
+            "frame_size": self.frame_size,
+        }
+        with open(os.path.join(self.out_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+    def now(self):
+        """記録開始からの経過秒"""
+        return time.perf_counter() - self.t0
+
+    def write_frame(self, frame, duplicate=False):
+        """
+        検出・描画前のフレームを1枚書く。
+        映像が無いループでは呼ばない（has_frame=False で記録される）。
+        サイズは最初のフレームで固定（途中で変わったらリサイズして合わせる）。
+        duplicate=True なら映像には書かず、イベントに dup だけ残す。
+        """
+        if frame is None or frame.size == 0:
+            return
+        if duplicate and self.writer is not None:
+            self._has_frame = True
+            self._dup = True
+            return
+        h, w = frame.shape[:2]
+        if self.writer is None:
+            self.frame_size = (w, h)
+            path = os.path.join(self.out_dir, "video.avi")
+            self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, (w, h))
+            self._write_meta()
+        if (w, h) != self.frame_size:
+            frame = cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_LINEAR)
+        self.writer.write(frame)
+        self._has_frame = True
+
+    def write_event(self, *, connected=False, state=None, pressed=None, key=255, in_flight=False, rc=None,
+                    latency=None, comp=None):
+        """ループ1回分のイベントを書く（write_frame の後、RC送信の後に呼ぶ）"""
+        rec = {
+            "i": self.frame_index,
+            "t": round(self.now(), 6),
+            "has_frame": self._has_frame,
+            "dup": self._dup,
+            "connected": bool(connected),
+            "state": dict(state) if state else {},
+            "pressed": list(pressed) if pressed else [],
+            "key": int(key),
+            "in_flight": bool(in_flight),
+            "rc": list(rc) if rc is not None else None,
+        }
+        if latency:
+            rec["lat"] = latency
+        if comp is not None:
+            rec["comp"] = comp
+        self.events.write(json.dumps(rec, separators=(",", ":")) + "\n")
+        self.frame_index += 1
+        self._has_frame = False
+        self._dup = False
+
+    def write_json(self, name, obj):
+        """セッションに付ける集計など（out_dir/name）"""
+        with open(os.path.join(self.out_dir, name), "w", encoding="utf-8") as f:
+            json.dump(obj, f, indent=2)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+        if self.events is not None:
+            self.events.close()
+            self.events = None
@@ -0,0 +1,276 @@
+# session_replay.py
+"""
+記録済みセッション（session_recorder.py の出力）を
+  検出 → get_marker_info → TelloController.update_approach_from_aruco → update_motion
+の本番と同じ経路に流し直して、生成された RC コマンド列を得る。
+
+実機の代わりに FakeTello を使うので UDP は一切送らない。
+時計（clock / perf_clock）は記録の t。遅延補償は記録の comp（フレームの古さと補償量）を
+そのまま渡す（RcSender が実際に送った時刻は記録に無く、再計算すると記録と合わないため）。
+comp の無い古い記録は補償なしで回す（記録時も補償していない）。
+  python session_replay.py SESSION_DIR            # CPU の限界速度で再生
+  python session_replay.py SESSION_DIR --realtime # 記録と同じ時間で再生
+  python session_replay.py SESSION_DIR --out rc.csv
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from aruco_detector import ArUcoDetector
+from tello_controller import TelloController
+
+
+class ReplayClock:
+    """記録時刻を返す時計（TelloController.clock に渡す）"""
+
+    def __init__(self, t=0.0):
+        self.t = float(t)
+
+    def __call__(self):
+        return self.t
+
+
+class ReplayKeyboardState:
+    """KeyboardState の代わり。押下状態はイベントから毎ステップ差し替える"""
+
+    def __init__(self):
+        self.pressed = set()
+
+    def is_pressed(self, name: str) -> bool:
+        return name in self.pressed
+
+    def snapshot(self):
+        return sorted(self.pressed)
+
+
+class FakeTello:
+    """
+    djitellopy.Tello の代わり。send_rc_control は送らずに記録するだけ。
+    state は記録された state パケット（dict）をそのまま返す。
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.state = {}
+        self.rc_log = []        # [(t, lr, fb, ud, yaw), ...]
+        self.command_log = []   # [(t, "takeoff"), ...]
+        self.is_flying = False
+
+    # ---- connect / stream ----
+    def connect(self):
+        pass
+
+    def streamon(self):
+        pass
+
+    def streamoff(self):
+        pass
+
+    def get_frame_read(self):
+        return None
+
+    def end(self):
+        pass
+
+    # ---- commands ----
+    def takeoff(self):
+        self.command_log.append((self.clock(), "takeoff"))
+        self.is_flying = True
+
+    def land(self):
+        self.command_log.append((self.clock(), "land"))
+        self.is_flying = False
+
+    def send_rc_control(self, lr, fb, ud, yaw):
+        self.rc_log.append((self.clock(), int(lr), int(fb), int(ud), int(yaw)))
+
+    # ---- state ----
+    def get_current_state(self):
+        return self.state
+
+    def _state_int(self, key, default=0):
+        try:
+            return int(float(self.state.get(key, default)))
+        except Exception:
+            return default
+
+    def get_battery(self):
+        # 記録に bat が無いときは離陸できる値にしておく
+        return self._state_int("bat", 100)
+
+    def get_height(self):
+        return self._state_int("h")
+
+    def get_yaw(self):
+        return self._state_int("yaw")
+
+    def get_pitch(self):
+        return self._state_int("pitch")
+
+    def get_roll(self):
+        return self._state_int("roll")
+
+
+def load_events(session_dir):
+    events = []
+    with open(os.path.join(session_dir, "events.jsonl"), encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    return events
+
+
+class SessionReplayer:
+    """
+    記録済みセッションを決定的に再生する。
+
+    realtime=False なら待ち時間なしで回す（数時間分を数分で回せる）。
+    結果は FakeTello.rc_log と、記録時の rc との不一致リスト。
+    """
+
+    def __init__(self, session_dir, *, realtime=False, detector=None, configure=None):
+        self.session_dir = session_dir
+        self.realtime = realtime
+        self.events = load_events(session_dir)
+
+        self.clock = ReplayClock()
+        self.kb = ReplayKeyboardState()
+        self.tello = FakeTello(self.clock)
+        self.controller = TelloController(self.kb, tello=self.tello, clock=self.clock)
+        self.controller.perf_clock = self.clock
+        self.detector = detector if detector is not None else ArUcoDetector()
+
+        # ゲイン等を差し替えて回帰テストしたいとき用（controller を受け取る関数）
+        if configure is not None:
+            configure(self.controller)
+
+        self.mismatches = []   # [(i, recorded_rc, replayed_rc), ...]
+        self.frames = 0
+
+    def _open_video(self):
+        path = os.path.join(self.session_dir, "video.avi")
+        if not os.path.exists(path):
+            return None
+        cap = cv2.VideoCapture(path)
+        return cap if cap.isOpened() else None
+
+    def run(self):
+        cap = self._open_video()
+        blank = np.zeros((480, 640, 3), dtype=np.uint8)
+        c = self.controller
+
+        last_frame = None
+        last_marker_info = None
+
+        wall0 = time.perf_counter()
+        try:
+            for ev in self.events:
+                t = float(ev["t"])
+                self.clock.t = t
+
+                if self.realtime:
+                    wait = t - (time.perf_counter() - wall0)
+                    if wait > 0:
+                        time.sleep(wait)
+
+                # ---- frame ----
+                dup = bool(ev.get("dup")) and last_frame is not None
+                frame = None
+                if dup:
+                    frame = last_frame
+                elif ev.get("has_frame") and cap is not None:
+                    ok, img = cap.read()
+                    if ok:
+                        frame = img
+                        self.frames += 1
+                if frame is None:
+                    frame = blank
+                last_frame = frame if frame is not blank else None
+
+                # ---- ArUco detect（main.py と同じ経路。同じフレームなら前回の結果）----
+                if dup:
+                    marker_info = last_marker_info
+                else:
+                    marker_info = None
+                    try:
+                        corners, ids = self.detector.detect(frame)
+                        marker_info = self.detector.get_marker_info(
+                            ids, corners, target_id=getattr(c, "target_aruco_id", None)
+                        )
+                    except Exception:
+                        marker_info = None
+                last_marker_info = marker_info
+
+                # ---- state / keyboard ----
+                self.tello.state = ev.get("state") or {}
+                self.kb.pressed = set(ev.get("pressed") or [])
+
+                if ev.get("connected", True):
+                    c.handle_key(int(ev.get("key", 255)))
+                # 離陸/着陸は記録時はキューで非同期に終わるので、飛行中かどうかは記録に合わせる
+                if "in_flight" in ev:
+                    c.in_flight = bool(ev["in_flight"])
+
+                # ---- RC control ----
+                rc = None
+                if c.in_flight:
+                    c.update_motion_from_keyboard()
+                    if getattr(c, "approach_enabled", False):
+                        comp = ev.get("comp")
+                        if comp is not None:
+                            c.update_approach_from_aruco(marker_info, frame.shape,
+                                                         capture_ts=t - comp["age"], comp_px=comp["px"])
+                        else:
+                            c.update_approach_from_aruco(marker_info, frame.shape)
+                    c.update_motion()
+                    rc = list(c.last_rc) if c.last_rc is not None else None
+
+                rec_rc = ev.get("rc")
+                if rec_rc != rc:
+                    self.mismatches.append((ev.get("i"), rec_rc, rc))
+        finally:
+            if cap is not None:
+                cap.release()
+
+        return self.tello.rc_log
+
+    def write_csv(self, path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["t", "lr", "fb", "ud", "yaw"])
+            w.writerows(self.tello.rc_log)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay a recorded Tello session")
+    ap.add_argument("session_dir")
+    ap.add_argument("--realtime", action="store_true", help="記録と同じ速度で再生する")
+    ap.add_argument("--out", default=None, help="RC コマンド列を CSV で書き出す")
+    args = ap.parse_args()
+
+    rp = SessionReplayer(args.session_dir, realtime=args.realtime)
+    t0 = time.perf_counter()
+    rc_log = rp.run()
+    elapsed = time.perf_counter() - t0
+
+    span = float(rp.events[-1]["t"]) if rp.events else 0.0
+    speedup = span / elapsed if elapsed > 0 else float("inf")
+    print(f"[REPLAY] events={len(rp.events)} frames={rp.frames} rc={len(rc_log)} "
+          f"session={span:.1f}s elapsed={elapsed:.2f}s x{speedup:.1f}")
+    print(f"[REPLAY] mismatches vs recorded rc: {len(rp.mismatches)}")
+    for i, rec, rep in rp.mismatches[:10]:
+        print(f"  i={i} recorded={rec} replayed={rep}")
+
+    if args.out:
+        rp.write_csv(args.out)
+        print(f"[REPLAY] wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# sim_e2e.py
+"""
+シミュレータ（drone_sim.py）相手にパイプライン全体を画面なしで回す（結果は終了コードでも返す）。
+
+  python sim_e2e.py                          # 実時間で 20 秒、セミオートでマーカーに寄る
+  python sim_e2e.py --speed 2 --duration 30 --json out.json
+  python sim_e2e.py --external 127.0.0.1:9889   # 別プロセスで動いている drone_sim.py に繋ぐ
+  python sim_e2e.py --mode servo --marker 3,1.2,1.3,150   # 斜め上のマーカーに 4軸で寄る
+
+UDP（コマンド / state / H.264 映像）越しに TelloController を繋いで、main.py と同じ順に
+  acquire → detect → marker_info → approach → update_motion
+を回す。出すもの:
+  - 映像のフレーム数と検出率
+  - glass-to-command 遅延（latency_trace）と RC の送信周期
+  - セミオート ON から HOLD に収束するまでの時間
+  - 終了時のマーカーまでの距離と向きのずれ（シミュレータの真値。--external では出ない）
+
+映像が一度も来なければ終了コード 2、マーカーを一度も検出できなければ 1。
+"""
+import argparse
+import json
+import logging
+import math
+import sys
+import time
+
+import numpy as np
+from djitellopy import Tello
+
+import approach_config
+from aruco_detector import ArUcoDetector
+from drone_sim import MarkerScene, SimDrone, SimMarker
+from latency_trace import LatencyTracer
+from session_replay import ReplayKeyboardState
+from tello_controller import TelloController
+
+
+def wait_until(pred, timeout):
+    t_end = time.perf_counter() + timeout
+    while not pred():
+        if time.perf_counter() > t_end:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def marker_error(sim):
+    """(水平距離 [m], 向きのずれ [deg]) 向きのずれは正ならマーカーが右"""
+    pos, heading = sim.truth()
+    m = sim.scene.markers[0]
+    d = m.center[:2] - pos[:2]
+    bearing = math.atan2(d[1], d[0])
+    err = math.degrees((heading - bearing + math.pi) % (2 * math.pi) - math.pi)
+    return float(np.hypot(*d)), err
+
+
+def run(controller, duration, loop_sleep=0.02, approach=True):
+    """main.py の制御部分と同じ順に回す（描画なし）。結果の dict を返す"""
+    detector = ArUcoDetector()
+    tracer = LatencyTracer()
+    frames = 0
+    detections = 0
+    last_seq = None
+
+    controller.handle_key(ord("t"))
+    if not wait_until(lambda: controller.in_flight, 10.0):
+        print("[E2E] takeoff did not complete")
+    if approach:
+        controller.set_approach(True)
+
+    t_end = time.perf_counter() + duration
+    while time.perf_counter() < t_end:
+        frame_ref = controller.acquire_frame()
+        marker_info = None
+        capture_ts = None
+        shape = (720, 960, 3)
+        if frame_ref is not None:
+            capture_ts = frame_ref.capture_ts or frame_ref.decode_ts or frame_ref.ts or None
+            tracer.start(frame_ref, time.perf_counter())
+            frame = frame_ref.array
+            shape = frame.shape
+            if frame_ref.seq != last_seq:
+                frames += 1
+                last_seq = frame_ref.seq
+            corners, ids = detector.detect(frame)
+            tracer.mark("detected", time.perf_counter())
+            marker_info = detector.get_marker_info(ids, corners, target_id=controller.target_aruco_id)
+            tracer.mark("marker_info", time.perf_counter())
+            frame_ref.release()
+            if marker_info is not None:
+                detections += 1
+
+        if controller.in_flight:
+            controller.update_motion_from_keyboard()
+            if controller.approach_enabled:
+                controller.update_approach_from_aruco(marker_info, shape, capture_ts=capture_ts)
+                tracer.mark("approach", time.perf_counter())
+            controller.update_motion()
+            tracer.queued(controller.last_rc_seq)
+        tracer.poll(controller.rc_sent_ts)
+        time.sleep(loop_sleep)
+
+    result = {
+        "frames": frames,
+        "detections": detections,
+        "latency": tracer.snapshot(),
+        "latency_summary": tracer.summary(),
+        "approach_state": controller.approach_state,
+        "size_px": controller.approach_size_px,
+        "target_size_px": controller.target_size_px,
+        "latency_comp": controller.get_approach_comp_summary(),
+        "approach_mode": controller.approach_mode,
+        "converge_sec": controller.approach_converge_sec,
+    }
+    if approach:
+        # 収束しなかった回もステップ応答を記録する
+        controller.set_approach(False)
+    result["step"] = controller.approach_step_last
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Headless end-to-end run against the local Tello simulator")
+    ap.add_argument("--speed", type=float, default=1.0, help="シミュレータの時間の倍率")
+    ap.add_argument("--duration", type=float, default=20.0, help="離陸後に回す秒数（実時間）")
+    ap.add_argument("--port", type=int, default=9889, help="シミュレータのコマンドポート")
+    ap.add_argument("--external", metavar="HOST:PORT", default=None,
+                    help="シミュレータを起動せずに既存のものに繋ぐ")
+    ap.add_argument("--no-approach", action="store_true", help="セミオートを ON にしない（ホバリングのみ）")
+    ap.add_argument("--mode", choices=("yaw", "servo"), default="yaw", help="セミオートのモード")
+    ap.add_argument("--marker", metavar="X,Y,Z,FACING_DEG", default=None,
+                    help="マーカーの位置 [m] と表の向き [deg]（180 で離陸地点の方を向く）")
+    ap.add_argument("--async-client", action="store_true")
+    ap.add_argument("--no-latency-comp", action="store_true", help="セミオートの遅延補償を切る（比較用）")
+    ap.add_argument("--k-yaw", type=float, default=None, help="yaw の PID の kp を上書きする")
+    ap.add_argument("--approach-config", metavar="FILE", default=None,
+                    help="セミオートの PID / ゲインスケジュールを JSON で上書きする（approach_config.py）")
+    ap.add_argument("--json", metavar="FILE", default=None)
+    args = ap.parse_args()
+    # RC を送るたびの INFO ログを抑える
+    Tello.LOGGER.setLevel(logging.WARNING)
+
+    sim = None
+    if args.external:
+        host, port = args.external.rsplit(":", 1)
+        port = int(port)
+    else:
+        host, port = "127.0.0.1", args.port
+        scene = None
+        if args.marker:
+            x, y, z, facing = (float(v) for v in args.marker.split(","))
+            scene = MarkerScene([SimMarker(0, (x, y, z), facing=math.radians(facing))])
+        sim = SimDrone(host, port, speed=args.speed, scene=scene).start()
+
+    controller = TelloController(ReplayKeyboardState(), host=host, command_port=port,
+                                 async_client=args.async_client)
+    controller.stream_governor_enabled = False
+    controller.latency_comp = not args.no_latency_comp
+    controller.approach_mode = args.mode
+    if args.approach_config:
+        controller.configure_approach(approach_config.load(args.approach_config))
+    if args.k_yaw is not None:
+        controller.approach_pid["yaw"].kp = args.k_yaw
+    try:
+        controller.connect_and_start_stream()
+        result = run(controller, args.duration, approach=not args.no_approach)
+        result["rc"] = controller.rc_sender.stats() if controller.rc_sender is not None else None
+        if sim is not None:
+            dist, err = marker_error(sim)
+            result["marker_distance_m"] = dist
+            result["marker_bearing_err_deg"] = err
+            result["sim_frames_sent"] = sim.frames_sent
+            result["sim_video_late"] = sim.video_late
+        controller.handle_key(ord("g"))
+        q = controller.command_queue
+        if q is not None:
+            wait_until(lambda: not q.busy("land"), 10.0)
+    finally:
+        controller.cleanup()
+        if sim is not None:
+            sim.stop()
+
+    det_rate = result["detections"] / max(1, result["frames"])
+    print(f"[E2E] frames:{result['frames']} detect:{det_rate:.0%}  state:{result['approach_state']}  "
+          f"size:{result['size_px'] or 0:.0f}/{result['target_size_px']}px")
+    print("[E2E]", result["latency_summary"])
+    print("[E2E]", result["latency_comp"])
+    conv = result["converge_sec"]
+    print(f"[E2E] {result['approach_mode']} time to HOLD: " + ("not converged" if conv is None else f"{conv:.2f}s"))
+    print("[E2E]", controller.get_approach_step_summary())
+    if "marker_distance_m" in result:
+        print(f"[E2E] marker distance {result['marker_distance_m']:.2f}m  "
+              f"bearing err {result['marker_bearing_err_deg']:+.1f}deg  "
+              f"(sim frames {result['sim_frames_sent']}, late {result['sim_video_late']})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, default=float)
+
+    if result["frames"] == 0:
+        print("[E2E] no video frames were received")
+        return 2
+    if result["detections"] == 0:
+        print("[E2E] marker was never detected")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
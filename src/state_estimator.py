@@ -0,0 +1,213 @@
+# state_estimator.py
+"""
+位置・速度の推定（main.py の加速度積分の置き換え）。
+
+x/y/z 各軸を [位置, 速度] の2状態カルマンフィルタで推定する。
+3軸ぶんを長さ3の配列でまとめて計算するので、1回の更新は数十 µs 程度。
+
+  predict : 加速度 agx/agy（機体座標 → マップ座標）を入力に使う
+  update  : 速度 vgx/vgy/vgz（同じく回転）と高度 h
+  fix     : マーカー等からの位置（任意、add_position_fix）
+
+マップ座標は従来の draw_position_map と同じ（X=左右, Y=下向きが前進）。
+"""
+import math
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from profiler import span
+from telemetry_bus import LatestSlot
+
+
+G = 9.80665
+ACC_SCALE = G / 1000.0   # agx/agy [mg] → m/s^2
+VEL_SCALE = 0.1          # vgx/vgy/vgz [dm/s] → m/s
+H_SCALE = 0.01           # h [cm] → m
+
+
+def body_to_map(x_body, y_body, yaw_deg):
+    """
+    機体座標のベクトル → マップ座標（main.py の旧加速度積分と同じ回転・符号）。
+    yaw_deg は UI 表示と同じ「符号反転済み」の yaw。
+    """
+    r = math.radians(yaw_deg)
+    c, s = math.cos(r), math.sin(r)
+    return (c * y_body) - (s * x_body), -((s * y_body) + (c * x_body))
+
+
+class Estimate:
+    """推定結果（読み取り専用のつもりで使う）。pos/vel は (3,) [m, m/s]、*_var は分散"""
+
+    __slots__ = ("ts", "pos", "vel", "pos_var", "vel_var")
+
+    def __init__(self, ts, pos, vel, pos_var, vel_var):
+        self.ts = ts
+        self.pos = pos
+        self.vel = vel
+        self.pos_var = pos_var
+        self.vel_var = vel_var
+
+    @property
+    def pos_std(self):
+        return np.sqrt(self.pos_var)
+
+
+class StateEstimator:
+    """
+    軸ごと独立の [p, v] カルマンフィルタ（3軸を配列で同時に計算）。
+
+    共分散は P = [[a, b], [b, c]] を a/b/c の (3,) 配列で持つ。
+    観測が無い軸は分散 inf として扱う（カルマンゲインが 0 になる）。
+    """
+
+    def __init__(
+        self,
+        initial_pos=(-1.8, 0.5, 0.0),
+        accel_std=1.5,       # プロセスノイズ（加速度の不確かさ）[m/s^2]
+        vel_std=0.15,        # vgx 等の観測ノイズ [m/s]
+        height_std=0.05,     # h の観測ノイズ [m]
+        use_accel=True,
+        max_dt=0.5,
+    ):
+        self.accel_var = accel_std ** 2
+        self.vel_var = np.full(3, vel_std ** 2)
+        self.height_var = height_std ** 2
+        self.use_accel = use_accel
+        self.max_dt = max_dt
+
+        self.p = np.array(initial_pos, dtype=np.float64)
+        self.v = np.zeros(3)
+        self.a = np.full(3, 0.01)    # var(p)
+        self.b = np.zeros(3)         # cov(p, v)
+        self.c = np.full(3, 0.01)    # var(v)
+
+        self.last_ts = None
+        self.updates = 0
+        self.last_update_us = 0.0
+
+        self.latest = LatestSlot()
+        self._fixes = deque(maxlen=16)   # (pos(3,), var(3,))
+
+        self._sub = None
+        self.thread = None
+        self.stopped = False
+
+    # -----------------------
+    # filter
+    # -----------------------
+    def predict(self, dt, u):
+        q = self.accel_var
+        dt2 = dt * dt
+        self.p += self.v * dt + 0.5 * u * dt2
+        self.v += u * dt
+        a, b, c = self.a, self.b, self.c
+        self.a = a + 2.0 * dt * b + dt2 * c + q * dt2 * dt2 * 0.25
+        self.b = b + dt * c + q * dt2 * dt * 0.5
+        self.c = c + q * dt2
+
+    def update_velocity(self, z, r):
+        """z: (3,) 速度観測（NaN の軸は無視）、r: (3,) 分散"""
+        miss = np.isnan(z)
+        r = np.where(miss, np.inf, r)
+        innov = np.where(miss, 0.0, z - self.v)
+        a, b, c = self.a, self.b, self.c
+        s = c + r
+        kp = b / s
+        kv = c / s
+        self.p += kp * innov
+        self.v += kv * innov
+        self.a = a - b * b / s
+        self.b = b - b * c / s
+        self.c = c - c * c / s
+
+    def update_position(self, z, r):
+        """z: (3,) 位置観測（NaN の軸は無視）、r: (3,) 分散"""
+        miss = np.isnan(z)
+        r = np.where(miss, np.inf, r)
+        innov = np.where(miss, 0.0, z - self.p)
+        a, b, c = self.a, self.b, self.c
+        s = a + r
+        kp = a / s
+        kv = b / s
+        self.p += kp * innov
+        self.v += kv * innov
+        self.a = a - a * a / s
+        self.b = b - a * b / s
+        self.c = c - b * b / s
+
+    def add_position_fix(self, pos, std):
+        """
+        外部の位置観測（マーカー等）。pos は (x, y, z)（使わない軸は None）。
+        推定スレッドが次のパケットで取り込む。
+        """
+        z = np.array([np.nan if v is None else float(v) for v in pos])
+        self._fixes.append((z, np.full(3, float(std) ** 2)))
+
+    # -----------------------
+    # telemetry
+    # -----------------------
+    def step(self, tm):
+        """TelemetrySnapshot 1件で predict + update して Estimate を出す"""
+        t0 = time.perf_counter()
+        if self.last_ts is None:
+            self.last_ts = tm.ts
+            return None
+        dt = tm.ts - self.last_ts
+        if dt <= 0:
+            return None
+        self.last_ts = tm.ts
+        dt = min(dt, self.max_dt)
+
+        yaw = -float(tm.yaw) if tm.yaw is not None else 0.0
+
+        u = np.zeros(3)
+        if self.use_accel and tm.agx is not None and tm.agy is not None:
+            u[0], u[1] = body_to_map(tm.agx * ACC_SCALE, tm.agy * ACC_SCALE, yaw)
+        self.predict(dt, u)
+
+        if tm.vgx is not None and tm.vgy is not None:
+            vx, vy = body_to_map(tm.vgx * VEL_SCALE, tm.vgy * VEL_SCALE, yaw)
+            vz = np.nan if tm.vgz is None else -tm.vgz * VEL_SCALE   # vgz は下向きが +
+            self.update_velocity(np.array([vx, vy, vz]), self.vel_var)
+
+        if tm.h is not None:
+            self.update_position(np.array([np.nan, np.nan, tm.h * H_SCALE]), np.full(3, self.height_var))
+
+        while self._fixes:
+            try:
+                z, r = self._fixes.popleft()
+            except IndexError:
+                break
+            self.update_position(z, r)
+
+        est = Estimate(tm.ts, self.p.copy(), self.v.copy(), self.a.copy(), self.c.copy())
+        self.latest.put(est)
+        self.updates += 1
+        self.last_update_us = (time.perf_counter() - t0) * 1e6
+        return est
+
+    # -----------------------
+    # thread（TelemetryBus の購読）
+    # -----------------------
+    def start(self, bus):
+        self._sub = bus.subscribe("estimator", maxlen=128)
+        self.thread = threading.Thread(target=self._run, name="state-estimator", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+
+    def _run(self):
+        while not self.stopped:
+            if not self._sub.wait(timeout=0.5):
+                continue
+            for tm in self._sub.drain():
+                try:
+                    with span("estimate", "telemetry"):
+                        self.step(tm)
+                except Exception as e:
+                    print("[ESTIMATOR] step failed:", e)
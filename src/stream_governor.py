@@ -0,0 +1,208 @@
+# stream_governor.py
+import threading
+import time
+
+
+# 画質の段階（低 → 高）。Tello SDK の setresolution / setfps / setbitrate の引数そのまま。
+#   resolution: "low"=480p, "high"=720p
+#   fps       : "low"=5, "middle"=15, "high"=30
+#   bitrate   : 0=auto, 1..5 = Mbps
+STREAM_LEVELS = [
+    {"name": "480p5",   "resolution": "low",  "fps": "low",    "fps_hz": 5,  "bitrate": 1},
+    {"name": "480p15",  "resolution": "low",  "fps": "middle", "fps_hz": 15, "bitrate": 2},
+    {"name": "480p30",  "resolution": "low",  "fps": "high",   "fps_hz": 30, "bitrate": 3},
+    {"name": "720p15",  "resolution": "high", "fps": "middle", "fps_hz": 15, "bitrate": 4},
+    {"name": "720p30",  "resolution": "high", "fps": "high",   "fps_hz": 30, "bitrate": 0},  # 起動時のデフォルト
+]
+
+
+class StreamGovernor:
+    """
+    映像ストリームの解像度/ビットレート/FPS をリンク品質と地上局の負荷で上げ下げする。
+
+    見る指標（eval_sec ごとの窓で評価）:
+      decode_ratio : デコードFPS / 今の段階の公称FPS
+      frame_age    : 最新フレームの古さ [s]
+      drop_ratio   : 読まれる前に上書きされたフレームの割合
+      headroom     : 1 - (ループの処理時間 / loop_budget)
+
+    ヒステリシス:
+      bad が down_after 回続いたら1段下げる
+      good が up_after 回続いたら1段上げる
+      変更後 hold_sec は何もしない（切替直後はデコードが乱れるため）
+
+    apply(level_dict) は実際にコマンドを送る関数。ブロックするので別スレッドで呼ぶ。
+    """
+
+    def __init__(
+        self,
+        apply,
+        *,
+        levels=STREAM_LEVELS,
+        start_level=None,
+        eval_sec=2.0,
+        hold_sec=6.0,
+        down_after=2,
+        up_after=5,
+        loop_budget=1.0 / 30.0,
+        clock=time.perf_counter,
+    ):
+        self.apply = apply
+        self.levels = levels
+        self.level = len(levels) - 1 if start_level is None else int(start_level)
+
+        self.eval_sec = eval_sec
+        self.hold_sec = hold_sec
+        self.down_after = down_after
+        self.up_after = up_after
+        self.loop_budget = loop_budget
+        self.clock = clock
+
+        # しきい値（bad は1つでも当てはまれば、good は全部満たしたとき）
+        self.bad_decode_ratio = 0.70
+        self.bad_frame_age = 0.50
+        self.bad_drop_ratio = 0.30
+        self.bad_headroom = 0.10
+
+        self.good_decode_ratio = 0.90
+        self.good_frame_age = 0.20
+        self.good_drop_ratio = 0.10
+        self.good_headroom = 0.35
+
+        self.enabled = True
+        self.history = []   # [(t, from_name, to_name, reason), ...]
+
+        self._bad_n = 0
+        self._good_n = 0
+        self._last_change = -1e9
+        self._applying = False
+
+        # 窓の集計
+        self._win_t0 = None
+        self._win_decoded0 = 0
+        self._win_dropped0 = 0
+        self._win_age_max = 0.0
+        self._win_busy = 0.0
+        self._win_loops = 0
+
+        self.last_metrics = None
+
+    @property
+    def current(self):
+        return self.levels[self.level]
+
+    # -----------------------
+    # input
+    # -----------------------
+    def update(self, *, decoded, dropped, frame_age, loop_busy, now=None):
+        """
+        毎ループ呼ぶ。decoded/dropped は累積カウンタ、frame_age は最新フレームの古さ[s]、
+        loop_busy はこのループの処理時間[s]（sleep を除く）。
+        """
+        if not self.enabled:
+            return
+        now = self.clock() if now is None else now
+
+        if self._win_t0 is None:
+            self._reset_window(now, decoded, dropped)
+            return
+
+        if frame_age is not None:
+            self._win_age_max = max(self._win_age_max, float(frame_age))
+        if loop_busy is not None:
+            self._win_busy += float(loop_busy)
+            self._win_loops += 1
+
+        span = now - self._win_t0
+        if span < self.eval_sec:
+            return
+
+        n_dec = decoded - self._win_decoded0
+        n_drop = dropped - self._win_dropped0
+        decode_fps = n_dec / span
+        metrics = {
+            "decode_fps": decode_fps,
+            "decode_ratio": decode_fps / float(self.current["fps_hz"]),
+            "frame_age": self._win_age_max,
+            "drop_ratio": (n_drop / n_dec) if n_dec > 0 else 0.0,
+            "headroom": 1.0 - (self._win_busy / max(1, self._win_loops)) / self.loop_budget,
+        }
+        self.last_metrics = metrics
+        self._reset_window(now, decoded, dropped)
+        self._evaluate(metrics, now)
+
+    def _reset_window(self, now, decoded, dropped):
+        self._win_t0 = now
+        self._win_decoded0 = decoded
+        self._win_dropped0 = dropped
+        self._win_age_max = 0.0
+        self._win_busy = 0.0
+        self._win_loops = 0
+
+    # -----------------------
+    # decision
+    # -----------------------
+    def _bad_reasons(self, m):
+        reasons = []
+        if m["decode_ratio"] < self.bad_decode_ratio:
+            reasons.append(f"decode {m['decode_fps']:.1f}fps < {self.bad_decode_ratio:.0%} of {self.current['fps_hz']}")
+        if m["frame_age"] > self.bad_frame_age:
+            reasons.append(f"frame_age {m['frame_age'] * 1000:.0f}ms")
+        if m["drop_ratio"] > self.bad_drop_ratio:
+            reasons.append(f"drops {m['drop_ratio']:.0%}")
+        if m["headroom"] < self.bad_headroom:
+            reasons.append(f"loop headroom {m['headroom']:.0%}")
+        return reasons
+
+    def _is_good(self, m):
+        return (
+            m["decode_ratio"] >= self.good_decode_ratio
+            and m["frame_age"] <= self.good_frame_age
+            and m["drop_ratio"] <= self.good_drop_ratio
+            and m["headroom"] >= self.good_headroom
+        )
+
+    def _evaluate(self, m, now):
+        if self._applying or (now - self._last_change) < self.hold_sec:
+            self._bad_n = self._good_n = 0
+            return
+
+        reasons = self._bad_reasons(m)
+        if reasons:
+            self._bad_n += 1
+            self._good_n = 0
+            if self._bad_n >= self.down_after and self.level > 0:
+                self._change(self.level - 1, "down: " + ", ".join(reasons), now)
+        elif self._is_good(m):
+            self._good_n += 1
+            self._bad_n = 0
+            if self._good_n >= self.up_after and self.level < len(self.levels) - 1:
+                self._change(
+                    self.level + 1,
+                    f"up: stable {self._good_n * self.eval_sec:.0f}s "
+                    f"(decode {m['decode_fps']:.1f}fps, headroom {m['headroom']:.0%})",
+                    now,
+                )
+        else:
+            # どちらでもない（グレー）ときはカウントを戻すだけ
+            self._bad_n = self._good_n = 0
+
+    def _change(self, new_level, reason, now):
+        old = self.current
+        new = self.levels[new_level]
+        self.level = new_level
+        self._last_change = now
+        self._bad_n = self._good_n = 0
+        self.history.append((now, old["name"], new["name"], reason))
+        print(f"[STREAM] {old['name']} -> {new['name']}  ({reason})")
+
+        self._applying = True
+        threading.Thread(target=self._apply_worker, args=(new,), daemon=True).start()
+
+    def _apply_worker(self, level):
+        try:
+            self.apply(level)
+        except Exception as e:
+            print(f"[STREAM] apply {level['name']} failed: {e}")
+        finally:
+            self._applying = False
@@ -0,0 +1,67 @@
+# telemetry.py
+import math
+
+
+# state パケットのフィールド → 型（djitellopy の INT/FLOAT_STATE_FIELDS と同じ分け方）
+INT_FIELDS = ("pitch", "roll", "yaw", "vgx", "vgy", "vgz", "templ", "temph", "tof", "h", "bat", "time")
+FLOAT_FIELDS = ("baro", "agx", "agy", "agz")
+DERIVED_FIELDS = ("speed", "temp")
+
+
+def _num(v, conv):
+    if v is None:
+        return None
+    try:
+        return conv(float(v)) if conv is int else conv(v)
+    except (TypeError, ValueError):
+        return None
+
+
+class TelemetrySnapshot:
+    """
+    state パケット1つ分のテレメトリ（読み取り専用）。
+
+    数値は受信時に1回だけ変換済み。無いフィールドは None。
+      ts    : 受信時刻（time.perf_counter 基準）
+      speed : |(vgx, vgy, vgz)|
+      temp  : (templ + temph) / 2
+    """
+
+    __slots__ = ("ts",) + INT_FIELDS + FLOAT_FIELDS + DERIVED_FIELDS
+
+    def __init__(self, ts, **fields):
+        setter = object.__setattr__
+        setter(self, "ts", float(ts))
+        for k in INT_FIELDS + FLOAT_FIELDS:
+            setter(self, k, fields.get(k))
+
+        vgx, vgy, vgz = fields.get("vgx"), fields.get("vgy"), fields.get("vgz")
+        speed = None
+        if vgx is not None and vgy is not None and vgz is not None:
+            speed = math.sqrt(vgx * vgx + vgy * vgy + vgz * vgz)
+        setter(self, "speed", speed)
+
+        templ, temph = fields.get("templ"), fields.get("temph")
+        setter(self, "temp", None if templ is None or temph is None else (templ + temph) / 2.0)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TelemetrySnapshot is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("TelemetrySnapshot is immutable")
+
+    @classmethod
+    def from_state(cls, state, ts):
+        """djitellopy の state dict（値は str/int/float どれでも）から作る"""
+        fields = {}
+        for k in INT_FIELDS:
+            fields[k] = _num(state.get(k), int)
+        for k in FLOAT_FIELDS:
+            fields[k] = _num(state.get(k), float)
+        return cls(ts, **fields)
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __repr__(self):
+        return f"TelemetrySnapshot(ts={self.ts:.3f}, h={self.h}, bat={self.bat}, yaw={self.yaw})"
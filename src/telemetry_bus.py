@@ -0,0 +1,260 @@
+# telemetry_bus.py
+"""
+state UDP（8890）を専用スレッドで受けて、パケットごとに TelemetrySnapshot を配る。
+
+  bus = TelemetryBus().start()
+  tm = bus.latest.get()              # 最新値だけ欲しい側（UI/コントローラ）
+  sub = bus.subscribe("estimator")   # 全パケット欲しい側（推定器/レコーダ）
+  for tm in sub.drain(): ...
+
+djitellopy も Tello() の生成時に 8890 を bind するので、バスを使うときは
+claim_state_port() を Tello() より先に呼んで、djitellopy にはコマンド用ソケットだけ作らせる。
+"""
+import socket
+import threading
+import time
+from collections import deque
+
+from djitellopy import Tello
+import djitellopy.tello as _djitellopy_tello
+
+from perf_stats import Histogram, RateMeter
+from profiler import span
+from telemetry import FLOAT_FIELDS, INT_FIELDS, TelemetrySnapshot
+
+
+STATE_PORT = 8890
+
+# b"key" → (フィールド名, 変換関数)。int()/float() は bytes をそのまま受け付ける
+_FIELD_SPECS = {k.encode("ascii"): (k, int) for k in INT_FIELDS}
+_FIELD_SPECS.update({k.encode("ascii"): (k, float) for k in FLOAT_FIELDS})
+
+
+def parse_state_packet(data, ts):
+    """
+    b"pitch:0;roll:0;...;agz:-1000.00;\\r\\n" → TelemetrySnapshot。
+    decode せずに bytes のまま分割・変換する。壊れたフィールドは飛ばす。
+    """
+    fields = {}
+    for item in data.split(b";"):
+        key, sep, val = item.partition(b":")
+        spec = _FIELD_SPECS.get(key)
+        if spec is None or not sep:
+            continue
+        name, conv = spec
+        try:
+            fields[name] = conv(val)
+        except ValueError:
+            # int フィールドに "12.0" のような値が来ることがある
+            if conv is not int:
+                continue
+            try:
+                fields[name] = int(float(val))
+            except ValueError:
+                continue
+    return TelemetrySnapshot(ts, **fields)
+
+
+def claim_state_port():
+    """
+    djitellopy の受信スレッド初期化を肩代わりする（コマンド応答の受信だけ起動）。
+    これで djitellopy は 8890 を bind しなくなる。Tello() より前に呼ぶこと。
+    """
+    if _djitellopy_tello.threads_initialized:
+        return False
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("", Tello.CONTROL_UDP_PORT))
+    _djitellopy_tello.client_socket = sock
+    threading.Thread(target=Tello.udp_response_receiver, daemon=True).start()
+    _djitellopy_tello.threads_initialized = True
+    return True
+
+
+class LatestSlot:
+    """
+    最新値だけを持つスロット。読む側は (seq, value) のタプルを1回読むだけなのでロック無し
+    （GIL 下で参照の代入はアトミック）。
+    書く側は seq の読み出し → 代入がアトミックでないので、複数スレッドから put しても
+    同じ seq にならないようにロックを取る（RcSender はメインループ・見張り・キューから書かれる）。
+    """
+
+    __slots__ = ("_item", "_lock")
+
+    def __init__(self):
+        self._item = (0, None)
+        self._lock = threading.Lock()
+
+    def put(self, value):
+        """戻り値はこの値の seq"""
+        with self._lock:
+            seq = self._item[0] + 1
+            self._item = (seq, value)
+        return seq
+
+    def get(self):
+        return self._item[1]
+
+    def get_with_seq(self):
+        return self._item
+
+
+class Subscription:
+    """
+    有界キュー（deque(maxlen)）。溢れたら古いものから捨てる（dropped で数える）。
+    append/popleft は GIL 下でアトミックなのでロックは使わない。
+    """
+
+    def __init__(self, name, maxlen=64):
+        self.name = name
+        self.queue = deque(maxlen=maxlen)
+        self.dropped = 0
+        self._event = threading.Event()
+
+    def _push(self, item):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(item)
+        self._event.set()
+
+    def drain(self):
+        """溜まっている分を古い順に全部取り出す"""
+        self._event.clear()
+        out = []
+        q = self.queue
+        while q:
+            try:
+                out.append(q.popleft())
+            except IndexError:
+                break
+        return out
+
+    def wait(self, timeout=None):
+        """新しいパケットが来るまで待つ（来たら True）"""
+        if self.queue:
+            return True
+        return self._event.wait(timeout)
+
+
+class TelemetryBus:
+    """
+    state ソケットを所有して、受信したパケットを配るスレッド。
+
+      latest      : LatestSlot（最新の TelemetrySnapshot）
+      subscribe() : 全パケットを受け取る有界キュー
+      packets / parse_errors / interarrival / rate : 受信統計
+      jitter      : 連続する到着間隔の差 |Δt_i - Δt_(i-1)|
+      gaps / max_gap : gap_sec 以上空いた回数と最大の空き（次のパケットが来た時点で数える）
+      silence()   : 最後のパケットからの経過秒（途切れている最中の判定用）
+
+    bind=False ならソケットもスレッドも持たず、受信側（tello_async の state 受信）が feed() で渡す。
+    """
+
+    def __init__(self, port=STATE_PORT, host="", source_host=None, clock=time.perf_counter, gap_sec=0.3,
+                 bind=True):
+        self.port = port
+        self.host = host
+        self.source_host = source_host   # None なら送信元を問わない
+        self.clock = clock
+
+        self.latest = LatestSlot()
+        self.subscribers = []
+
+        self.packets = 0
+        self.parse_errors = 0
+        self.interarrival = Histogram()
+        self.jitter = Histogram()
+        self.gap_sec = gap_sec
+        self.gaps = 0
+        self.max_gap = 0.0
+        self.last_ts = None
+        self._prev_dt = None
+        self.rate = RateMeter(window_sec=2.0, clock=clock)
+
+        self.sock = None
+        if bind:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.bind((host, port))
+            self.sock.settimeout(0.5)
+
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="telemetry-bus", daemon=True)
+
+    def start(self):
+        if self.sock is not None:
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        if self.sock is not None:
+            self.thread.join(timeout=1.0)
+            self.sock.close()
+
+    def subscribe(self, name, maxlen=64):
+        sub = Subscription(name, maxlen)
+        # 受信スレッドが反復中でも安全なように差し替える
+        self.subscribers = self.subscribers + [sub]
+        return sub
+
+    def unsubscribe(self, sub):
+        self.subscribers = [s for s in self.subscribers if s is not sub]
+
+    def _run(self):
+        buf = bytearray(2048)
+        view = memoryview(buf)
+        while not self.stopped:
+            try:
+                n, addr = self.sock.recvfrom_into(buf)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.feed(bytes(view[:n]), addr)
+
+    def feed(self, data, addr=None, ts=None):
+        """受信した state パケット1つを処理して配る（受信スレッド、または外部の受信側から）"""
+        ts = self.clock() if ts is None else ts
+        if self.source_host is not None and addr is not None and addr[0] != self.source_host:
+            return
+
+        try:
+            with span("parse_state", "telemetry"):
+                tm = parse_state_packet(data, ts)
+        except Exception:
+            self.parse_errors += 1
+            return
+
+        self.packets += 1
+        prev_ts = self.last_ts
+        if prev_ts is not None:
+            dt = ts - prev_ts
+            self.interarrival.observe(dt)
+            if self._prev_dt is not None:
+                self.jitter.observe(abs(dt - self._prev_dt))
+            self._prev_dt = dt
+            if dt >= self.gap_sec:
+                self.gaps += 1
+                if dt > self.max_gap:
+                    self.max_gap = dt
+        self.last_ts = ts
+        self.rate.mark(ts)
+
+        self.latest.put(tm)
+        for sub in self.subscribers:
+            sub._push(tm)
+
+    def silence(self, now=None):
+        """最後のパケットからの経過秒（まだ1つも来ていなければ None）"""
+        if self.last_ts is None:
+            return None
+        now = self.clock() if now is None else now
+        return now - self.last_ts
+
+    def wait_first(self, timeout=2.0):
+        """最初のパケットが来るまで待つ（connect 用）"""
+        t_end = time.perf_counter() + timeout
+        while self.latest.get() is None:
+            if time.perf_counter() > t_end:
+                return False
+            time.sleep(0.02)
+        return True
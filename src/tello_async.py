@@ -0,0 +1,300 @@
+# tello_async.py
+"""
+asyncio ベースの Tello SDK クライアント（djitellopy の代わり）。
+
+  コマンド(8889) : 送って応答を Future で待つ（タイムアウト・リトライ付き）
+  state(8890)    : 受信した datagram をそのまま TelemetryBus.feed() に渡す
+  RC             : 応答の無い送信。どのスレッドからでも呼べる
+
+イベントループは専用スレッド（"tello-async"）で回す。
+
+  client = AsyncTello("192.168.10.1", telemetry_bus=bus).start()
+  fut = client.submit(client.control("takeoff", timeout=20))   # concurrent.futures.Future
+  client.send_rc(0, 10, 0, 0)
+
+既にループの中にいるなら start() の代わりに await client.open() して await client.control(...)。
+
+Tello の応答にはどのコマンドへの応答かという情報が無いので、応答待ちは常に1つ
+（asyncio.Lock で直列化。複数のタスクから同時に投げても順番に送られる）。
+応答待ちが無いときに来た応答（タイムアウト後に遅れて来たもの）は捨てて stray で数える。
+
+SyncTello は TelloController が使う djitellopy の API（connect / takeoff / land / ...）を
+同じ名前で包む（呼んだスレッドはブロックする）。Future が欲しいときは control_async() / query_async()。
+
+映像(11111)は今まで通り VideoStream（PyAV が自分でソケットを開いてデコードする）が受ける。
+"""
+import asyncio
+import threading
+
+from djitellopy import Tello
+from djitellopy.tello import TelloException
+
+from link_monitor import LinkStats
+
+
+class _Datagram(asyncio.DatagramProtocol):
+    def __init__(self, on_datagram):
+        self.on_datagram = on_datagram
+
+    def datagram_received(self, data, addr):
+        self.on_datagram(data, addr)
+
+    def error_received(self, exc):
+        # 相手がまだいない（ICMP port unreachable）など。コマンド側はタイムアウトで分かる
+        pass
+
+
+class AsyncTello:
+    RESPONSE_TIMEOUT = Tello.RESPONSE_TIMEOUT
+    TAKEOFF_TIMEOUT = Tello.TAKEOFF_TIMEOUT
+    TIME_BTW_COMMANDS = Tello.TIME_BTW_COMMANDS
+    RETRY_COUNT = Tello.RETRY_COUNT
+
+    def __init__(self, host=Tello.TELLO_IP, command_port=Tello.CONTROL_UDP_PORT,
+                 local_port=Tello.CONTROL_UDP_PORT, state_port=Tello.STATE_UDP_PORT,
+                 telemetry_bus=None, link_stats=None):
+        self.address = (host, int(command_port))
+        self.local_port = local_port
+        self.state_port = state_port
+        self.telemetry_bus = telemetry_bus      # None なら state は受けない
+        self.link_stats = link_stats if link_stats is not None else LinkStats()
+
+        self.loop = None
+        self.thread = None
+        self._cmd = None        # コマンド/RC の transport
+        self._state = None      # state の transport
+        self._lock = None       # 応答待ちの直列化（ループの中で作る）
+        self._pending = None    # 応答待ちの Future
+        self._last_response_t = 0.0
+
+        self.stray = 0          # 応答待ちが無いときに来た応答
+        self.retries = 0        # 送り直した回数
+
+    # -----------------------
+    # lifecycle
+    # -----------------------
+    def start(self):
+        """専用スレッドでイベントループを回して open() する"""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="tello-async", daemon=True)
+        self.thread.start()
+        self.submit(self.open()).result(timeout=2.0)
+        return self
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self.loop = loop
+        self._lock = asyncio.Lock()
+        self._cmd, _ = await loop.create_datagram_endpoint(
+            lambda: _Datagram(self._on_response), local_addr=("0.0.0.0", self.local_port))
+        if self.telemetry_bus is not None:
+            self._state, _ = await loop.create_datagram_endpoint(
+                lambda: _Datagram(self._on_state), local_addr=("0.0.0.0", self.state_port))
+        return self
+
+    async def close(self):
+        for transport in (self._cmd, self._state):
+            if transport is not None:
+                transport.close()
+        self._cmd = self._state = None
+
+    def stop(self):
+        if self.thread is None:
+            return
+        try:
+            self.submit(self.close()).result(timeout=1.0)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=1.0)
+        if not self.thread.is_alive():
+            self.loop.close()
+        self.thread = None
+
+    def submit(self, coro):
+        """ループのスレッドで coro を動かす（concurrent.futures.Future を返す）"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    # -----------------------
+    # receive
+    # -----------------------
+    def _on_response(self, data, addr):
+        fut = self._pending
+        if fut is None or fut.done() or addr[0] != self.address[0]:
+            self.stray += 1
+            return
+        fut.set_result(data)
+
+    def _on_state(self, data, addr):
+        self.telemetry_bus.feed(data, addr)
+
+    # -----------------------
+    # commands
+    # -----------------------
+    async def command(self, command, timeout=None):
+        """1回だけ送って応答の文字列を返す（timeout 秒以内に来なければ None）"""
+        timeout = self.RESPONSE_TIMEOUT if timeout is None else timeout
+        clock = self.link_stats.clock
+        async with self._lock:
+            # 前の応答から TIME_BTW_COMMANDS は空ける（djitellopy と同じ）
+            gap = self.TIME_BTW_COMMANDS - (clock() - self._last_response_t)
+            if gap > 0:
+                await asyncio.sleep(gap)
+
+            fut = self.loop.create_future()
+            self._pending = fut
+            t_send = clock()
+            self._cmd.sendto(command.encode("utf-8"), self.address)
+            try:
+                data = await asyncio.wait_for(fut, timeout)
+            except asyncio.TimeoutError:
+                self.link_stats.observe_command(command, clock() - t_send, ok=False)
+                return None
+            finally:
+                self._pending = None
+
+            self._last_response_t = clock()
+            self.link_stats.observe_command(command, self._last_response_t - t_send, ok=True)
+        return data.decode("utf-8", errors="replace").rstrip("\r\n")
+
+    async def control(self, command, timeout=None, retries=None):
+        """"ok" が返るまで最大 retries 回（既定は djitellopy と同じ RETRY_COUNT）。だめなら TelloException"""
+        retries = self.RETRY_COUNT if retries is None else retries
+        response = "no response"
+        for i in range(retries):
+            if i > 0:
+                self.retries += 1
+            r = await self.command(command, timeout)
+            if r is None:
+                continue
+            response = r
+            if "ok" in r.lower():
+                return True
+        raise TelloException(f"Command '{command}' was unsuccessful for {retries} tries. "
+                             f"Latest response:\t'{response}'")
+
+    async def query(self, command, timeout=None, retries=None):
+        """読み出し（"battery?" など）。エラーや無応答なら送り直す。応答の文字列"""
+        retries = self.RETRY_COUNT if retries is None else retries
+        response = "no response"
+        for i in range(retries):
+            if i > 0:
+                self.retries += 1
+            r = await self.command(command, timeout)
+            if r is None:
+                continue
+            response = r
+            if not any(word in r for word in ("error", "ERROR", "False")):
+                return r
+        raise TelloException(f"Command '{command}' was unsuccessful for {retries} tries. "
+                             f"Latest response:\t'{response}'")
+
+    # -----------------------
+    # rc
+    # -----------------------
+    def send_rc(self, lr, fb, ud, yaw):
+        """応答の無い RC。ループ以外のスレッドからはループに渡して送る"""
+        data = f"rc {int(lr)} {int(fb)} {int(ud)} {int(yaw)}".encode("ascii")
+        if threading.current_thread() is self.thread:
+            self._send_rc(data)
+        else:
+            self.loop.call_soon_threadsafe(self._send_rc, data)
+
+    def _send_rc(self, data):
+        if self._cmd is None:
+            return
+        self._cmd.sendto(data, self.address)
+        self.link_stats.observe_rc()
+
+
+class SyncTello:
+    """
+    AsyncTello を djitellopy.Tello と同じ名前で呼べるようにする包み（TelloController 用）。
+    各メソッドは結果が出るまで呼んだスレッドをブロックする。
+    """
+
+    VS_UDP_IP = Tello.VS_UDP_IP
+
+    def __init__(self, client, video_port=Tello.VS_UDP_PORT):
+        self.client = client
+        self.vs_udp_port = video_port
+        self.is_flying = False
+        self.stream_on = False
+
+    @property
+    def address(self):
+        return self.client.address
+
+    def _run(self, coro):
+        return self.client.submit(coro).result()
+
+    # Future が欲しいとき
+    def control_async(self, command, timeout=None):
+        return self.client.submit(self.client.control(command, timeout))
+
+    def query_async(self, command, timeout=None):
+        return self.client.submit(self.client.query(command, timeout))
+
+    # -----------------------
+    # djitellopy 互換
+    # -----------------------
+    def connect(self, wait_for_state=True):
+        self._run(self.client.control("command"))
+        bus = self.client.telemetry_bus
+        if wait_for_state and (bus is None or not bus.wait_first(timeout=1.0)):
+            raise TelloException("Did not receive a state packet from the Tello")
+
+    def takeoff(self):
+        self._run(self.client.control("takeoff", timeout=self.client.TAKEOFF_TIMEOUT))
+        self.is_flying = True
+
+    def land(self):
+        self._run(self.client.control("land"))
+        self.is_flying = False
+
+    def streamon(self):
+        self._run(self.client.control("streamon"))
+        self.stream_on = True
+
+    def streamoff(self):
+        self._run(self.client.control("streamoff"))
+        self.stream_on = False
+
+    def set_video_resolution(self, resolution):
+        self._run(self.client.control(f"setresolution {resolution}"))
+
+    def set_video_fps(self, fps):
+        self._run(self.client.control(f"setfps {fps}"))
+
+    def set_video_bitrate(self, bitrate):
+        self._run(self.client.control(f"setbitrate {bitrate}"))
+
+    def query_battery(self):
+        return int(self._run(self.client.query("battery?")))
+
+    def get_battery(self):
+        tm = self.get_current_state()
+        if tm and tm.get("bat") is not None:
+            return tm["bat"]
+        return self.query_battery()
+
+    def get_current_state(self):
+        bus = self.client.telemetry_bus
+        tm = None if bus is None else bus.latest.get()
+        return {} if tm is None else tm.as_dict()
+
+    def send_rc_control(self, left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity):
+        self.client.send_rc(left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity)
+
+    def get_udp_video_address(self):
+        return f"udp://@{self.VS_UDP_IP}:{self.vs_udp_port}"
+
+    def end(self):
+        try:
+            if self.is_flying:
+                self.land()
+            if self.stream_on:
+                self.streamoff()
+        except TelloException:
+            pass
+        self.client.stop()
@@ -1,14 +1,66 @@
 # tello_controller.py
+import math
 import time
+from collections import deque
+from typing import TYPE_CHECKING
+
 import numpy as np
 from djitellopy import Tello
-from keyboard_state import KeyboardState
+
+import approach_config
+from command_queue import CommandQueue
+from link_monitor import InstrumentedTello, LinkStats
+from perf_stats import Histogram
+from pid import PID, StepResponse, gains_at
+from profiler import span
+from rc_sender import RcSender
+from safety_watchdog import SafetyWatchdog
+from state_estimator import StateEstimator
+from tello_async import AsyncTello, SyncTello
+from stream_governor import StreamGovernor
+from telemetry import TelemetrySnapshot
+from telemetry_bus import TelemetryBus, claim_state_port
+from timeseries import FlightHistory
+from video_stream import VideoStream
+
+if TYPE_CHECKING:
+    # pynput は X が無い環境（リプレイ/CI）では import できないので型注釈専用にする
+    from keyboard_state import KeyboardState
+
+
+# 遅延補償の移動量用のバケット [px]
+COMP_PX_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 400)
+# セミオートの収束時間用のバケット [s]
+CONVERGE_BOUNDS = (0.5, 1, 2, 3, 5, 8, 12, 20, 30, 60)
+# ステップ応答のオーバーシュート用のバケット（|e0| に対する比）
+OVERSHOOT_BOUNDS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0)
+
+
+def _sec(v):
+    return "--" if v is None else f"{v:.2f}s"
 
 
 def clamp_int(x, lo, hi):
     return int(max(lo, min(hi, x)))
 
 
+def marker_side_deg(corners):
+    """
+    正方形マーカーを斜めから見ている角度 [deg]（[tl, tr, br, bl] の4隅から）。
+    大きさは横の縮み（幅/高さ = cos）、向きは左右の辺の長さの差（近い側が長い）。
+    正ならマーカーの正面は右側（右に動けば正面に回り込める）
+    """
+    tl, tr, br, bl = np.asarray(corners, dtype=np.float64)[:4]
+    h_left = float(np.linalg.norm(bl - tl))
+    h_right = float(np.linalg.norm(br - tr))
+    width = 0.5 * (float(np.linalg.norm(tr - tl)) + float(np.linalg.norm(br - bl)))
+    height = 0.5 * (h_left + h_right)
+    if height <= 0.0:
+        return 0.0
+    deg = math.degrees(math.acos(min(1.0, width / height)))
+    return deg if h_left >= h_right else -deg
+
+
 class TelloController:
     """
     送信軸は必ずこれ：
@@ -19,8 +71,29 @@ class TelloController:
         yaw: +時計回り
     """
 
-    def __init__(self, keyboard_state: KeyboardState):
-        self.tello = Tello()
+    def __init__(self, keyboard_state: "KeyboardState", tello=None, clock=time.time,
+                 host=None, command_port=None, use_telemetry_bus=True, async_client=False):
+        # tello: テスト/リプレイ用に差し替え可能（None なら実機の djitellopy.Tello）
+        # clock: 見失い判定などに使う時計（リプレイでは記録時刻を返す）
+        # host/command_port: ローカルのスタンドイン（fake_drone.py）に繋ぐとき用
+        # use_telemetry_bus: state(8890) を TelemetryBus で受ける（実機のときだけ）
+        # async_client: djitellopy の代わりに tello_async（asyncio の UDP クライアント）を使う
+        self.telemetry_bus = None
+        # 通信リンクの計測（コマンド往復時間・RC 送信間隔）。差し替えた tello では数えない
+        self.link_stats = LinkStats()
+        if tello is None and async_client:
+            tello = self._start_async_tello(host or Tello.TELLO_IP, command_port or Tello.CONTROL_UDP_PORT)
+        elif tello is None:
+            if use_telemetry_bus:
+                self.telemetry_bus = self._start_telemetry_bus(host or Tello.TELLO_IP)
+            kwargs = {"host": host} if host else {}
+            tello = InstrumentedTello(link_stats=self.link_stats, **kwargs)
+            if command_port:
+                tello.address = (tello.address[0], int(command_port))
+        self.tello = tello
+        self.clock = clock
+        # フレームの撮影時刻・RC の送信時刻の時計（capture_ts と同じもの。バッチのシミュレーションでは模擬時刻）
+        self.perf_clock = time.perf_counter
         self.in_flight = False
         self.frame_read = None
         self.kb = keyboard_state
@@ -37,32 +110,67 @@ class TelloController:
 
         # ---- セミオート ----
         self.approach_enabled = False
+        # 離陸中に p を押したとき、離陸できたらキューのワーカーが True にする。
+        # 反映（set_approach）はメインループの update_motion_from_keyboard で行う
+        self._approach_requested = False
         self.target_aruco_id = None
+        # "yaw"  : yaw で中央に合わせてから fb で距離を詰める（lr/ud は 0）
+        # "servo": lr/fb/ud/yaw を同時に動かす（マーカーの上下のずれと斜めの向きも直す）
+        self.approach_mode = "yaw"
 
+        # 各軸のゲイン・上限は approach_config.py の PID（configure_approach で差し替え）。ここは不感帯など
         # 中央合わせ
         self.center_dead_px = 14
-        self.k_err_to_yaw = 0.35
-        self.yaw_max = 60
 
         # 距離合わせ（size_px）
         self.target_size_px = 220
+        self.size_ref_w = 960   # target_size_px はこの横幅の映像での値（解像度が変わったら換算）
         self.size_dead_px = 12
-        self.k_size_to_fb = 0.25
-        self.fb_max = 35
         self.fb_min = 10
 
+        # servo モードだけで使う軸
+        # 上下（マーカー中心の縦のずれ）
+        self.ud_dead_px = 20
+        # 左右（マーカーを斜めから見ている角度。正面に回り込む）
+        self.side_dead_deg = 8.0
+
+        # 収束時間: HOLD がこの秒数続いたら「収束」とみなす
+        self.converge_hold_sec = 0.5
+        self.approach_converge = Histogram(CONVERGE_BOUNDS)
+        self._approach_run = None   # {"mode", "t_start", "hold_since", "t_converge", "steps"}
+        # ステップ応答（セミオート1回ごと、軸ごと）
+        self.approach_step = {
+            axis: {"rise": Histogram(CONVERGE_BOUNDS), "overshoot": Histogram(OVERSHOOT_BOUNDS),
+                   "settle": Histogram(CONVERGE_BOUNDS)}
+            for axis in ("yaw", "fb", "ud", "lr")
+        }
+        self.approach_step_last = None   # 直近の1回分 {axis: StepResponse.result()}
+
         # 見失い停止
-        self.last_marker_ts = 0.0
+        self.last_marker_ts = 0.0   # マーカーが写ったフレームの撮影時刻（self.clock の時計）
         self.lost_stop_sec = 0.4
 
+        # 遅延補償: フレームの撮影から今までに送った yaw の分だけ、マーカーの位置を先回りさせる
+        self.latency_comp = True
+        self.yaw_deg_per_cmd = 0.9      # yaw=1 あたりの回転速度 [deg/s]（yaw=100 で約 90deg/s）
+        self.camera_hfov_deg = 70.2     # 960x720 で対角 82.6deg
+        self.max_comp_age = 0.5         # これより古いフレームは補償しない（止まっていた等）
+
         # ★符号が逆ならここだけ変える
         self.inv_yaw = False   # 右にあるマーカーへ向けて回らないなら True に
-        # lrは基本使わない（yawで合わせる）。必要なら後で追加。
+        # lr/ud を使うかは approach_mode 次第: yaw モードは yaw と fb だけ（lr/ud は 0）、
+        # servo モードは lr（斜めから見ている角度）・ud（縦のずれ）も合わせる4軸
 
         # smoothing（少しだけ）
         self.smooth = 0.35
         self._yaw_f = 0.0
         self._fb_f = 0.0
+        self._lr_f = 0.0
+        self._ud_f = 0.0
+
+        self.approach_pid = {}
+        self.gain_schedule = {}
+        self.configure_approach(approach_config.load())
 
         # ---- UI / debug ----
         self.approach_state = "OFF"
@@ -70,20 +178,212 @@ class TelloController:
         self.approach_size_px = None
         self.approach_yaw = 0
         self.approach_fb = 0
+        self.approach_lr = 0
+        self.approach_ud = 0
+        self.approach_err_y = None
+        self.approach_side_deg = None
+        self.approach_converge_sec = None   # 直近の収束時間 [s]
+        self.approach_dist_m = None         # size_px から推定したマーカーまでの距離 [m]
+        self.last_rc = None  # 直近に送信した (lr, fb, ud, yaw)
+        self.last_rc_ts = None  # その送信が終わった時刻（perf_counter）
+        self.last_rc_seq = 0    # 直近に置いた RC の番号（RcSender の slot の seq）
+        self.approach_age = None        # 使ったフレームの古さ [s]
+        self.approach_comp_px = None    # 遅延補償で err_x を動かした量 [px]
+        self.approach_comp = {
+            "age": Histogram(),
+            "shift_px": Histogram(COMP_PX_BOUNDS),
+        }
+
+        # ---- RC の送信 ----
+        # 接続後は RcSender が rc_rate_hz で送る（メインループは最新値を置くだけ）。
+        # 送信スレッドが無い（リプレイ等）ときは update_motion がその場で送る
+        self.rc_rate_hz = 20.0
+        self.rc_sender = None
+        self._rc_sent_log = deque(maxlen=64)   # (seq, 送信時刻, (lr, fb, ud, yaw))
+        self.last_command_ts = None     # 最後に update_motion で RC を置いた時刻（perf_clock）
+
+        # ---- 見張り（SafetyWatchdog。接続後に別スレッドで動く）----
+        # RC が rc_stale_sec 置かれなければ 0 に、state が telemetry_loss_sec 来ない・
+        # 電池が critical_battery 以下なら着陸させる
+        self.watchdog_enabled = True
+        self.watchdog = None
+        self.rc_stale_sec = 0.5
+        self.telemetry_loss_sec = 3.0
+        self.critical_battery = 10
+
+        # ---- 応答待ちのあるコマンド（離陸・着陸・画質変更など）----
+        # 接続後は CommandQueue のワーカーで順に実行する（UI を止めない）。
+        # キューが無い（リプレイ等）ときはその場で実行する
+        self.command_queue = None
+        self.stream_on = False
+        self.min_takeoff_battery = 20
+        # 終了時に実行中・待ち中の land を待つ上限（djitellopy は応答待ち 7s × リトライ 3 回）
+        self.cleanup_join_sec = 25.0
+
+        # ---- テレメトリ（state パケット1つ = スナップショット1つ）----
+        self._state_obj = None
+        self._telemetry = None
+
+        # ---- 履歴（テレメトリ / RC / 検出）----
+        self.history = FlightHistory()
+        self._history_sub = None
+        if self.telemetry_bus is not None:
+            self._history_sub = self.telemetry_bus.subscribe("history", maxlen=256)
+
+        # ---- 位置・速度の推定（バスがあれば専用スレッド、無ければ update_estimate で進める）----
+        self.estimator = StateEstimator()
+        if self.telemetry_bus is not None:
+            self.estimator.start(self.telemetry_bus)
+
+        # ---- 映像ストリームの画質調整 ----
+        self.stream_governor_enabled = True
+        self.stream_governor = None
 
     # -----------------------
     # connect / frame
     # -----------------------
+    @staticmethod
+    def _start_telemetry_bus(source_host):
+        # djitellopy が先に 8890 を取っていたら（別の Tello() が既にある等）従来のポーリングに戻す
+        if not claim_state_port():
+            print("[TELEMETRY] state port already owned by djitellopy; polling instead")
+            return None
+        try:
+            return TelemetryBus(source_host=source_host).start()
+        except OSError as e:
+            print("[TELEMETRY] bus start failed:", e)
+            return None
+
+    def _start_async_tello(self, host, command_port):
+        # state はクライアントのループが受けて、ソケットを持たないバスに渡す
+        self.telemetry_bus = TelemetryBus(source_host=host, bind=False)
+        client = AsyncTello(host, command_port, telemetry_bus=self.telemetry_bus,
+                            link_stats=self.link_stats).start()
+        return SyncTello(client)
+
     def connect_and_start_stream(self):
-        self.tello.connect()
-        print(f"Battery: {self.tello.get_battery()}%")
+        if self.telemetry_bus is not None:
+            # state はバスが受けるので djitellopy 側では待たない
+            self.tello.connect(wait_for_state=False)
+            if not self.telemetry_bus.wait_first(timeout=2.0):
+                print("[TELEMETRY] no state packet yet")
+        else:
+            self.tello.connect()
+        print(f"Battery: {self.get_battery()}%")
+        self.rc_sender = RcSender(self._send_rc, rate_hz=self.rc_rate_hz,
+                                  active=lambda: self.in_flight).start()
+        if self.watchdog_enabled:
+            self.watchdog = SafetyWatchdog(self, stale_sec=self.rc_stale_sec,
+                                           telemetry_loss_sec=self.telemetry_loss_sec,
+                                           critical_battery=self.critical_battery).start()
         self.tello.streamon()
-        self.frame_read = self.tello.get_frame_read()
+        self.stream_on = True
+        self.command_queue = CommandQueue().start()
+        self.frame_read = VideoStream(self.tello.get_udp_video_address()).start()
+        if self.stream_governor_enabled:
+            self.stream_governor = StreamGovernor(self._apply_stream_level)
 
     def get_frame(self):
-        if self.frame_read is None or self.frame_read.frame is None:
+        frame = None if self.frame_read is None else self.frame_read.frame
+        if frame is None:
             return np.zeros((480, 640, 3), dtype=np.uint8)
-        return self.frame_read.frame[:, :, ::-1]  # RGB->BGR
+        return frame  # VideoStream は BGR で返す
+
+    def get_stream_health(self):
+        """映像ストリームの計測値（VideoStream.health()）。未接続なら None"""
+        fr = self.frame_read
+        if fr is None or not hasattr(fr, "health"):
+            return None
+        return fr.health()
+
+    def acquire_frame(self):
+        """
+        最新フレームを PooledFrame で借りる（.array が BGR, .seq が連番）。
+        コピーしないので、使い終わったら release() すること。映像が無ければ None。
+        """
+        fr = self.frame_read
+        if fr is None or not hasattr(fr, "acquire"):
+            return None
+        return fr.acquire()
+
+    # -----------------------
+    # stream quality
+    # -----------------------
+    def update_stream_governor(self, loop_busy):
+        """毎ループ呼ぶ。loop_busy はこのループの処理時間[s]（sleep を除く）"""
+        fr = self.frame_read
+        if fr is None or self.stream_governor is None:
+            return
+        decoded, _, dropped = fr.counters()
+        ts = fr.last_frame_ts
+        age = (time.perf_counter() - ts) if ts > 0 else None
+        self.stream_governor.update(decoded=decoded, dropped=dropped, frame_age=age, loop_busy=loop_busy)
+
+    def _apply_stream_level(self, level):
+        # StreamGovernor のワーカースレッドから呼ばれる。他のコマンドと応答が混ざらないように
+        # キューに積んで終わるまで待つ（待ち中に次の変更が来たら新しい方だけ送る）
+        def apply():
+            self.tello.set_video_resolution(level["resolution"])
+            self.tello.set_video_fps(level["fps"])
+            self.tello.set_video_bitrate(level["bitrate"])
+
+        job = self._submit("stream_level", apply, replace=True)
+        if job is not None:
+            job.wait()
+            if job.error is not None:
+                raise RuntimeError(job.error)
+
+    # -----------------------
+    # telemetry
+    # -----------------------
+    @property
+    def telemetry(self):
+        """
+        最新の TelemetrySnapshot（まだ state が来ていなければ None）。
+        djitellopy はパケットごとに state dict を作り直すので、dict が変わったときだけ変換する。
+        """
+        if self.telemetry_bus is not None:
+            return self.telemetry_bus.latest.get()
+        try:
+            st = self.tello.get_current_state()
+        except Exception:
+            return self._telemetry
+        if st is not self._state_obj:
+            self._state_obj = st
+            self._telemetry = TelemetrySnapshot.from_state(st, time.perf_counter()) if st else None
+        return self._telemetry
+
+    def update_history(self):
+        """
+        テレメトリ履歴を進める（メインループから毎回呼ぶ）。
+        バスがあれば届いた全パケット、無ければ最新のスナップショットだけ追加する。
+        """
+        if self._history_sub is not None:
+            for tm in self._history_sub.drain():
+                self.history.add_telemetry(tm)
+        else:
+            self.history.add_telemetry(self.telemetry)
+
+    def update_estimate(self):
+        """
+        最新の推定（Estimate / まだなら None）。
+        バスが無いときはここで最新のスナップショットを1件ずつ推定器に入れる。
+        """
+        if self.estimator.thread is None:
+            tm = self.telemetry
+            if tm is not None and tm.ts != self.estimator.last_ts:
+                self.estimator.step(tm)
+        return self.estimator.latest.get()
+
+    def get_link_summary(self):
+        """通信リンクの計測の1行要約（HUD 用）"""
+        return self.link_stats.summary(self.telemetry_bus)
+
+    def get_battery(self):
+        tm = self.telemetry
+        if tm is not None and tm.bat is not None:
+            return tm.bat
+        return self.tello.get_battery()
 
     # -----------------------
     # keys
@@ -93,39 +393,138 @@ class TelloController:
             return True
 
         if key == ord('t'):
-            try:
-                b = self.tello.get_battery()
-                if b < 20:
-                    print("Battery too low for takeoff.")
-                else:
-                    self.tello.takeoff()
-                    self.in_flight = True
-                    self.stop_all()
-            except Exception as e:
-                print("Takeoff failed:", e)
+            if not self.in_flight:
+                self._approach_requested = False
+                self._submit("takeoff", self._do_takeoff, cancels=("land",))
 
         elif key == ord('g'):
-            try:
-                self.tello.land()
-            except Exception as e:
-                print("Land failed:", e)
-            self.in_flight = False
-            self.stop_all()
+            self.request_land()
 
         elif key == ord('p'):
-            self.approach_enabled = not self.approach_enabled
-            print(f"[APPROACH] enabled={self.approach_enabled}")
-            self.stop_all()
-            self.approach_state = "ON" if self.approach_enabled else "OFF"
+            if self.command_queue is not None and self.command_queue.cancel("approach"):
+                print("[APPROACH] pending enable cancelled")
+            elif not self.approach_enabled and self.command_queue is not None \
+                    and self.command_queue.busy("takeoff"):
+                # 離陸中なら離陸が終わってから ON にする（離陸に失敗したら ON にしない）
+                self._submit("approach", self._request_approach)
+            else:
+                self.set_approach(not self.approach_enabled)
+
+        elif key == ord('m'):
+            self.toggle_approach_mode()
+
+        elif key == ord('b'):
+            self._submit("battery", self._do_battery_check)
+
+        elif key == ord('o'):
+            self._submit("stream", self._do_toggle_stream)
 
         return False
 
+    def request_land(self):
+        """g キーと SafetyWatchdog から。メインループ以外のスレッドから呼んでもよい"""
+        # 先に RC の送信を止める（land の応答待ちの間に動かさない）。
+        # 待ち中の離陸・セミオート ON は取り消して、列の先頭に入れる
+        self.in_flight = False
+        self._approach_requested = False
+        self.stop_all()
+        return self._submit("land", self._do_land, urgent=True, cancels=("takeoff", "approach"))
+
+    def _submit(self, name, fn, **kwargs):
+        """キューがあれば積んで Job を返す。無ければその場で実行して None"""
+        if self.command_queue is not None:
+            return self.command_queue.submit(name, fn, **kwargs)
+        try:
+            fn()
+        except Exception as e:
+            print(f"{name} failed:", e)
+        return None
+
+    def get_command_status(self):
+        """キューのジョブの表示（HUD 用）。キューが無ければ []"""
+        q = self.command_queue
+        return [] if q is None else q.status()
+
+    def configure_approach(self, cfg):
+        """approach_config.load() の結果で各軸の PID とゲインスケジュールを作り直す"""
+        self.approach_pid = {axis: PID(**params) for axis, params in cfg["pid"].items()}
+        self.gain_schedule = dict(cfg["schedule"])
+        self.marker_size_m = float(cfg["marker_size_m"])
+        self.offcenter_fb_scale = float(cfg["offcenter_fb_scale"])
+
+    def set_approach(self, enabled):
+        self._finish_approach_run()
+        self.approach_enabled = bool(enabled)
+        print(f"[APPROACH] enabled={self.approach_enabled} mode={self.approach_mode}")
+        self.stop_all()
+        self.approach_state = "ON" if self.approach_enabled else "OFF"
+        self.approach_converge_sec = None
+        self._approach_run = None
+        if self.approach_enabled:
+            bands = {"yaw": self.center_dead_px, "fb": self.size_dead_px,
+                     "ud": self.ud_dead_px, "lr": self.side_dead_deg}
+            self._approach_run = {"mode": self.approach_mode, "t_start": self.clock(),
+                                  "hold_since": None, "t_converge": None,
+                                  "steps": {axis: StepResponse(b) for axis, b in bands.items()}}
+
+    def toggle_approach_mode(self):
+        self.approach_mode = "servo" if self.approach_mode == "yaw" else "yaw"
+        print(f"[APPROACH] mode={self.approach_mode}")
+        if self.approach_enabled:
+            # 収束時間はモードごとに測り直す
+            self.set_approach(True)
+
+    # キューのワーカー（リプレイではメインループ）から呼ばれる
+    def _do_takeoff(self):
+        b = self.get_battery()
+        if b < self.min_takeoff_battery:
+            raise RuntimeError(f"battery too low for takeoff ({b}%)")
+        self.tello.takeoff()
+        self.stop_all()   # 送信スレッドが古い値を送らないように先にゼロにする
+        # 離陸の応答待ちの間に land が積まれていたら RC は送り始めない
+        if self.command_queue is None or not self.command_queue.busy("land"):
+            self.in_flight = True
+
+    def _request_approach(self):
+        """離陸の後ろに積まれた ON の要求。ここでは旗を立てるだけ（制御の状態はメインループだけが触る）"""
+        if not self.in_flight:
+            raise RuntimeError("not in flight (takeoff failed or landing)")
+        self._approach_requested = True
+
+    def _do_land(self):
+        self.in_flight = False
+        self.stop_all()
+        self.tello.land()
+
+    def _do_battery_check(self):
+        b = self.tello.query_battery()
+        print(f"[BATTERY] {b}%")
+        return b
+
+    def _do_toggle_stream(self):
+        if self.stream_on:
+            self.tello.streamoff()
+            self.stream_on = False
+        else:
+            self.tello.streamon()
+            self.stream_on = True
+        print(f"[STREAM] video {'on' if self.stream_on else 'off'}")
+
     def stop_all(self):
         self.lr = self.fb = self.ud = self.yaw = 0
+        if self.rc_sender is not None:
+            # 離陸/着陸の直後に前の値が送られないように
+            self.last_rc_seq = self.rc_sender.set((0, 0, 0, 0))
         self._yaw_f = 0.0
         self._fb_f = 0.0
+        self._lr_f = 0.0
+        self._ud_f = 0.0
+        for pid in self.approach_pid.values():
+            pid.reset()
         self.approach_yaw = 0
         self.approach_fb = 0
+        self.approach_lr = 0
+        self.approach_ud = 0
 
     # -----------------------
     # manual
@@ -145,6 +544,10 @@ class TelloController:
         """
         if not self.in_flight:
             return
+        if self._approach_requested:
+            self._approach_requested = False
+            if not self.approach_enabled:
+                self.set_approach(True)
 
         lr = fb = ud = yw = 0
         speed = self.speed
@@ -183,7 +586,15 @@ class TelloController:
     # -----------------------
     # semi-auto
     # -----------------------
-    def update_approach_from_aruco(self, marker_info, frame_shape):
+    def update_approach_from_aruco(self, marker_info, frame_shape, capture_ts=None, comp_px=None):
+        """
+        capture_ts: marker_info を出したフレームの撮影時刻（perf_clock）。
+        あれば見失い判定をその時刻基準にし、撮影後に送った yaw の分だけ err_x を補正する
+        comp_px: 補正量を計算せずにこの値を使う（リプレイ用。記録時の RC の送信時刻は残っていないので）
+        """
+        # このフレームで使った値だけを残す（記録・HUD 用）
+        self.approach_age = None
+        self.approach_comp_px = None
         if not self.in_flight:
             return
         if not self.approach_enabled:
@@ -195,7 +606,7 @@ class TelloController:
             self.approach_state = "MANUAL"
             return
 
-        now = time.time()
+        now = self.clock()
 
         if marker_info is None:
             # 見失い停止
@@ -203,42 +614,78 @@ class TelloController:
                 self.stop_all()
             self.approach_state = "NO_MARKER"
             self.approach_err_x = None
+            self.approach_err_y = None
+            self.approach_side_deg = None
             self.approach_size_px = None
             self.approach_yaw = 0
             self.approach_fb = 0
+            self.approach_lr = 0
+            self.approach_ud = 0
+            self._track_converge(now, False)
             return
 
-        self.last_marker_ts = now
+        age = None
+        if capture_ts is not None:
+            age = max(0.0, self.perf_clock() - capture_ts)
+        self.last_marker_ts = now - (age or 0.0)
 
         h, w = frame_shape[:2]
         cx, cy = marker_info["center"]
-        size_px = float(marker_info["size_px"])
+        size_px = float(marker_info["size_px"]) * (self.size_ref_w / float(w))
 
         err_x = float(cx - (w / 2.0))  # +なら右
+        self.approach_age = age
+        self.approach_comp_px = None
+        if self.latency_comp and age is not None and age <= self.max_comp_age:
+            shift = self._yaw_shift_px(capture_ts, capture_ts + age, w) if comp_px is None else float(comp_px)
+            err_x += shift
+            self.approach_comp_px = shift
+            self.approach_comp["age"].observe(age)
+            self.approach_comp["shift_px"].observe(abs(shift))
         self.approach_err_x = err_x
         self.approach_size_px = size_px
+        # ゲインスケジュール用の距離（ピンホール。size_px は size_ref_w 換算なので焦点距離もそちらで）
+        focal_px = (self.size_ref_w / 2.0) / math.tan(math.radians(self.camera_hfov_deg) / 2.0)
+        self.approach_dist_m = self.marker_size_m * focal_px / max(size_px, 1.0)
 
-        # 1) yawで中央へ
-        yaw_cmd = 0.0
-        if abs(err_x) > self.center_dead_px:
-            yaw_cmd = self.k_err_to_yaw * err_x
+        if self.approach_mode == "servo":
+            lr_cmd, fb_cmd, ud_cmd, yaw_cmd = self._servo_commands(now, marker_info, w, h, err_x, size_px)
+        else:
+            fb_cmd, yaw_cmd = self._yaw_then_fb_commands(now, err_x, size_px)
+            lr_cmd = ud_cmd = 0
+        self._track_converge(now, self.approach_state == "HOLD")
+
+        self.lr = lr_cmd
+        self.fb = fb_cmd
+        self.ud = ud_cmd
+        self.yaw = yaw_cmd
 
-        yaw_cmd = clamp_int(yaw_cmd, -self.yaw_max, self.yaw_max)
+        self.approach_yaw = yaw_cmd
+        self.approach_fb = fb_cmd
+        self.approach_lr = lr_cmd
+        self.approach_ud = ud_cmd
+
+    def _pid(self, axis, err, now, dead):
+        """軸 axis の PID。|err| <= dead なら 0（積分は止める）。ステップ応答も記録する"""
+        run = self._approach_run
+        if run is not None and run["steps"]:
+            run["steps"][axis].observe(now, err)
+        scale = gains_at(self.gain_schedule.get(axis), self.approach_dist_m)
+        return self.approach_pid[axis].update(err, now, scale=scale, hold=abs(err) <= dead)
+
+    def _yaw_then_fb_commands(self, now, err_x, size_px):
+        """従来の yaw モード: (fb, yaw)。lr/ud は使わない"""
+        # 1) yawで中央へ
+        yaw_cmd = self._pid("yaw", err_x, now, self.center_dead_px)
         if self.inv_yaw:
             yaw_cmd = -yaw_cmd
 
         # 2) sizeで距離詰め
-        size_err = self.target_size_px - size_px  # +遠い
-        fb_cmd = 0.0
-        if abs(size_err) > self.size_dead_px:
-            fb_cmd = self.k_size_to_fb * size_err
-            fb_cmd = clamp_int(fb_cmd, -self.fb_max, self.fb_max)
-            if fb_cmd > 0:
-                fb_cmd = max(self.fb_min, fb_cmd)
+        fb_cmd = self._fb_from_size(now, size_px)
 
         # 中心がズレてる間は前進弱め
         if abs(err_x) > self.center_dead_px and fb_cmd > 0:
-            fb_cmd = int(fb_cmd * 0.55)
+            fb_cmd = int(fb_cmd * self.offcenter_fb_scale)
 
         # smoothing
         a = self.smooth
@@ -255,15 +702,134 @@ class TelloController:
             self.approach_state = "APPROACH"
         else:
             self.approach_state = "HOLD"
+        return fb_cmd, yaw_cmd
 
-        # ★ここが重要：セミオート時は lr/ud は 0固定、fb/yaw だけ上書き
-        self.lr = 0
-        self.fb = fb_cmd
-        self.ud = 0
-        self.yaw = yaw_cmd
+    def _fb_from_size(self, now, size_px):
+        fb_cmd = self._pid("fb", self.target_size_px - size_px, now, self.size_dead_px)  # +遠い
+        if fb_cmd > 0:
+            fb_cmd = max(self.fb_min, fb_cmd)
+        return fb_cmd
 
-        self.approach_yaw = yaw_cmd
-        self.approach_fb = fb_cmd
+    def _servo_commands(self, now, marker_info, w, h, err_x, size_px):
+        """
+        servo モード: (lr, fb, ud, yaw) を同時に出す。
+          yaw : 横のずれ err_x（yaw モードと同じ）
+          ud  : 縦のずれ err_y
+          lr  : マーカーを斜めから見ている角度（正面へ回り込む）
+          fb  : size（中心から外れるほど弱める）
+        全軸が不感帯に入ったら HOLD
+        """
+        cy = float(marker_info["center"][1])
+        err_y = cy - (h / 2.0)   # +なら下
+        side = marker_side_deg(marker_info["corners"])
+        self.approach_err_y = err_y
+        self.approach_side_deg = side
+
+        yaw_cmd = self._pid("yaw", err_x, now, self.center_dead_px)
+        if self.inv_yaw:
+            yaw_cmd = -yaw_cmd
+        ud_cmd = -self._pid("ud", err_y, now, self.ud_dead_px)
+        lr_cmd = self._pid("lr", side, now, self.side_dead_deg)
+
+        fb_cmd = self._fb_from_size(now, size_px)
+        if fb_cmd > 0:
+            # 見失わないように、中心から外れるほど前進を弱める
+            fb_cmd *= max(0.0, 1.0 - abs(err_x) / (w / 2.0))
+
+        a = self.smooth
+        self._yaw_f = a * self._yaw_f + (1 - a) * yaw_cmd
+        self._fb_f = a * self._fb_f + (1 - a) * fb_cmd
+        self._lr_f = a * self._lr_f + (1 - a) * lr_cmd
+        self._ud_f = a * self._ud_f + (1 - a) * ud_cmd
+
+        hold = (abs(err_x) <= self.center_dead_px and abs(err_y) <= self.ud_dead_px
+                and abs(side) <= self.side_dead_deg
+                and abs(self.target_size_px - size_px) <= self.size_dead_px)
+        self.approach_state = "HOLD" if hold else "SERVO"
+        return (int(round(self._lr_f)), int(round(self._fb_f)),
+                int(round(self._ud_f)), int(round(self._yaw_f)))
+
+    def _track_converge(self, now, hold):
+        """セミオート ON から HOLD が converge_hold_sec 続くまでの時間を測る"""
+        run = self._approach_run
+        if run is None or run["t_converge"] is not None:
+            return
+        if not hold:
+            run["hold_since"] = None
+            return
+        if run["hold_since"] is None:
+            run["hold_since"] = now
+        elif now - run["hold_since"] >= self.converge_hold_sec:
+            run["t_converge"] = run["hold_since"] - run["t_start"]
+            self.approach_converge_sec = run["t_converge"]
+            self.approach_converge.observe(run["t_converge"])
+            print(f"[APPROACH] {run['mode']} converged to HOLD in {run['t_converge']:.2f}s")
+            self._finish_approach_run()
+
+    def _finish_approach_run(self):
+        """収束したとき / セミオートを切ったときに、この回のステップ応答をヒストグラムに入れる"""
+        run = self._approach_run
+        if run is None or not run["steps"]:
+            return
+        results = {}
+        for axis, step in run["steps"].items():
+            r = step.result()
+            if r is None:
+                continue
+            results[axis] = r
+            hist = self.approach_step[axis]
+            hist["overshoot"].observe(r["overshoot"])
+            for k in ("rise", "settle"):
+                if r[k] is not None:
+                    hist[k].observe(r[k])
+        run["steps"] = None
+        if results:
+            self.approach_step_last = results
+            print(f"[APPROACH] {run['mode']} step " + "  ".join(
+                f"{axis} e0:{r['e0']:+.0f} rise:{_sec(r['rise'])} os:{r['overshoot']:.0%} settle:{_sec(r['settle'])}"
+                for axis, r in results.items()))
+
+    def _yaw_shift_px(self, t0, t1, frame_w):
+        """
+        t0〜t1（perf_counter）に送った yaw で機体が回った分、マーカーが画像上で動く量 [px]。
+        右に回る（yaw > 0）とマーカーは左へ動く
+        """
+        entries = list(self._rc_sent_log)
+        deg = 0.0
+        for i, (_, ts, cmd) in enumerate(entries):
+            # 各コマンドは次のコマンドを送るまで効いているとみなす
+            t_next = entries[i + 1][1] if i + 1 < len(entries) else t1
+            a = max(ts, t0)
+            b = min(t_next, t1)
+            if b > a:
+                deg += cmd[3] * (b - a)
+        deg *= self.yaw_deg_per_cmd
+        if self.inv_yaw:
+            deg = -deg
+        f = (frame_w / 2.0) / math.tan(math.radians(self.camera_hfov_deg / 2.0))
+        return -f * math.tan(math.radians(max(-80.0, min(80.0, deg))))
+
+    def get_approach_comp_summary(self):
+        """遅延補償の大きさの1行要約"""
+        age = self.approach_comp["age"].percentiles((50, 99))
+        px = self.approach_comp["shift_px"].percentiles((50, 99))
+        if age[50] is None:
+            return "latency comp: no samples"
+        return (f"latency comp age p50/p99:{age[50] * 1000:.0f}/{age[99] * 1000:.0f}ms  "
+                f"|shift| p50/p99:{px[50]:.0f}/{px[99]:.0f}px")
+
+    def get_approach_step_summary(self):
+        """ステップ応答（セミオート各回）の軸ごとの中央値の1行要約"""
+        parts = []
+        for axis, hist in self.approach_step.items():
+            n = hist["overshoot"].count
+            if not n:
+                continue
+            rise = hist["rise"].percentiles((50,))[50]
+            os_ = hist["overshoot"].percentiles((50,))[50]
+            settle = hist["settle"].percentiles((50,))[50]
+            parts.append(f"{axis} n:{n} rise:{_sec(rise)} os:{os_:.0%} settle:{_sec(settle)}")
+        return "step p50  " + "  ".join(parts) if parts else "step: no samples"
 
     # -----------------------
     # send rc
@@ -276,25 +842,63 @@ class TelloController:
         ud = clamp_int(self.ud, -100, 100)
         yw = clamp_int(self.yaw, -100, 100)
 
-        # debug（0.2秒に1回）
-        if not hasattr(self, "_dbg_t"):
-            self._dbg_t = 0.0
-        now = time.time()
-        if now - self._dbg_t > 0.2:
-            self._dbg_t = now
-            print(f"[RC DBG] lr={lr} fb={fb} ud={ud} yaw={yw}  approach={self.approach_enabled} state={self.approach_state}  err_x={self.approach_err_x} size={self.approach_size_px}")
-
+        self.last_rc = (lr, fb, ud, yw)
+        self.last_command_ts = self.perf_clock()
+        if self.rc_sender is not None:
+            self.last_rc_seq = self.rc_sender.set(self.last_rc)
+            return
+        self.last_rc_seq += 1
         try:
-            self.tello.send_rc_control(lr, fb, ud, yw)
+            self._send_rc(self.last_rc, self.last_rc_seq)
         except Exception as e:
             print("send_rc_control failed:", e)
 
+    def _send_rc(self, cmd, seq):
+        """実際の送信（RcSender のスレッド、またはリプレイ時は update_motion から）"""
+        with span("send_rc_control", "rc"):
+            self.tello.send_rc_control(*cmd)
+        ts = self.perf_clock()
+        self.last_rc_ts = ts
+        self._rc_sent_log.append((seq, ts, cmd))
+
+    def rc_sent_ts(self, seq):
+        """seq 番以降の RC が最初に送られた時刻（まだなら None）"""
+        for s, ts, _ in list(self._rc_sent_log):
+            if s >= seq:
+                return ts
+        return None
+
     def cleanup(self):
+        # 見張りを先に止める（止めたあとのキューに land を積まないように）。
+        # キューは待ち中の land を実行してから、実行中のジョブが終わるまで待って止まる
+        # （ここから下で self.tello を同時に触らないように）
+        if self.watchdog is not None:
+            self.watchdog.stop()
+            print("[WATCHDOG]", self.watchdog.summary())
+        if self.command_queue is not None:
+            if not self.command_queue.stop(timeout=self.cleanup_join_sec):
+                print("[CMD] worker still busy after", self.cleanup_join_sec, "s; continuing cleanup")
+        if self.rc_sender is not None:
+            self.rc_sender.stop()
+            print("[RC]", self.rc_sender.summary())
+        if self.link_stats.commands:
+            print("[LINK]", self.get_link_summary())
+        if self.approach_comp["age"].count:
+            print("[APPROACH]", self.get_approach_comp_summary())
+        if any(h["overshoot"].count for h in self.approach_step.values()):
+            print("[APPROACH]", self.get_approach_step_summary())
+        if self.frame_read is not None:
+            self.frame_read.stop()
+        self.estimator.stop()
+        if self.telemetry_bus is not None:
+            self.telemetry_bus.stop()
         try:
             self.tello.streamoff()
         except Exception:
             pass
-        if self.in_flight:
+        # in_flight は request_land() の時点で False になるので、実際に飛んでいるかで決める
+        q = self.command_queue
+        if getattr(self.tello, "is_flying", False) or (q is not None and q.pending("land")):
             try:
                 self.tello.land()
             except Exception:
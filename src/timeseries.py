@@ -0,0 +1,150 @@
+# timeseries.py
+import warnings
+
+import numpy as np
+
+
+# テレメトリ（state パケットごと）
+TELEMETRY_CHANNELS = (
+    "pitch", "roll", "yaw", "h",
+    "vgx", "vgy", "vgz",
+    "agx", "agy", "agz",
+    "bat", "temp",
+)
+
+# メインループごと（RC と検出）
+LOOP_CHANNELS = (
+    "rc_lr", "rc_fb", "rc_ud", "rc_yaw",
+    "det_n", "det_size_px", "det_err_x",
+)
+
+
+class RingSeries:
+    """
+    固定容量・列指向のリングバッファ（NumPy）。
+
+    各サンプルを i と i+capacity の2か所に書く（ミラー）ので、
+    直近 n 個（n <= capacity）は常に連続領域になり、window() はコピー無しの view を返せる。
+    append は O(1)。時刻は単調増加の前提（searchsorted で秒指定の窓を切る）。
+
+      s = RingSeries(("h", "bat"), capacity=4096)
+      s.append(t, (h, bat))
+      t, h = s.last_seconds(10.0, "h")
+    """
+
+    def __init__(self, channels, capacity=4096, dtype=np.float64):
+        self.channels = tuple(channels)
+        self.index = {name: i + 1 for i, name in enumerate(self.channels)}  # 0 は時刻
+        self.capacity = int(capacity)
+        # 行 = 列（t, ch0, ch1, ...）、横方向に 2*capacity
+        self._data = np.full((1 + len(self.channels), 2 * self.capacity), np.nan, dtype=dtype)
+        self._head = 0     # 次に書く位置（0..capacity-1）
+        self.count = 0     # 累積サンプル数
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, t, values):
+        """values はチャンネル順のシーケンス（None は NaN）"""
+        col = self._data[:, self._head]
+        col[0] = t
+        for i, v in enumerate(values, 1):
+            col[i] = np.nan if v is None else v
+        self._data[:, self._head + self.capacity] = col
+        self._head += 1
+        if self._head == self.capacity:
+            self._head = 0
+        self.count += 1
+
+    def append_dict(self, t, values):
+        self.append(t, [values.get(name) for name in self.channels])
+
+    # -----------------------
+    # views
+    # -----------------------
+    def window(self, n=None):
+        """直近 n サンプルの (1+ch, n) view（0 行目が時刻）。コピーしない"""
+        size = len(self)
+        n = size if n is None else max(0, min(int(n), size))
+        end = self._head + self.capacity
+        return self._data[:, end - n:end]
+
+    def times(self, n=None):
+        return self.window(n)[0]
+
+    def column(self, name, n=None):
+        return self.window(n)[self.index[name]]
+
+    def last_seconds(self, seconds, name=None):
+        """
+        直近 seconds 秒の (t, values) view。
+        name が None なら values は全チャンネル (ch, n)。
+        """
+        w = self.window()
+        if w.shape[1] == 0:
+            return w[0], (w[1:] if name is None else w[self.index[name]])
+        t = w[0]
+        start = int(np.searchsorted(t, t[-1] - seconds, side="left"))
+        w = w[:, start:]
+        return w[0], (w[1:] if name is None else w[self.index[name]])
+
+    def latest(self, name):
+        if self.count == 0:
+            return None
+        return float(self._data[self.index[name], self._head + self.capacity - 1])
+
+    # -----------------------
+    # display
+    # -----------------------
+    def minmax(self, name, bins, seconds=None):
+        """
+        表示用の間引き：bins 個の区間ごとに (t_中央, min, max)。
+        区間に入りきらない古い端数は捨てる。NaN は無視（全部 NaN の区間は NaN）。
+        """
+        if seconds is None:
+            t, v = self.window()[0], self.column(name)
+        else:
+            t, v = self.last_seconds(seconds, name)
+        n = v.shape[0]
+        bins = int(max(1, min(bins, n)))
+        if n == 0:
+            empty = np.empty(0)
+            return empty, empty, empty
+        per = n // bins
+        used = per * bins
+        vv = v[n - used:].reshape(bins, per)
+        tt = t[n - used:].reshape(bins, per)
+        with warnings.catch_warnings():
+            # 全部 NaN の区間で出る "All-NaN slice" は想定内
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mn = np.nanmin(vv, axis=1)
+            mx = np.nanmax(vv, axis=1)
+        return tt[:, per // 2], mn, mx
+
+
+class FlightHistory:
+    """
+    1フライト分の履歴。
+      telemetry : state パケットごと（TELEMETRY_CHANNELS）
+      loop      : メインループごと（LOOP_CHANNELS）
+    10Hz の state で 4096 件 ≒ 7 分、30fps のループで 16384 件 ≒ 9 分。
+    """
+
+    def __init__(self, telemetry_capacity=4096, loop_capacity=16384):
+        self.telemetry = RingSeries(TELEMETRY_CHANNELS, telemetry_capacity)
+        self.loop = RingSeries(LOOP_CHANNELS, loop_capacity)
+        self._last_tm_ts = None
+
+    def add_telemetry(self, tm):
+        """TelemetrySnapshot を1件追加（同じパケットの2重追加は無視）"""
+        if tm is None or tm.ts == self._last_tm_ts:
+            return
+        self._last_tm_ts = tm.ts
+        self.telemetry.append(tm.ts, [getattr(tm, name) for name in TELEMETRY_CHANNELS])
+
+    def add_loop(self, t, rc=None, marker_info=None, det_n=0, err_x=None):
+        lr = fb = ud = yw = None
+        if rc is not None:
+            lr, fb, ud, yw = rc
+        size = None if marker_info is None else marker_info.get("size_px")
+        self.loop.append(t, (lr, fb, ud, yw, det_n, size, err_x))
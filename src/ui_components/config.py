@@ -27,6 +27,12 @@ HUD_WIFI_BOTTOM_INSET = 14
 HUD_WIFI_SCALE = 0.60
 HUD_WIFI_ALPHA = 0.14
 
+# wifi の上に出す映像ストリームの計測ブロック（DroneUI.stream_health_enabled）
+HUD_HEALTH_RIGHT_INSET = 230
+HUD_HEALTH_LINE_GAP = 26
+HUD_HEALTH_SCALE = 0.50
+HUD_HEALTH_ALPHA = 0.14
+
 HUD_CMD_X = 14
 HUD_CMD_BOTTOM_INSET = 22
 HUD_CMD_PAD = 10
@@ -9,6 +9,7 @@ from .config import (
     HUD_SN_X, HUD_SN_Y, HUD_SN_SCALE, HUD_SN_ALPHA,
     HUD_TOP_RIGHT_PAD_X, HUD_TOP_Y, HUD_TOP_PAD, HUD_TOP_SCALE, HUD_TOP_ALPHA,
     HUD_WIFI_RIGHT_INSET, HUD_WIFI_BOTTOM_INSET, HUD_WIFI_SCALE, HUD_WIFI_ALPHA,
+    HUD_HEALTH_RIGHT_INSET, HUD_HEALTH_LINE_GAP, HUD_HEALTH_SCALE, HUD_HEALTH_ALPHA,
     HUD_CMD_X, HUD_CMD_BOTTOM_INSET, HUD_CMD_PAD, HUD_CMD_SCALE, HUD_CMD_ALPHA,
     PANEL_COLS, PANEL_ROWS,
     PANEL_MARGIN, GAUGE_GAP_X, GAUGE_GAP_Y,
@@ -37,12 +38,35 @@ def _calc_s(w: int) -> float:
     return max(S_MIN, min(S_MAX, float(w) / S_BASE_W))
 
 
+def _ms(v):
+    return "--" if v is None else f"{float(v) * 1000:.0f}"
+
+
+def _stream_health_lines(h):
+    """TelloController.get_stream_health() の dict → HUD 用の文字列（下から上の順）"""
+    ia = h.get("interarrival") or {}
+    age = h.get("age") or {}
+    return [
+        f"gap p50/p99:{_ms(ia.get('p50'))}/{_ms(ia.get('p99'))}ms  age p50/p99:{_ms(age.get('p50'))}/{_ms(age.get('p99'))}ms",
+        f"vid fps:{h.get('fps', 0):.1f}  age:{_ms(h.get('frame_age'))}ms  dup:{h.get('duplicates', 0)}"
+        f"  drop:{h.get('dropped', 0)}  err:{h.get('decode_errors', 0)}  rst:{h.get('restarts', 0)}"
+        f"  alloc:{h.get('allocations', 0)}",
+    ]
+
+
 class DroneUI:
     def __init__(self, panel_width: int = 260, bottom_margin: int = 60, text_scale: float = 1.05):
         self.panel_width = panel_width
         self.bottom_margin = bottom_margin
         self.text_scale = text_scale
 
+        # 映像ストリームの計測ブロック（wifi の上）。main.py の [V] で切り替え
+        self.stream_health_enabled = False
+        # 通信リンクの計測の1行（その上）。main.py の [N] で切り替え
+        self.link_stats_enabled = False
+        # フレーム受信 → RC 送信の遅延の1行。main.py の [L] で切り替え
+        self.latency_enabled = False
+
         self.crosshair_enabled = True
         self.crosshair_y_offset = 0   # +で下、-で上（px）
         self.crosshair_size = 12      # 十字の半径（px）
@@ -83,6 +107,10 @@ class DroneUI:
         flight_time=None,
         wifi=None,
         commands=None,
+        stream_health=None,
+        link_stats=None,
+        latency=None,
+        jobs=None,
 
         approach_enabled=False,
         approach_state=None,
@@ -90,6 +118,12 @@ class DroneUI:
         approach_yaw=None,
         approach_err_x=None,
         approach_size_px=None,
+        approach_age=None,
+        approach_comp_px=None,
+        approach_mode=None,
+        approach_lr=None,
+        approach_ud=None,
+        approach_converge_sec=None,
     ):
         h, w, _ = canvas.shape
         s = _calc_s(w)
@@ -119,6 +153,17 @@ class DroneUI:
         sz = "--" if approach_size_px is None else f"{float(approach_size_px):.0f}px"
 
         approach_text = f"APPROACH:{a_on}  state:{st}  fwd:{vx}  yaw:{yw}  err_x:{ex}  size:{sz}"
+        # 4軸サーボのときは左右・上下も出す
+        if approach_mode == "servo":
+            lr = "--" if approach_lr is None else str(int(approach_lr))
+            ud = "--" if approach_ud is None else str(int(approach_ud))
+            approach_text = approach_text.replace("APPROACH:", "APPROACH(servo):", 1) + f"  lr:{lr}  ud:{ud}"
+        if approach_converge_sec is not None:
+            approach_text += f"  hold:{approach_converge_sec:.1f}s"
+        # 遅延補償（フレームの古さと err_x に足した量）
+        if approach_age is not None:
+            comp = "--" if approach_comp_px is None else f"{float(approach_comp_px):+.0f}px"
+            approach_text += f"  age:{approach_age * 1000:.0f}ms comp:{comp}"
         boxed_text(
             canvas,
             approach_text,
@@ -132,6 +177,21 @@ class DroneUI:
             alpha=HUD_SN_ALPHA,
         )
 
+        # コマンドキューの進み具合（実行中・待ち中・終わったばかりのものがあるときだけ）
+        if jobs:
+            boxed_text(
+                canvas,
+                "CMD: " + "  ".join(jobs),
+                int(HUD_SN_X * s),
+                int((HUD_SN_Y + 56) * s),
+                HUD_SN_SCALE * s * ts * 0.92,
+                TEXT,
+                pad=6,
+                thickness=1,
+                outline=2,
+                alpha=HUD_SN_ALPHA,
+            )
+
         # 右上 TEMP/time
         ttemp = "--" if temp is None else str(int(temp))
         ttime = "--" if flight_time is None else str(int(flight_time))
@@ -165,6 +225,34 @@ class DroneUI:
             alpha=HUD_WIFI_ALPHA,
         )
 
+        # wifi の上 映像ストリーム / 通信リンクの計測値（下から積む）
+        health_lines = []
+        if self.stream_health_enabled and stream_health:
+            health_lines += _stream_health_lines(stream_health)
+        if self.link_stats_enabled and link_stats:
+            health_lines.append("link " + link_stats)
+        if self.latency_enabled and latency:
+            health_lines.append(latency)
+        if health_lines:
+            y = h - HUD_WIFI_BOTTOM_INSET * s
+            for line in health_lines:
+                y -= HUD_HEALTH_LINE_GAP * s
+                (tw, _), _ = cv2.getTextSize(line, cv2.FONT_HERSHEY_SIMPLEX, HUD_HEALTH_SCALE * s * ts, 1)
+                # 右端からはみ出すなら左へ寄せる
+                x = min(int(w - HUD_HEALTH_RIGHT_INSET * s), int(w - tw - 12 * s))
+                boxed_text(
+                    canvas,
+                    line,
+                    max(6, x),
+                    int(y),
+                    HUD_HEALTH_SCALE * s * ts,
+                    TEXT,
+                    pad=5,
+                    thickness=1,
+                    outline=2,
+                    alpha=HUD_HEALTH_ALPHA,
+                )
+
         # 左下 コマンド
         if commands is None:
             commands = "[T]takeoff  [G]land  [W/A/S/D]move  [R/F]up/down  [E/Q]yaw  [Z]quit"
@@ -219,6 +307,7 @@ class DroneUI:
         speed=None,
         pos_xy=None,
         pos_range=3.0,
+        pos_std=None,
     ):
         h, w, _ = canvas.shape
         s = _calc_s(w)
@@ -327,6 +416,7 @@ class DroneUI:
             max_range=pos_range_arg,
             yaw_deg=yaw,
             label=pos_label,
+            pos_std=pos_std,
         )
 
         # ===== バーラベル（改行）=====
@@ -405,6 +495,10 @@ class DroneUI:
             flight_time=flight_time,
             wifi=wifi,
             commands=commands,
+            stream_health=kwargs.get("stream_health"),
+            link_stats=kwargs.get("link_stats"),
+            latency=kwargs.get("latency"),
+            jobs=kwargs.get("jobs"),
 
             approach_enabled=kwargs.get("approach_enabled", False),
             approach_state=kwargs.get("approach_state"),
@@ -412,6 +506,12 @@ class DroneUI:
             approach_yaw=kwargs.get("approach_yaw"),
             approach_err_x=kwargs.get("approach_err_x"),
             approach_size_px=kwargs.get("approach_size_px"),
+            approach_age=kwargs.get("approach_age"),
+            approach_comp_px=kwargs.get("approach_comp_px"),
+            approach_mode=kwargs.get("approach_mode"),
+            approach_lr=kwargs.get("approach_lr"),
+            approach_ud=kwargs.get("approach_ud"),
+            approach_converge_sec=kwargs.get("approach_converge_sec"),
         )
 
         ui_w = w if ui_width is None else int(ui_width)
@@ -429,6 +529,7 @@ class DroneUI:
             speed=speed,
             pos_xy=pos_xy,
             pos_range=pos_range,
+            pos_std=kwargs.get("pos_std"),
         )
 
         return np.hstack([left, panel])
@@ -31,8 +31,13 @@ def compose_side(
         frame = np.zeros((display_h, left_w, 3), dtype=np.uint8)
     else:
         # 左映像をウィンドウの左領域にぴったり合わせる
+        # （毎フレーム確保しないように ui 側に持たせたバッファへ resize する）
         if frame.shape[0] != display_h or frame.shape[1] != left_w:
-            frame = cv2.resize(frame, (left_w, display_h), interpolation=interpolation)
+            buf = getattr(ui, "_resize_buf", None)
+            if buf is None or buf.shape != (display_h, left_w, 3) or buf.dtype != frame.dtype:
+                buf = np.empty((display_h, left_w, 3), dtype=frame.dtype)
+                ui._resize_buf = buf
+            frame = cv2.resize(frame, (left_w, display_h), dst=buf, interpolation=interpolation)
 
     # UIは右に固定幅で合体（ui.draw が hstack してくれる）
     out = ui.draw(
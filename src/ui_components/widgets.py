@@ -167,8 +167,12 @@ def draw_position_map(
     yaw_deg=None,
     alpha=0.16,
     label=None,
+    pos_std=None,
 ):
-    """シンプルな位置インジケーター。Xは左右、Yは上から下方向に進む。"""
+    """
+    シンプルな位置インジケーター。Xは左右、Yは上から下方向に進む。
+    pos_std=(sx, sy) を渡すと推定の 1σ を楕円で描く。
+    """
     blend_rect(img, x, y, x + w, y + h, alpha=alpha)
     cv2.rectangle(img, (x, y), (x + w, y + h), BAR_BORDER, 1, cv2.LINE_AA)
 
@@ -212,6 +216,15 @@ def draw_position_map(
     dot_x = int(cx + px * scale_x)
     dot_y = int(top + py * scale_y)
 
+    if pos_std is not None:
+        try:
+            ax = int(min(w, float(pos_std[0]) * scale_x))
+            ay = int(min(h, float(pos_std[1]) * scale_y))
+            if ax > 7 or ay > 7:
+                cv2.ellipse(img, (dot_x, dot_y), (max(ax, 1), max(ay, 1)), 0, 0, 360, TICK, 1, cv2.LINE_AA)
+        except Exception:
+            pass
+
     cv2.circle(img, (dot_x, dot_y), 5, PURPLE, -1, cv2.LINE_AA)
     cv2.circle(img, (dot_x, dot_y), 7, OUTLINE, 1, cv2.LINE_AA)
     if yaw_deg is not None:
@@ -0,0 +1,258 @@
+# video_stream.py
+import threading
+import time
+
+import av
+import cv2
+import numpy as np
+
+from frame_pool import FramePool
+from perf_stats import Histogram, RateMeter
+from profiler import span
+
+
+def _copy_plane(plane, dst):
+    """PyAV の plane（行パディングあり）を dst にコピー。新しい配列は作らない"""
+    src = np.frombuffer(plane, dtype=np.uint8).reshape(-1, plane.line_size)
+    np.copyto(dst, src[: dst.shape[0], : dst.shape[1]])
+
+
+class VideoStream:
+    """
+    djitellopy の BackgroundFrameRead の代わり。
+    PyAV で H.264 をデコードし、最新フレームに「連番・受信時刻」を付けて保持する。
+
+    main.py からは今まで通り .frame で最新フレーム（BGR）を取れる。
+    read() を使うと (frame, seq, ts) が取れて、同じフレームを2回処理したかどうかが分かる。
+
+    フレームは FramePool の使い回しバッファに YUV420 → BGR で直接変換する
+    （cv2.cvtColor の dst 指定）。steady state ではフレームごとの配列確保はゼロ。
+    acquire() で借りた PooledFrame は使い終わったら release() すること。
+
+    統計（StreamGovernor / HUD が使う）:
+      decoded       : デコードしたフレーム数
+      consumed      : read() で初めて取り出されたフレーム数
+      dropped       : 取り出される前に次のフレームで上書きされた数
+      duplicates    : read() が前回と同じフレームを返した回数
+      decode_errors : 壊れたパケット等でデコードに失敗した数
+      restarts      : コンテナを開き直した回数（最初の open は含まない）
+      interarrival  : デコード完了間隔のヒストグラム [s]
+      age           : read() 時点でのフレームの古さのヒストグラム [s]
+      allocations   : 取り込み経路でフル解像度の配列を確保した回数（プール + YUV 作業領域）
+
+    PooledFrame には ts（公開時刻）のほかに capture_ts（パケット受信）/ decode_ts（デコード完了）
+    も入れる（latency_trace.py 用）。
+    """
+
+    def __init__(self, address, open_timeout=5.0, read_timeout=2.0, clock=time.perf_counter, pool_size=4):
+        self.address = address
+        self.open_timeout = open_timeout
+        # 開いたあとにパケットがこれだけ来なければ demux が例外を出す → 開き直す
+        # （None だとストリームが黙ったときに demux が戻らず、開き直しに進めない）
+        self.read_timeout = read_timeout
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pool_size = pool_size
+        self._yuv = None
+        self._yuv_allocs = 0
+        self._fallback_allocs = 0
+
+        self._latest = None   # PooledFrame（ストリーム自身が1参照持つ）
+        self._seq = 0
+        self._ts = 0.0
+        self._read_seq = 0
+
+        self.decoded = 0
+        self.consumed = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.decode_errors = 0
+        self.restarts = 0
+
+        self.interarrival = Histogram()
+        self.age = Histogram()
+        self.decode_rate = RateMeter(window_sec=1.0, clock=clock)
+
+        self.stopped = False
+        # 最初の open は呼び出し側で失敗が分かるようにここで行う
+        self.container = av.open(self.address, timeout=(self.open_timeout, self.read_timeout))
+        self.worker = threading.Thread(target=self._run, name="video-decode", daemon=True)
+
+    def start(self):
+        self.worker.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+
+    # -----------------------
+    # decoder thread
+    # -----------------------
+    def _run(self):
+        while not self.stopped:
+            if self.container is None:
+                try:
+                    self.container = av.open(self.address, timeout=(self.open_timeout, self.read_timeout))
+                    self.restarts += 1
+                except Exception:
+                    self.decode_errors += 1
+                    time.sleep(0.5)
+                    continue
+
+            try:
+                for packet in self.container.demux(video=0):
+                    if self.stopped:
+                        break
+                    t_packet = self.clock()
+                    try:
+                        with span("decode", "video"):
+                            frames = packet.decode()
+                    except av.error.InvalidDataError:
+                        # 欠けたパケット（WiFi ロス）はここに来る。次のキーフレームまで続行
+                        self.decode_errors += 1
+                        continue
+                    t_decoded = self.clock()
+                    for f in frames:
+                        with span("convert", "video"):
+                            pf = self._convert(f)
+                        if pf is None:
+                            # 使用中バッファだらけ（消費側が握りっぱなし）→ このフレームは捨てる
+                            with self.lock:
+                                self.dropped += 1
+                            continue
+                        pf.capture_ts = t_packet
+                        pf.decode_ts = t_decoded
+                        self._publish(pf)
+            except Exception:
+                # ストリームが切れた/壊れた → 開き直す
+                self.decode_errors += 1
+            finally:
+                try:
+                    self.container.close()
+                except Exception:
+                    pass
+                self.container = None
+
+    def _convert(self, f):
+        """av.VideoFrame → プールのバッファ（BGR）"""
+        w, h = f.width, f.height
+        if self.pool is None:
+            self.pool = FramePool((h, w, 3), size=self.pool_size)
+        elif self.pool.shape != (h, w, 3):
+            self.pool.reshape((h, w, 3))
+
+        pf = self.pool.acquire()
+        if pf is None:
+            return None
+
+        if f.format.name in ("yuv420p", "yuvj420p") and w % 2 == 0 and h % 2 == 0:
+            # I420 を1枚の連続バッファに詰めてから cvtColor(dst=...) で BGR に
+            if self._yuv is None or self._yuv.shape != (h * 3 // 2, w):
+                self._yuv = np.empty((h * 3 // 2, w), dtype=np.uint8)
+                self._yuv_allocs += 1
+            flat = self._yuv.reshape(-1)
+            q = (h // 2) * (w // 2)
+            _copy_plane(f.planes[0], self._yuv[:h])
+            _copy_plane(f.planes[1], flat[h * w: h * w + q].reshape(h // 2, w // 2))
+            _copy_plane(f.planes[2], flat[h * w + q: h * w + 2 * q].reshape(h // 2, w // 2))
+            cv2.cvtColor(self._yuv, cv2.COLOR_YUV2BGR_I420, dst=pf.array)
+        else:
+            # 想定外のピクセルフォーマット（毎回1枚確保する遅い経路）
+            np.copyto(pf.array, f.to_ndarray(format="bgr24"))
+            self._fallback_allocs += 1
+        return pf
+
+    @property
+    def allocations(self):
+        pool_allocs = self.pool.allocations if self.pool is not None else 0
+        return pool_allocs + self._yuv_allocs + self._fallback_allocs
+
+    def _publish(self, pf):
+        ts = self.clock()
+        with self.lock:
+            prev = self._latest
+            prev_ts = self._ts
+            # 前のフレームが読まれないまま上書き → ドロップ
+            if self._seq > self._read_seq:
+                self.dropped += 1
+            self._seq += 1
+            self._ts = ts
+            pf.seq = self._seq
+            pf.ts = ts
+            self._latest = pf
+            self.decoded += 1
+        if prev is not None:
+            prev.release()
+        if prev_ts > 0:
+            self.interarrival.observe(ts - prev_ts)
+        self.decode_rate.mark(ts)
+
+    # -----------------------
+    # consumer
+    # -----------------------
+    def acquire(self):
+        """
+        最新フレームを PooledFrame で借りる（無ければ None）。
+        使い終わったら必ず release() する。借りている間は上書きされない。
+        """
+        now = self.clock()
+        with self.lock:
+            pf = self._latest
+            if pf is None:
+                return None
+            pf.retain()
+            if pf.seq > self._read_seq:
+                self.consumed += 1
+                self._read_seq = pf.seq
+            else:
+                self.duplicates += 1
+        self.age.observe(now - pf.ts)
+        return pf
+
+    def read(self):
+        """
+        最新フレームを (frame, seq, ts) で返す。まだ無ければ (None, 0, 0.0)
+        ※ 返す配列はプールのバッファなので、長く持つなら acquire() を使う。
+        """
+        pf = self.acquire()
+        if pf is None:
+            return None, 0, 0.0
+        frame, seq, ts = pf.array, pf.seq, pf.ts
+        pf.release()
+        return frame, seq, ts
+
+    @property
+    def frame(self):
+        return self.read()[0]
+
+    @property
+    def last_frame_ts(self):
+        with self.lock:
+            return self._ts
+
+    def counters(self):
+        """(decoded, consumed, dropped) を一貫した値で返す"""
+        with self.lock:
+            return self.decoded, self.consumed, self.dropped
+
+    def health(self):
+        """ストリームの健康状態をまとめた dict（HUD/ログ用）"""
+        now = self.clock()
+        with self.lock:
+            ts = self._ts
+            c = {
+                "decoded": self.decoded,
+                "consumed": self.consumed,
+                "dropped": self.dropped,
+                "duplicates": self.duplicates,
+            }
+        c["decode_errors"] = self.decode_errors
+        c["restarts"] = self.restarts
+        c["allocations"] = self.allocations
+        c["fps"] = self.decode_rate.rate(now)
+        c["frame_age"] = (now - ts) if ts > 0 else None
+        c["interarrival"] = self.interarrival.snapshot()
+        c["age"] = self.age.snapshot()
+        return c